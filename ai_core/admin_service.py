@@ -3,11 +3,17 @@ Admin Service per la gestione dei feature flags
 """
 import sqlite3
 import json
+import logging
 from typing import List, Dict, Optional
 from datetime import datetime
 from fastapi import HTTPException
 from pydantic import BaseModel
 
+from db_pool import get_connection
+from auth_service import auth_service
+
+logger = logging.getLogger(__name__)
+
 
 class AdminUser(BaseModel):
     id: int
@@ -60,7 +66,7 @@ class AdminService:
 
     def _init_admin_tables(self):
         """Inizializza le tabelle admin se non esistono"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             
             # Aggiungi colonna is_admin alla tabella users se non esiste
@@ -82,7 +88,7 @@ class AdminService:
 
     def is_admin(self, user_id: int) -> bool:
         """Verifica se un utente è admin"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT is_admin FROM users WHERE id = ?", (user_id,))
             result = cursor.fetchone()
@@ -90,7 +96,7 @@ class AdminService:
 
     def get_all_feature_flags(self) -> List[FeatureFlagAdmin]:
         """Ottieni tutti i feature flags per l'admin"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT id, flag_key, name, description, is_enabled, 
@@ -117,7 +123,7 @@ class AdminService:
 
     def update_feature_flag(self, flag_id: int, update_data: FeatureFlagUpdate) -> bool:
         """Aggiorna un feature flag"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             
             # Costruisci la query di update dinamicamente
@@ -158,7 +164,7 @@ class AdminService:
 
     def get_all_users(self) -> List[AdminUser]:
         """Ottieni tutti gli utenti per l'admin"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT id, email, is_admin, subscription_tier
@@ -177,9 +183,36 @@ class AdminService:
             
             return users
 
+    async def suspend_user(self, user_id: int, reason: str, admin_id: int) -> bool:
+        """Sospendi un utente (is_active = 0)"""
+        updated = self._set_user_active(user_id, False)
+        if updated:
+            logger.info(f"🚫 Utente {user_id} sospeso da admin {admin_id}: {reason}")
+        # L'utente in cache non deve restare attivo
+        auth_service.invalidate_user(user_id)
+        return updated
+
+    async def unsuspend_user(self, user_id: int, admin_id: int) -> bool:
+        """Riattiva un utente sospeso"""
+        updated = self._set_user_active(user_id, True)
+        if updated:
+            logger.info(f"✅ Utente {user_id} riattivato da admin {admin_id}")
+        # L'utente in cache non deve restare sospeso
+        auth_service.invalidate_user(user_id)
+        return updated
+
+    def _set_user_active(self, user_id: int, is_active: bool) -> bool:
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET is_active = ?, updated_at = ? WHERE id = ?",
+                (is_active, datetime.now().isoformat(), user_id)
+            )
+            return cursor.rowcount > 0
+
     def get_user_overrides(self, user_id: Optional[int] = None) -> List[UserOverride]:
         """Ottieni gli override degli utenti"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             
             if user_id:
@@ -216,7 +249,7 @@ class AdminService:
 
     def create_user_override(self, override_data: UserOverrideCreate) -> bool:
         """Crea un override per un utente"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             
             try:
@@ -238,14 +271,14 @@ class AdminService:
 
     def delete_user_override(self, override_id: int) -> bool:
         """Elimina un override utente"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM user_feature_overrides WHERE id = ?", (override_id,))
             return cursor.rowcount > 0
 
     def get_admin_stats(self) -> Dict:
         """Ottieni statistiche per l'admin dashboard"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_connection(self.db_path) as conn:
             cursor = conn.cursor()
             
             # Conta feature flags
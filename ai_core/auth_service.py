@@ -5,14 +5,17 @@ Sistema di autenticazione, gestione utenti e abbonamenti
 """
 
 import os
-import sqlite3
+import time
 import hashlib
 import secrets
+import threading
+import json
 import jwt
 import stripe
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, replace
 from enum import Enum
 import logging
 from fastapi import HTTPException, Depends, status
@@ -20,6 +23,11 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import bcrypt
 import uuid
 
+from db_pool import get_connection
+from usage_counter import UsageAggregator
+from cpu_pool import password_pool, CPUPoolBusy
+from setup_subscription_plans import PLAN_VERSION_SCHEMA
+
 logger = logging.getLogger(__name__)
 
 # Configurazione Stripe
@@ -30,6 +38,13 @@ JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-here")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Cache utenti autenticati
+USER_CACHE_TTL_SECONDS = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "10000"))
+
+# Ogni quanto verificare la versione dei piani (modifiche da altri processi)
+PLAN_VERSION_CHECK_SECONDS = float(os.getenv("SUBSCRIPTION_PLANS_CHECK_SECONDS", "5"))
+
 security = HTTPBearer()
 
 
@@ -67,22 +82,97 @@ class SubscriptionLimits:
     features: Dict[str, Any]
 
 
+class UserCache:
+    """Cache LRU con TTL degli utenti autenticati, indicizzata per user_id
+    
+    Va invalidata esplicitamente quando cambiano stato, tier o credenziali
+    di un utente; il TTL limita la durata di dati non aggiornati negli altri
+    worker.
+    """
+    
+    def __init__(self, max_entries: int = USER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, User]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+    
+    def get(self, user_id) -> Optional[User]:
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        
+        # Copia: i chiamanti possono modificare l'oggetto User
+        return replace(entry[1])
+    
+    def put(self, user_id, user: User):
+        key = str(user_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, replace(user))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(str(user_id), None) is not None:
+                self.stats["invalidations"] += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._entries), "ttl_seconds": self.ttl_seconds}
+
+
 class AuthService:
     """Servizio di autenticazione e gestione utenti"""
     
     def __init__(self, db_path: str = "database/creative_muse.db"):
         self.db_path = db_path
+        self.user_cache = UserCache()
+        
+        # Tabella tier -> limiti in memoria
+        self._plan_limits: Dict[str, SubscriptionLimits] = {}
+        self._plan_version: Optional[int] = None
+        self._plan_checked_at = 0.0
+        self._plan_lock = threading.Lock()
+        
         self._init_database()
+        self.reload_subscription_limits()
+        
+        # Contatori di utilizzo in memoria (write-behind su user_usage)
+        self.usage = UsageAggregator(db_path)
+    
+    def shutdown(self):
+        """Scrive gli incrementi di utilizzo in sospeso"""
+        self.usage.close()
+    
+    def invalidate_user(self, user_id):
+        """Rimuove un utente dalla cache (sospensione, cambio tier, reset password)"""
+        self.user_cache.invalidate(user_id)
     
     def _init_database(self):
         """Inizializza le tabelle del database se non esistono"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 # Il database è già stato inizializzato con setup_subscription_plans.py
                 # Verifica solo che le tabelle esistano
                 cursor = conn.cursor()
                 cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='subscription_plans'")
                 if cursor.fetchone():
+                    for statement in PLAN_VERSION_SCHEMA:
+                        cursor.execute(statement)
                     logger.info("✅ Database subscription schema già presente")
                 else:
                     logger.warning("⚠️ Tabelle subscription non trovate, usa setup_subscription_plans.py")
@@ -100,6 +190,26 @@ class AuthService:
         """Verifica password contro hash"""
         return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
     
+    async def _hash_password_async(self, password: str) -> tuple[str, str]:
+        """Hash della password nel pool CPU (non blocca l'event loop)"""
+        try:
+            return await password_pool.run(self._hash_password, password)
+        except CPUPoolBusy:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servizio temporaneamente sovraccarico, riprova tra poco"
+            )
+    
+    async def _verify_password_async(self, password: str, hashed: str) -> bool:
+        """Verifica password nel pool CPU (non blocca l'event loop)"""
+        try:
+            return await password_pool.run(self._verify_password, password, hashed)
+        except CPUPoolBusy:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servizio temporaneamente sovraccarico, riprova tra poco"
+            )
+    
     def _generate_jwt_token(self, user_id: str, email: str) -> str:
         """Genera JWT token per l'utente"""
         payload = {
@@ -132,7 +242,7 @@ class AuthService:
                           last_name: Optional[str] = None) -> Dict[str, Any]:
         """Registra un nuovo utente"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Verifica se email già esiste
@@ -152,8 +262,12 @@ class AuthService:
                             detail="Username già in uso"
                         )
                 
-                # Hash password
-                password_hash, salt = self._hash_password(password)
+            # Hash password fuori dalla transazione: la connessione del pool
+            # è condivisa dalle coroutine del thread dell'event loop
+            password_hash, salt = await self._hash_password_async(password)
+            
+            with get_connection(self.db_path) as conn:
+                cursor = conn.cursor()
                 user_uuid = str(uuid.uuid4())
                 user_id = str(uuid.uuid4())  # Generate unique ID for TEXT PRIMARY KEY
                 
@@ -185,6 +299,7 @@ class AuthService:
                 """, (user_id,))
                 
                 conn.commit()
+                self.invalidate_user(user_id)
                 
                 # Genera token JWT
                 token = self._generate_jwt_token(user_id, email)
@@ -211,7 +326,7 @@ class AuthService:
     async def login_user(self, email: str, password: str) -> Dict[str, Any]:
         """Autentica un utente"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Trova utente per email (query semplificata senza JOIN)
@@ -229,22 +344,25 @@ class AuthService:
                         detail="Credenziali non valide"
                     )
                 
-                user_id, user_uuid, user_email, username, password_hash, \
-                first_name, last_name, is_active, email_verified, subscription_tier = user_data
-                
-                # Verifica password
-                if not self._verify_password(password, password_hash):
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Credenziali non valide"
-                    )
-                
-                # Verifica se account è attivo
-                if not is_active:
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Account disattivato"
-                    )
+            user_id, user_uuid, user_email, username, password_hash, \
+            first_name, last_name, is_active, email_verified, subscription_tier = user_data
+            
+            # Verifica password (nel pool CPU, fuori dalla transazione)
+            if not await self._verify_password_async(password, password_hash):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Credenziali non valide"
+                )
+            
+            # Verifica se account è attivo
+            if not is_active:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Account disattivato"
+                )
+            
+            with get_connection(self.db_path) as conn:
+                cursor = conn.cursor()
                 
                 # Aggiorna ultimo login
                 cursor.execute("""
@@ -254,6 +372,7 @@ class AuthService:
                 """, (user_id,))
                 
                 conn.commit()
+                self.invalidate_user(user_id)
                 
                 # Genera token JWT
                 token = self._generate_jwt_token(user_id, email)
@@ -288,7 +407,11 @@ class AuthService:
             payload = self._verify_jwt_token(token)
             user_id = payload.get("user_id")
             
-            with sqlite3.connect(self.db_path) as conn:
+            user = self.user_cache.get(user_id)
+            if user is not None:
+                return user
+            
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -306,7 +429,7 @@ class AuthService:
                         detail="Utente non trovato"
                     )
                 
-                return User(
+                user = User(
                     id=user_data[0],
                     uuid=user_data[1],
                     email=user_data[2],
@@ -319,6 +442,9 @@ class AuthService:
                     created_at=datetime.fromisoformat(user_data[8]),
                     last_login_at=datetime.fromisoformat(user_data[9]) if user_data[9] else None
                 )
+            
+            self.user_cache.put(user_id, user)
+            return user
                 
         except HTTPException:
             raise
@@ -329,43 +455,86 @@ class AuthService:
                 detail="Token non valido"
             )
     
-    def get_subscription_limits(self, tier) -> SubscriptionLimits:
-        """Ottieni limiti per tier di abbonamento"""
+    def reload_subscription_limits(self):
+        """Ricarica tutti i piani da subscription_plans"""
         try:
-            # Converti tier in string se è un Enum
-            tier_value = tier.value if hasattr(tier, 'value') else str(tier)
-            
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
-                    SELECT daily_ideas_limit, monthly_ideas_limit, max_team_members,
-                           max_projects, features
+                    SELECT plan_code, daily_ideas_limit, monthly_ideas_limit,
+                           max_team_members, max_projects, features
                     FROM subscription_plans
-                    WHERE plan_code = ?
-                """, (tier_value,))
-                
-                plan_data = cursor.fetchone()
-                if not plan_data:
-                    # Fallback ai limiti free
-                    return SubscriptionLimits(
-                        daily_ideas_limit=5,
-                        monthly_ideas_limit=150,
-                        max_team_members=1,
-                        max_projects=3,
-                        features={"ai_models": ["mock"], "export_formats": ["json"]}
+                """)
+                
+                limits = {}
+                for plan_code, daily, monthly, team, projects, features in cursor.fetchall():
+                    limits[plan_code] = SubscriptionLimits(
+                        daily_ideas_limit=daily,
+                        monthly_ideas_limit=monthly,
+                        max_team_members=team,
+                        max_projects=projects,
+                        features=json.loads(features) if features else {}
                     )
                 
-                import json
-                features = json.loads(plan_data[4]) if plan_data[4] else {}
-                
+                version = self._read_plan_version(cursor)
+            
+            with self._plan_lock:
+                self._plan_limits = limits
+                self._plan_version = version
+                self._plan_checked_at = time.monotonic()
+            
+            logger.info(f"✅ Limiti abbonamento caricati: {len(limits)} piani (versione {version})")
+            
+        except Exception as e:
+            logger.error(f"❌ Errore caricamento piani: {e}")
+    
+    def _read_plan_version(self, cursor) -> Optional[int]:
+        try:
+            cursor.execute("SELECT version FROM subscription_plans_version WHERE id = 1")
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Exception:
+            # Tabella versione assente (DB non ancora inizializzato)
+            return None
+    
+    def _refresh_subscription_limits(self):
+        """Ricarica i piani se la versione nel DB è cambiata"""
+        now = time.monotonic()
+        if now - self._plan_checked_at < PLAN_VERSION_CHECK_SECONDS:
+            return
+        
+        with self._plan_lock:
+            if now - self._plan_checked_at < PLAN_VERSION_CHECK_SECONDS:
+                return
+            self._plan_checked_at = now
+        
+        with get_connection(self.db_path) as conn:
+            version = self._read_plan_version(conn.cursor())
+        
+        if version != self._plan_version or not self._plan_limits:
+            self.reload_subscription_limits()
+    
+    def get_subscription_limits(self, tier) -> SubscriptionLimits:
+        """Ottieni limiti per tier di abbonamento"""
+        try:
+            # Converti tier in string se è un Enum
+            tier_value = tier.value if hasattr(tier, 'value') else str(tier)
+            
+            self._refresh_subscription_limits()
+            
+            limits = self._plan_limits.get(tier_value)
+            if not limits:
+                # Fallback ai limiti free
                 return SubscriptionLimits(
-                    daily_ideas_limit=plan_data[0],
-                    monthly_ideas_limit=plan_data[1],
-                    max_team_members=plan_data[2],
-                    max_projects=plan_data[3],
-                    features=features
+                    daily_ideas_limit=5,
+                    monthly_ideas_limit=150,
+                    max_team_members=1,
+                    max_projects=3,
+                    features={"ai_models": ["mock"], "export_formats": ["json"]}
                 )
+            
+            return limits
                 
         except Exception as e:
             logger.error(f"❌ Errore get_subscription_limits: {e}")
@@ -378,67 +547,33 @@ class AuthService:
                 features={"ai_models": ["mock"]}
             )
     
-    async def check_usage_limits(self, user: User, action: str = "generate_idea") -> bool:
+    async def check_usage_limits(self, user: User, action: str = "generate_idea",
+                                 limits: Optional[SubscriptionLimits] = None) -> bool:
         """Verifica se l'utente può eseguire l'azione richiesta"""
         try:
-            limits = self.get_subscription_limits(user.subscription_tier)
+            limits = limits or self.get_subscription_limits(user.subscription_tier)
+            daily_usage, monthly_usage = self.usage.get_usage(user.id)
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Controlla usage giornaliero
-                today = datetime.now().date()
-                cursor.execute("""
-                    SELECT ideas_generated FROM user_usage
-                    WHERE user_id = ? AND date = ?
-                """, (user.id, today))
-                
-                usage_data = cursor.fetchone()
-                daily_usage = usage_data[0] if usage_data else 0
-                
-                # Verifica limite giornaliero (-1 = illimitato)
-                if limits.daily_ideas_limit != -1 and daily_usage >= limits.daily_ideas_limit:
-                    return False
-                
-                # Controlla usage mensile
-                month_start = today.replace(day=1)
-                cursor.execute("""
-                    SELECT SUM(ideas_generated) FROM user_usage
-                    WHERE user_id = ? AND date >= ?
-                """, (user.id, month_start))
-                
-                monthly_usage = cursor.fetchone()[0] or 0
-                
-                # Verifica limite mensile (-1 = illimitato)
-                if limits.monthly_ideas_limit != -1 and monthly_usage >= limits.monthly_ideas_limit:
-                    return False
-                
-                return True
+            # Verifica limite giornaliero (-1 = illimitato)
+            if limits.daily_ideas_limit != -1 and daily_usage >= limits.daily_ideas_limit:
+                return False
+            
+            # Verifica limite mensile (-1 = illimitato)
+            if limits.monthly_ideas_limit != -1 and monthly_usage >= limits.monthly_ideas_limit:
+                return False
+            
+            return True
                 
         except Exception as e:
             logger.error(f"❌ Errore check_usage_limits: {e}")
             return False
     
     async def track_usage(self, user: User, action: str = "generate_idea", 
-                         metadata: Optional[Dict] = None):
+                         metadata: Optional[Dict] = None, count: int = 1):
         """Traccia l'utilizzo dell'utente"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                today = datetime.now().date()
-                
-                # Inserisci o aggiorna usage giornaliero
-                cursor.execute("""
-                    INSERT INTO user_usage (user_id, date, ideas_generated)
-                    VALUES (?, ?, 1)
-                    ON CONFLICT(user_id, date) DO UPDATE SET
-                        ideas_generated = ideas_generated + 1,
-                        updated_at = CURRENT_TIMESTAMP
-                """, (user.id, today))
-                
-                conn.commit()
-                logger.debug(f"✅ Usage tracked per utente {user.id}: {action}")
+            self.usage.increment(user.id, count)
+            logger.debug(f"✅ Usage tracked per utente {user.id}: {action} x{count}")
                 
         except Exception as e:
             logger.error(f"❌ Errore track_usage: {e}")
@@ -446,7 +581,7 @@ class AuthService:
     def generate_reset_token(self, email: str) -> Optional[str]:
         """Genera un token di reset password per l'utente"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Verifica se l'utente esiste
@@ -487,7 +622,7 @@ class AuthService:
     def verify_reset_token(self, token: str) -> Optional[int]:
         """Verifica un token di reset e restituisce l'user_id se valido"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Verifica token
@@ -520,7 +655,7 @@ class AuthService:
             logger.error(f"❌ Errore verify_reset_token: {e}")
             return None
     
-    def reset_password(self, token: str, new_password: str) -> bool:
+    async def reset_password(self, token: str, new_password: str) -> bool:
         """Reset password usando un token valido"""
         try:
             # Verifica token
@@ -528,12 +663,12 @@ class AuthService:
             if not user_id:
                 return False
             
-            with sqlite3.connect(self.db_path) as conn:
+            # Hash nuova password
+            password_hash, salt = await self._hash_password_async(new_password)
+            
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                # Hash nuova password
-                password_hash, salt = self._hash_password(new_password)
-                
                 # Aggiorna password
                 cursor.execute("""
                     UPDATE users
@@ -549,6 +684,7 @@ class AuthService:
                 """, (token,))
                 
                 conn.commit()
+                self.invalidate_user(user_id)
                 logger.info(f"✅ Password reset completato per utente {user_id}")
                 return True
                 
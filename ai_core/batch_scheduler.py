@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Creative Muse AI - Batch Scheduler
+Sammelt gleichzeitige Generierungs-Anfragen pro Modell und führt sie als
+gepaddete Batches aus, statt einen Forward-Pass pro Request zu starten.
+"""
+
+import os
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingGeneration:
+    """Eine wartende Generierungs-Anfrage"""
+    prompt: str
+    params: Dict[str, Any]
+    future: asyncio.Future
+    enqueued_at: float = 0.0
+
+    @property
+    def batch_key(self) -> Tuple:
+        """Nur Anfragen mit gleichen Parametern teilen sich einen Batch"""
+        return tuple(sorted(self.params.items()))
+
+
+@dataclass
+class SchedulerStats:
+    """Zähler für die Batch-Ausführung"""
+    requests: int = 0
+    batches: int = 0
+    batched_sequences: int = 0
+    failed_batches: int = 0
+    max_batch_size_seen: int = 0
+    queue_wait_total: float = 0.0
+    per_model: Dict[str, int] = field(default_factory=dict)
+
+
+class BatchScheduler:
+    """Scheduler für Batch-Inferenz pro Modell
+
+    Jedes Modell hat eine eigene Queue und einen Worker-Task. Der Worker
+    nimmt die erste wartende Anfrage, sammelt für höchstens ``max_wait_ms``
+    weitere Anfragen (bis ``max_batch_size``) und führt sie gemeinsam aus.
+    Anfragen, die während eines laufenden Batches eintreffen, werden beim
+    nächsten Schritt aufgenommen.
+    """
+
+    def __init__(self, model_manager, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        self.model_manager = model_manager
+        self.max_batch_size = max_batch_size or int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None
+                         else float(os.getenv("INFERENCE_BATCH_WAIT_MS", "20"))) / 1000.0
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        # Laufende Batches: der Event-Loop hält Tasks nur schwach referenziert
+        self._batches: Set[asyncio.Task] = set()
+        self.stats = SchedulerStats()
+
+    async def submit(self, prompt: str, model_key: str, **params) -> Optional[str]:
+        """Reihe eine Anfrage ein und warte auf ihr Ergebnis"""
+        loop = asyncio.get_running_loop()
+        request = PendingGeneration(
+            prompt=prompt,
+            params={k: v for k, v in params.items() if v is not None},
+            future=loop.create_future(),
+            enqueued_at=loop.time()
+        )
+
+        await self._get_queue(model_key).put(request)
+        self.stats.requests += 1
+        self.stats.per_model[model_key] = self.stats.per_model.get(model_key, 0) + 1
+
+        return await request.future
+
+    def _get_queue(self, model_key: str) -> asyncio.Queue:
+        """Hole (oder erstelle) Queue und Worker für ein Modell"""
+        if model_key not in self._queues:
+            self._queues[model_key] = asyncio.Queue()
+
+        worker = self._workers.get(model_key)
+        if worker is None or worker.done():
+            self._workers[model_key] = asyncio.create_task(self._worker(model_key))
+
+        return self._queues[model_key]
+
+    async def _collect_batch(self, queue: asyncio.Queue) -> List[PendingGeneration]:
+        """Sammle einen Batch aus der Queue"""
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Bereits wartende Anfragen ohne Verzögerung übernehmen
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Abgebrochene Anfragen (Client weg) nicht mehr berechnen
+        return [request for request in batch if not request.future.done()]
+
+    async def _worker(self, model_key: str):
+        """Worker-Loop für ein Modell"""
+        queue = self._queues[model_key]
+        loop = asyncio.get_running_loop()
+        # So viele Batches gleichzeitig wie der Inference-Pool Threads hat
+        slots = asyncio.Semaphore(self.model_manager.executor.pool_size(model_key))
+
+        while True:
+            batch = await self._collect_batch(queue)
+            if not batch:
+                continue
+
+            groups: Dict[Tuple, List[PendingGeneration]] = {}
+            for request in batch:
+                groups.setdefault(request.batch_key, []).append(request)
+
+            for requests in groups.values():
+                await slots.acquire()
+                now = loop.time()
+                for request in requests:
+                    self.stats.queue_wait_total += now - request.enqueued_at
+
+                task = asyncio.create_task(self._run_batch(model_key, requests))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+                task.add_done_callback(lambda _: slots.release())
+
+    async def _run_batch(self, model_key: str, requests: List[PendingGeneration]):
+        """Führe einen Batch aus und verteile die Ergebnisse"""
+        prompts = [request.prompt for request in requests]
+        params = requests[0].params
+
+        self.stats.batches += 1
+        self.stats.batched_sequences += len(requests)
+        self.stats.max_batch_size_seen = max(self.stats.max_batch_size_seen, len(requests))
+
+        try:
+            results = await self.model_manager.executor.run(
+                model_key, self.model_manager.generate_text_batch, prompts, model_key, **params
+            )
+        except asyncio.CancelledError:
+            # Scheduler beendet: wartende Anfragen nicht hängen lassen
+            for request in requests:
+                request.future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"❌ Fehler bei Batch-Generierung ({model_key}): {e}")
+            self.stats.failed_batches += 1
+            results = [None] * len(requests)
+
+        for request, result in zip(requests, results):
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Hole Batch-Statistiken"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests": self.stats.requests,
+            "batches": self.stats.batches,
+            "failed_batches": self.stats.failed_batches,
+            "average_batch_size": round(
+                self.stats.batched_sequences / max(1, self.stats.batches), 2
+            ),
+            "max_batch_size_seen": self.stats.max_batch_size_seen,
+            "average_queue_wait_ms": round(
+                self.stats.queue_wait_total / max(1, self.stats.batched_sequences) * 1000, 2
+            ),
+            "queued": {key: queue.qsize() for key, queue in self._queues.items()},
+            "requests_per_model": dict(self.stats.per_model)
+        }
+
+    def shutdown(self):
+        """Beende Worker und laufende Batches, breche wartende Anfragen ab"""
+        for worker in self._workers.values():
+            worker.cancel()
+        self._workers.clear()
+
+        for task in list(self._batches):
+            task.cancel()
+        self._batches.clear()
+
+        for queue in self._queues.values():
+            while not queue.empty():
+                request = queue.get_nowait()
+                if not request.future.done():
+                    request.future.cancel()
+        self._queues.clear()
+
+        logger.info("🛑 Batch Scheduler beendet")
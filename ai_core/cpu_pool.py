@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Creative Muse AI - CPU Pool
+Pool dedicato e limitato per operazioni CPU-intensive (bcrypt, PBKDF2),
+così hashing e derivazione chiavi non bloccano l'event loop.
+"""
+
+import os
+import time
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CPUPoolBusy(Exception):
+    """Troppe operazioni in coda nel pool"""
+
+
+class CPUWorkPool:
+    """Thread pool limitato con metriche di attesa
+
+    bcrypt e PBKDF2 (OpenSSL) rilasciano il GIL, quindi i thread lavorano
+    in parallelo senza il costo di un process pool. Il numero di worker
+    limita quanta CPU possono usare le ondate di login; oltre
+    ``max_queue`` operazioni in attesa le nuove richieste vengono rifiutate
+    invece di accumulare latenza.
+    """
+
+    def __init__(self, name: str, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.name = name
+        self.workers = workers or int(
+            os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+        )
+        self.max_queue = max_queue or int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.stats = {
+            "completed": 0,
+            "rejected": 0,
+            "max_pending": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "run_time_total": 0.0
+        }
+
+    def _timed(self, func: Callable, enqueued_at: float) -> Any:
+        started = time.perf_counter()
+        try:
+            return func()
+        finally:
+            finished = time.perf_counter()
+            wait = started - enqueued_at
+            with self._lock:
+                self.stats["completed"] += 1
+                self.stats["queue_wait_total"] += wait
+                self.stats["queue_wait_max"] = max(self.stats["queue_wait_max"], wait)
+                self.stats["run_time_total"] += finished - started
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Esegui func nel pool e attendi il risultato"""
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise CPUPoolBusy(f"Pool {self.name} saturo ({self._pending} operazioni in coda)")
+            self._pending += 1
+            self.stats["max_pending"] = max(self.stats["max_pending"], self._pending)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                self._timed, functools.partial(func, *args, **kwargs), time.perf_counter()
+            )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Statistiche del pool (tempi in millisecondi)"""
+        with self._lock:
+            completed = max(1, self.stats["completed"])
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "completed": self.stats["completed"],
+                "rejected": self.stats["rejected"],
+                "max_pending": self.stats["max_pending"],
+                "average_queue_wait_ms": round(self.stats["queue_wait_total"] / completed * 1000, 2),
+                "max_queue_wait_ms": round(self.stats["queue_wait_max"] * 1000, 2),
+                "average_run_time_ms": round(self.stats["run_time_total"] / completed * 1000, 2)
+            }
+
+    def shutdown(self):
+        """Chiudi il pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Istanza globale per hashing password e derivazione chiavi
+password_pool = CPUWorkPool("password-hash")
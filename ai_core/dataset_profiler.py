@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Creative Muse AI - Dataset Profiler
+Profilazione in streaming dei dataset di training: conteggio righe,
+schema dedotto da un campione reservoir e statistiche per colonna,
+eseguita in un processo separato.
+"""
+
+import os
+import csv
+import json
+import random
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Valori considerati nulli nei CSV (come i default di pandas)
+NULL_VALUES = {"", "NA", "N/A", "NaN", "nan", "null", "NULL", "None"}
+
+SAMPLE_SIZE = int(os.getenv("DATASET_PROFILE_SAMPLE_SIZE", "1000"))
+QUICK_PROFILE_ROWS = int(os.getenv("DATASET_QUICK_PROFILE_ROWS", "100"))
+
+
+class _ColumnStats:
+    """Statistiche di nulli e lunghezze per una colonna"""
+
+    __slots__ = ("nulls", "count", "min_length", "max_length", "total_length")
+
+    def __init__(self):
+        self.nulls = 0
+        self.count = 0
+        self.min_length = None
+        self.max_length = 0
+        self.total_length = 0
+
+    def add(self, value: Any, is_null: bool):
+        self.count += 1
+        if is_null:
+            self.nulls += 1
+            return
+        length = len(value) if isinstance(value, str) else len(json.dumps(value))
+        self.total_length += length
+        self.max_length = max(self.max_length, length)
+        self.min_length = length if self.min_length is None else min(self.min_length, length)
+
+    def to_dict(self) -> Dict[str, Any]:
+        filled = self.count - self.nulls
+        return {
+            "nulls": self.nulls,
+            "null_ratio": round(self.nulls / self.count, 4) if self.count else 0.0,
+            "min_length": self.min_length or 0,
+            "max_length": self.max_length,
+            "avg_length": round(self.total_length / filled, 2) if filled else 0.0
+        }
+
+
+class _Reservoir:
+    """Campione uniforme di dimensione fissa (algoritmo R)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.items: List[Any] = []
+        self.seen = 0
+        self._random = random.Random(42)  # profili riproducibili
+
+    def add(self, item: Any):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            index = self._random.randrange(self.seen)
+            if index < self.size:
+                self.items[index] = item
+
+
+def _infer_text_dtype(values: List[str]) -> str:
+    """Tipo di una colonna CSV dai valori campionati (nomi dtype pandas)"""
+    values = [value for value in values if value not in NULL_VALUES]
+    if not values:
+        return "object"
+    for dtype, caster in (("int64", int), ("float64", float)):
+        try:
+            for value in values:
+                caster(value)
+            return dtype
+        except ValueError:
+            continue
+    if all(value.lower() in ("true", "false") for value in values):
+        return "bool"
+    return "object"
+
+
+def _infer_json_dtype(values: List[Any]) -> str:
+    """Tipo di una chiave JSON dai valori campionati"""
+    types = {type(value) for value in values if value is not None}
+    if not types:
+        return "object"
+    if types == {bool}:
+        return "bool"
+    if types == {int}:
+        return "int64"
+    if types <= {int, float}:
+        return "float64"
+    return "object"
+
+
+def _cast(value: str, dtype: str) -> Any:
+    if value in NULL_VALUES:
+        return None
+    try:
+        if dtype == "int64":
+            return int(value)
+        if dtype == "float64":
+            return float(value)
+        if dtype == "bool":
+            return value.lower() == "true"
+    except ValueError:
+        pass
+    return value
+
+
+def _profile_csv(file_path: str, sample_size: int, max_rows: Optional[int]) -> Dict[str, Any]:
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        columns = next(reader, [])
+        stats = [_ColumnStats() for _ in columns]
+        reservoir = _Reservoir(sample_size)
+        head: List[List[str]] = []
+        rows = 0
+
+        for row in reader:
+            if not row:
+                continue
+            rows += 1
+            if len(head) < 3:
+                head.append(row)
+            reservoir.add(row)
+            for index, column_stats in enumerate(stats):
+                value = row[index] if index < len(row) else ""
+                column_stats.add(value, value in NULL_VALUES)
+            if max_rows and rows >= max_rows:
+                break
+
+    dtypes = {
+        column: _infer_text_dtype([row[index] for row in reservoir.items if index < len(row)])
+        for index, column in enumerate(columns)
+    }
+    return {
+        "rows_count": rows,
+        "columns_info": {
+            "columns": columns,
+            "dtypes": dtypes,
+            "sample_data": [
+                {column: _cast(row[index], dtypes[column]) if index < len(row) else None
+                 for index, column in enumerate(columns)}
+                for row in head
+            ],
+            "stats": {column: stats[index].to_dict() for index, column in enumerate(columns)}
+        }
+    }
+
+
+def _profile_records(records, sample_size: int, max_rows: Optional[int]) -> Dict[str, Any]:
+    """Profilo di una sequenza di record JSON (dict o valori semplici)"""
+    stats: Dict[str, _ColumnStats] = {}
+    reservoir = _Reservoir(sample_size)
+    head: List[Any] = []
+    rows = 0
+
+    for record in records:
+        rows += 1
+        if len(head) < 3:
+            head.append(record)
+        reservoir.add(record)
+        if isinstance(record, dict):
+            # Chiavi assenti in record precedenti contano come nulli
+            for key in record.keys() - stats.keys():
+                stats[key] = _ColumnStats()
+                stats[key].nulls = stats[key].count = rows - 1
+            for key, column_stats in stats.items():
+                value = record.get(key)
+                column_stats.add(value, value is None)
+        if max_rows and rows >= max_rows:
+            break
+
+    keys = list(stats.keys())
+    if not rows:
+        return {"rows_count": 0, "columns_info": {}}
+
+    return {
+        "rows_count": rows,
+        "columns_info": {
+            "keys": keys,
+            "dtypes": {
+                key: _infer_json_dtype([
+                    item.get(key) for item in reservoir.items if isinstance(item, dict)
+                ])
+                for key in keys
+            },
+            "sample_data": head,
+            "stats": {key: column_stats.to_dict() for key, column_stats in stats.items()}
+        }
+    }
+
+
+def _iter_jsonl(file_path: str):
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _profile_text(file_path: str, sample_size: int, max_rows: Optional[int]) -> Dict[str, Any]:
+    line_stats = _ColumnStats()
+    head: List[str] = []
+    rows = 0
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            rows += 1
+            if len(head) < 3:
+                head.append(line)
+            text = line.rstrip("\n")
+            line_stats.add(text, not text.strip())
+            if max_rows and rows >= max_rows:
+                break
+
+    return {
+        "rows_count": rows,
+        "columns_info": {
+            "type": "text",
+            "sample_lines": head,
+            "stats": {"line": line_stats.to_dict()}
+        }
+    }
+
+
+def profile_dataset(file_path: str, file_ext: str,
+                    sample_size: int = SAMPLE_SIZE,
+                    max_rows: Optional[int] = None) -> Dict[str, Any]:
+    """Profila un dataset leggendolo in streaming
+
+    Con ``max_rows`` vengono lette solo le prime righe (profilo rapido).
+    I file ``.json`` non sono leggibili in streaming senza un parser
+    incrementale e vengono caricati interi, ma solo nel processo worker.
+    """
+    try:
+        if file_ext == ".csv":
+            return _profile_csv(file_path, sample_size, max_rows)
+        if file_ext == ".jsonl":
+            return _profile_records(_iter_jsonl(file_path), sample_size, max_rows)
+        if file_ext == ".json":
+            if max_rows:
+                return {"rows_count": 0, "columns_info": {}}
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return _profile_records(data if isinstance(data, list) else [data], sample_size, None)
+        if file_ext == ".txt":
+            return _profile_text(file_path, sample_size, max_rows)
+        return {"rows_count": 0, "columns_info": {}}
+
+    except Exception as e:
+        return {"rows_count": 0, "columns_info": {"error": str(e)}}
+
+
+class DatasetProfiler:
+    """Esegue i profili completi in un pool di processi
+
+    Il pool usa ``spawn``: il fork di un processo uvicorn con thread e
+    connessioni SQLite aperte non è sicuro.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or int(os.getenv("DATASET_PROFILER_WORKERS", "1"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def quick_profile(self, file_path: str, file_ext: str) -> Dict[str, Any]:
+        """Profilo delle prime righe, abbastanza veloce per la richiesta"""
+        return profile_dataset(file_path, file_ext, max_rows=QUICK_PROFILE_ROWS)
+
+    async def profile(self, file_path: str, file_ext: str) -> Dict[str, Any]:
+        """Profilo completo nel processo worker"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), profile_dataset, file_path, file_ext
+        )
+
+    def shutdown(self):
+        """Chiudi il pool di processi"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Istanza globale per i dataset di training
+dataset_profiler = DatasetProfiler()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Creative Muse AI - SQLite Connection Pool
+Prozessweiter Pool mit einer Verbindung pro Thread und Datenbank,
+vorkonfiguriert mit WAL und abgestimmten Pragmas.
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _default_pragmas() -> Dict[str, Any]:
+    """Pragmas für jede neue Verbindung"""
+    return {
+        # Leser blockieren Schreiber nicht mehr (persistent in der DB-Datei)
+        "journal_mode": "WAL",
+        # Im WAL-Modus sicher; fsync nur noch beim Checkpoint
+        "synchronous": "NORMAL",
+        "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "64000")),
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE_MB", "256")) * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    }
+
+
+class PooledConnection(sqlite3.Connection):
+    """Verbindung, die von close() nicht geschlossen wird
+
+    Bestehender Code ruft oft ``conn.close()`` auf. Für gepoolte Verbindungen
+    wird dabei nur eine offene Transaktion zurückgerollt; geschlossen wird
+    die Verbindung erst über ``ConnectionPool.close_all()``.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def _really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Eine Verbindung pro (Thread, Datenbank)"""
+
+    def __init__(self, pragmas: Optional[Dict[str, Any]] = None):
+        self.pragmas = pragmas or _default_pragmas()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[PooledConnection] = []
+        self.stats = {"opened": 0, "reused": 0}
+
+    def get(self, db_path: str) -> sqlite3.Connection:
+        """Hole die Verbindung des aktuellen Threads für db_path"""
+        key = os.path.abspath(str(db_path))
+
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        conn = connections.get(key)
+        if conn is not None:
+            self.stats["reused"] += 1
+            return conn
+
+        conn = self._open(key)
+        connections[key] = conn
+        return conn
+
+    def _open(self, path: str) -> PooledConnection:
+        """Öffne eine neue Verbindung und setze die Pragmas"""
+        conn = sqlite3.connect(
+            path,
+            factory=PooledConnection,
+            check_same_thread=False  # nur für close_all() beim Shutdown
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+        with self._lock:
+            self._connections.append(conn)
+            self.stats["opened"] += 1
+
+        logger.debug(f"🔌 Neue SQLite-Verbindung: {path} ({threading.current_thread().name})")
+        return conn
+
+    def close_all(self):
+        """Schließe alle Verbindungen (nur beim Shutdown aufrufen)"""
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn._really_close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+        logger.info("🔌 SQLite-Verbindungen geschlossen")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Hole Pool-Statistiken"""
+        return {
+            "open_connections": len(self._connections),
+            **self.stats,
+            "pragmas": dict(self.pragmas)
+        }
+
+
+# Globale Pool-Instanz
+pool = ConnectionPool()
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """Ersatz für sqlite3.connect(db_path) mit gepoolter Verbindung
+
+    Als Context-Manager verwendet (``with get_connection(path) as conn``)
+    wird wie bei sqlite3 am Ende committet bzw. zurückgerollt.
+    """
+    return pool.get(db_path)
+
+
+def close_all():
+    """Schließe alle gepoolten Verbindungen"""
+    pool.close_all()
@@ -4,15 +4,23 @@ Creative Muse AI - Feature Flags Service
 Verwaltet Feature-Flags für granulare Funktionskontrolle
 """
 
-import sqlite3
+import os
 import json
+import time
 import logging
+import threading
 from typing import Dict, List, Optional, Any
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+from db_pool import get_connection
 
 logger = logging.getLogger(__name__)
 
+# Versionszähler in eigener Tabelle; Trigger erhöhen ihn bei jeder
+# Änderung an Flags oder Overrides, damit alle Worker neu laden
+FLAG_VERSION_TABLES = ("feature_flags", "user_feature_overrides")
+
 
 @dataclass
 class FeatureFlag:
@@ -34,83 +42,186 @@ class UserFeatureOverride:
     expires_at: Optional[datetime] = None
 
 
+@dataclass(frozen=True)
+class FeatureSnapshot:
+    """Unveränderlicher Stand aller aktiven Flags und Overrides
+    
+    Wird nie verändert, sondern bei Änderungen komplett ersetzt; Leser
+    arbeiten ohne Lock und ohne Datenbankzugriff.
+    """
+    version: Optional[int] = None
+    flags: Dict[str, FeatureFlag] = field(default_factory=dict)
+    # user_id -> flag_key -> Override
+    overrides: Dict[str, Dict[str, UserFeatureOverride]] = field(default_factory=dict)
+    
+    def is_enabled(self, flag_key: str, user_tier: str, user_id: Optional[int] = None,
+                   now: Optional[datetime] = None) -> bool:
+        flag = self.flags.get(flag_key)
+        if flag is None or not flag.is_enabled:
+            return False
+        
+        if user_id:
+            override = self.overrides.get(str(user_id), {}).get(flag_key)
+            # Abgelaufene Overrides werden ignoriert
+            if override and not (override.expires_at and override.expires_at < (now or datetime.now())):
+                return override.is_enabled
+        
+        return user_tier in flag.allowed_tiers
+
+
 class FeatureFlagsService:
     """Service für Feature-Flag-Management"""
     
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self._cache: Dict[str, FeatureFlag] = {}
-        self._cache_timestamp = None
+        self._snapshot = FeatureSnapshot()
+        self._loaded_at: Optional[float] = None
+        self._checked_at = 0.0
         self._cache_ttl = 300  # 5 Minuten Cache
+        self._version_check_interval = float(os.getenv("FEATURE_FLAGS_CHECK_SECONDS", "5"))
+        self._reload_lock = threading.Lock()
+        self._init_versioning()
     
     def _get_connection(self):
-        """Datenbankverbindung erstellen"""
-        return sqlite3.connect(self.db_path)
+        """Gepoolte Datenbankverbindung holen"""
+        return get_connection(self.db_path)
     
-    def _refresh_cache(self):
-        """Feature-Flags Cache aktualisieren"""
-        now = datetime.now()
-        if (self._cache_timestamp is None or 
-            (now - self._cache_timestamp).seconds > self._cache_ttl):
-            
+    def _init_versioning(self):
+        """Versionstabelle und Trigger für den Versionszähler anlegen"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS feature_flags_version (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        version INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+                cursor.execute("INSERT OR IGNORE INTO feature_flags_version (id, version) VALUES (1, 0)")
+                
+                cursor.execute("SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'trigger')")
+                schema = dict(cursor.fetchall())
+                
+                for table in FLAG_VERSION_TABLES:
+                    if table not in schema:
+                        continue
+                    for event in ("INSERT", "UPDATE", "DELETE"):
+                        trigger = f"{table}_version_{event.lower()}"
+                        # Ältere Trigger zählten in der settings-Tabelle
+                        if "feature_flags_version SET" not in (schema.get(trigger) or ""):
+                            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                        cursor.execute(f"""
+                            CREATE TRIGGER IF NOT EXISTS {trigger}
+                            AFTER {event} ON {table}
+                            BEGIN
+                                UPDATE feature_flags_version SET version = version + 1 WHERE id = 1;
+                            END
+                        """)
+                
+                if "settings" in schema:
+                    cursor.execute("DELETE FROM settings WHERE setting_key = 'feature_flags_version'")
+                conn.commit()
+                
+        except Exception as e:
+            logger.error(f"❌ Fehler beim Einrichten der Flag-Versionierung: {e}")
+    
+    def _read_version(self, cursor) -> Optional[int]:
+        cursor.execute("SELECT version FROM feature_flags_version WHERE id = 1")
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def bump_version(self):
+        """Version manuell erhöhen (Änderungen ohne Trigger, z.B. externe DB)"""
+        try:
+            with self._get_connection() as conn:
+                conn.execute("UPDATE feature_flags_version SET version = version + 1 WHERE id = 1")
+        except Exception as e:
+            logger.error(f"❌ Fehler beim Erhöhen der Flag-Version: {e}")
+    
+    def refresh_cache(self):
+        """Snapshot sofort neu laden (nach Admin-Änderungen)"""
+        self._load_snapshot()
+    
+    def _load_snapshot(self):
+        """Neuen Snapshot aus der Datenbank laden und atomar austauschen"""
+        try:
+            with self._reload_lock, self._get_connection() as conn:
+                cursor = conn.cursor()
+                version = self._read_version(cursor)
+                
+                cursor.execute("""
+                    SELECT flag_key, name, description, is_enabled, 
+                           allowed_tiers, config
+                    FROM feature_flags
+                    WHERE is_enabled = 1
+                """)
+                
+                flags = {}
+                for row in cursor.fetchall():
+                    flag = FeatureFlag(
+                        flag_key=row[0],
+                        name=row[1],
+                        description=row[2],
+                        is_enabled=bool(row[3]),
+                        allowed_tiers=json.loads(row[4]) if row[4] else [],
+                        config=json.loads(row[5]) if row[5] else {}
+                    )
+                    flags[flag.flag_key] = flag
+                
+                overrides: Dict[str, Dict[str, UserFeatureOverride]] = {}
+                cursor.execute("""
+                    SELECT user_id, flag_key, is_enabled, expires_at
+                    FROM user_feature_overrides
+                """)
+                for row in cursor.fetchall():
+                    override = UserFeatureOverride(
+                        user_id=row[0],
+                        flag_key=row[1],
+                        is_enabled=bool(row[2]),
+                        expires_at=datetime.fromisoformat(row[3]) if row[3] else None
+                    )
+                    overrides.setdefault(str(row[0]), {})[override.flag_key] = override
+                
+                self._snapshot = FeatureSnapshot(version=version, flags=flags, overrides=overrides)
+                self._loaded_at = self._checked_at = time.monotonic()
+                logger.info(
+                    f"✅ Feature flags cache refreshed: {len(flags)} flags, "
+                    f"{sum(len(o) for o in overrides.values())} overrides (Version {version})"
+                )
+                
+        except Exception as e:
+            logger.error(f"❌ Fehler beim Cache-Refresh: {e}")
+    
+    def _current_snapshot(self) -> FeatureSnapshot:
+        """Aktuellen Snapshot holen, bei neuer Version oder Ablauf neu laden"""
+        now = time.monotonic()
+        
+        if self._loaded_at is None or now - self._loaded_at > self._cache_ttl:
+            self._load_snapshot()
+        elif now - self._checked_at > self._version_check_interval:
+            self._checked_at = now
             try:
                 with self._get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        SELECT flag_key, name, description, is_enabled, 
-                               allowed_tiers, config
-                        FROM feature_flags
-                        WHERE is_enabled = 1
-                    """)
-                    
-                    self._cache = {}
-                    for row in cursor.fetchall():
-                        flag = FeatureFlag(
-                            flag_key=row[0],
-                            name=row[1],
-                            description=row[2],
-                            is_enabled=bool(row[3]),
-                            allowed_tiers=json.loads(row[4]) if row[4] else [],
-                            config=json.loads(row[5]) if row[5] else {}
-                        )
-                        self._cache[flag.flag_key] = flag
-                    
-                    self._cache_timestamp = now
-                    logger.info(f"✅ Feature flags cache refreshed: {len(self._cache)} flags")
-                    
+                    version = self._read_version(conn.cursor())
+                if version != self._snapshot.version:
+                    self._load_snapshot()
             except Exception as e:
-                logger.error(f"❌ Fehler beim Cache-Refresh: {e}")
+                logger.error(f"❌ Fehler beim Prüfen der Flag-Version: {e}")
+        
+        return self._snapshot
     
     def is_feature_enabled(self, flag_key: str, user_tier: str, 
                           user_id: Optional[int] = None) -> bool:
         """Prüft ob ein Feature für einen Benutzer aktiviert ist"""
         try:
-            # Cache aktualisieren
-            self._refresh_cache()
+            snapshot = self._current_snapshot()
             
             # Feature Flag existiert?
-            if flag_key not in self._cache:
+            if flag_key not in snapshot.flags:
                 logger.warning(f"⚠️  Feature flag nicht gefunden: {flag_key}")
                 return False
             
-            flag = self._cache[flag_key]
-            
-            # Global deaktiviert?
-            if not flag.is_enabled:
-                return False
-            
-            # Benutzer-spezifische Overrides prüfen
-            if user_id:
-                override = self._get_user_override(user_id, flag_key)
-                if override:
-                    # Ablaufzeit prüfen
-                    if override.expires_at and override.expires_at < datetime.now():
-                        self._remove_expired_override(user_id, flag_key)
-                    else:
-                        return override.is_enabled
-            
-            # Tier-basierte Berechtigung prüfen
-            return user_tier in flag.allowed_tiers
+            return snapshot.is_enabled(flag_key, user_tier, user_id)
             
         except Exception as e:
             logger.error(f"❌ Fehler bei Feature-Check {flag_key}: {e}")
@@ -118,63 +229,22 @@ class FeatureFlagsService:
     
     def get_feature_config(self, flag_key: str) -> Dict[str, Any]:
         """Holt die Konfiguration für ein Feature"""
-        self._refresh_cache()
-        if flag_key in self._cache:
-            return self._cache[flag_key].config
-        return {}
+        flag = self._current_snapshot().flags.get(flag_key)
+        return flag.config if flag else {}
     
     def get_user_features(self, user_tier: str, user_id: Optional[int] = None) -> Dict[str, bool]:
         """Holt alle verfügbaren Features für einen Benutzer"""
-        self._refresh_cache()
-        features = {}
-        
-        for flag_key, flag in self._cache.items():
-            features[flag_key] = self.is_feature_enabled(flag_key, user_tier, user_id)
+        snapshot = self._current_snapshot()
+        now = datetime.now()
         
-        return features
-    
-    def _get_user_override(self, user_id: int, flag_key: str) -> Optional[UserFeatureOverride]:
-        """Holt benutzer-spezifische Override"""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT user_id, flag_key, is_enabled, expires_at
-                    FROM user_feature_overrides
-                    WHERE user_id = ? AND flag_key = ?
-                """, (user_id, flag_key))
-                
-                row = cursor.fetchone()
-                if row:
-                    expires_at = None
-                    if row[3]:
-                        expires_at = datetime.fromisoformat(row[3])
-                    
-                    return UserFeatureOverride(
-                        user_id=row[0],
-                        flag_key=row[1],
-                        is_enabled=bool(row[2]),
-                        expires_at=expires_at
-                    )
-                return None
-                
-        except Exception as e:
-            logger.error(f"❌ Fehler beim Laden der User Override: {e}")
-            return None
+        return {
+            flag_key: snapshot.is_enabled(flag_key, user_tier, user_id, now)
+            for flag_key in snapshot.flags
+        }
     
-    def _remove_expired_override(self, user_id: int, flag_key: str):
-        """Entfernt abgelaufene Override"""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    DELETE FROM user_feature_overrides
-                    WHERE user_id = ? AND flag_key = ? AND expires_at < ?
-                """, (user_id, flag_key, datetime.now().isoformat()))
-                conn.commit()
-                
-        except Exception as e:
-            logger.error(f"❌ Fehler beim Entfernen abgelaufener Override: {e}")
+    def get_user_override(self, user_id: int, flag_key: str) -> Optional[UserFeatureOverride]:
+        """Holt benutzer-spezifische Override aus dem Snapshot"""
+        return self._current_snapshot().overrides.get(str(user_id), {}).get(flag_key)
     
     def set_user_override(self, user_id: int, flag_key: str, is_enabled: bool,
                          expires_at: Optional[datetime] = None):
@@ -191,6 +261,7 @@ class FeatureFlagsService:
                     expires_at.isoformat() if expires_at else None
                 ))
                 conn.commit()
+                self._load_snapshot()
                 logger.info(f"✅ User override gesetzt: {user_id} -> {flag_key} = {is_enabled}")
                 
         except Exception as e:
@@ -213,8 +284,8 @@ class FeatureFlagsService:
                 ))
                 conn.commit()
                 
-                # Cache invalidieren
-                self._cache_timestamp = None
+                # Snapshot neu laden
+                self._load_snapshot()
                 logger.info(f"✅ Feature flag erstellt: {flag_key}")
                 
         except Exception as e:
@@ -250,8 +321,8 @@ class FeatureFlagsService:
                     cursor.execute(query, values)
                     conn.commit()
                     
-                    # Cache invalidieren
-                    self._cache_timestamp = None
+                    # Snapshot neu laden
+                    self._load_snapshot()
                     logger.info(f"✅ Feature flag aktualisiert: {flag_key}")
                 
         except Exception as e:
@@ -259,8 +330,7 @@ class FeatureFlagsService:
     
     def get_all_flags(self) -> List[FeatureFlag]:
         """Holt alle Feature Flags"""
-        self._refresh_cache()
-        return list(self._cache.values())
+        return list(self._current_snapshot().flags.values())
 
 
 # Globale Service-Instanz
@@ -5,16 +5,91 @@ Middleware für Feature-Flag-basierte Zugriffskontrolle
 """
 
 import logging
-from typing import Callable, List
-from fastapi import HTTPException, Depends, status
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+from fastapi import HTTPException, Depends, Request, status
 from functools import wraps
 
-from auth_service import get_current_user, User
+from auth_service import auth_service, get_current_user, User, SubscriptionLimits
 from feature_flags_service import get_feature_flags_service
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class AccessContext:
+    """Pro Request einmal aufgelöster Zugriffskontext
+    
+    Enthält Benutzer, Tier, Abo-Limits und die komplette Feature-Map, damit
+    gestapelte Dependencies und Feature-Gates nichts erneut nachschlagen.
+    """
+    user: User
+    tier: str
+    limits: SubscriptionLimits
+    features: Dict[str, bool]
+    
+    def has_feature(self, flag_key: str) -> bool:
+        return self.features.get(flag_key, False)
+    
+    def require(self, flag_key: str, error_message: str = None):
+        """Wirft 403 wenn das Feature nicht verfügbar ist"""
+        if not self.has_feature(flag_key):
+            message = error_message or f"Feature '{flag_key}' nicht verfügbar für Ihr Abonnement"
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=message
+            )
+
+
+def build_access_context(user: User) -> AccessContext:
+    """Löst Tier, Limits und Features für einen Benutzer auf"""
+    tier = user.subscription_tier
+    tier = tier.value if hasattr(tier, "value") else str(tier or "free")
+    
+    return AccessContext(
+        user=user,
+        tier=tier,
+        limits=auth_service.get_subscription_limits(tier),
+        features=get_feature_flags_service().get_user_features(tier, user.id)
+    )
+
+
+async def get_access_context(request: Request,
+                             current_user: User = Depends(get_current_user)) -> AccessContext:
+    """
+    Dependency für den Zugriffskontext der aktuellen Request
+    FastAPI cached Dependencies pro Request; zusätzlich liegt der Kontext
+    in request.state für Middleware und Decorators
+    """
+    context = getattr(request.state, "access_context", None)
+    if context is None or context.user.id != current_user.id:
+        context = build_access_context(current_user)
+        request.state.access_context = context
+    return context
+
+
+async def check_access_limits(access: AccessContext = Depends(get_access_context)) -> AccessContext:
+    """Dependency: Nutzungslimits mit den Limits aus dem Kontext prüfen"""
+    can_proceed = await auth_service.check_usage_limits(access.user, limits=access.limits)
+    if not can_proceed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Limite giornaliero raggiunto ({access.limits.daily_ideas_limit} idee). Aggiorna il tuo piano per continuare."
+        )
+    return access
+
+
+def _context_from_kwargs(kwargs: dict) -> Optional[AccessContext]:
+    """Zugriffskontext (oder Benutzer) aus den Endpoint-Argumenten holen"""
+    for value in kwargs.values():
+        if isinstance(value, AccessContext):
+            return value
+    for value in kwargs.values():
+        if isinstance(value, User):
+            return build_access_context(value)
+    return None
+
+
 def require_feature(flag_key: str, error_message: str = None):
     """
     Decorator für Endpoints, die ein bestimmtes Feature erfordern
@@ -26,31 +101,17 @@ def require_feature(flag_key: str, error_message: str = None):
     def decorator(func: Callable):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Current user aus kwargs extrahieren
-            current_user = None
-            for key, value in kwargs.items():
-                if isinstance(value, User):
-                    current_user = value
-                    break
+            # Zugriffskontext aus kwargs extrahieren
+            access = _context_from_kwargs(kwargs)
             
-            if not current_user:
+            if not access:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Authentifizierung erforderlich"
                 )
             
             # Feature-Flag prüfen
-            feature_service = get_feature_flags_service()
-            if not feature_service.is_feature_enabled(
-                flag_key, 
-                current_user.subscription_tier, 
-                current_user.id
-            ):
-                message = error_message or f"Feature '{flag_key}' nicht verfügbar für Ihr Abonnement"
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=message
-                )
+            access.require(flag_key, error_message)
             
             return await func(*args, **kwargs)
         return wrapper
@@ -70,30 +131,17 @@ def require_features(flag_keys: List[str], require_all: bool = True,
     def decorator(func: Callable):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Current user aus kwargs extrahieren
-            current_user = None
-            for key, value in kwargs.items():
-                if isinstance(value, User):
-                    current_user = value
-                    break
+            # Zugriffskontext aus kwargs extrahieren
+            access = _context_from_kwargs(kwargs)
             
-            if not current_user:
+            if not access:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Authentifizierung erforderlich"
                 )
             
             # Feature-Flags prüfen
-            feature_service = get_feature_flags_service()
-            enabled_features = []
-            
-            for flag_key in flag_keys:
-                if feature_service.is_feature_enabled(
-                    flag_key, 
-                    current_user.subscription_tier, 
-                    current_user.id
-                ):
-                    enabled_features.append(flag_key)
+            enabled_features = [flag_key for flag_key in flag_keys if access.has_feature(flag_key)]
             
             # Zugriffskontrolle
             if require_all:
@@ -117,33 +165,23 @@ def require_features(flag_keys: List[str], require_all: bool = True,
     return decorator
 
 
-def check_feature_access(current_user: User = Depends(get_current_user)):
+def check_feature_access(access: AccessContext = Depends(get_access_context)):
     """
     Dependency für Feature-basierte Zugriffskontrolle
     Kann in FastAPI-Endpoints als Dependency verwendet werden
     """
-    def _check_feature(flag_key: str) -> bool:
-        feature_service = get_feature_flags_service()
-        return feature_service.is_feature_enabled(
-            flag_key, 
-            current_user.subscription_tier, 
-            current_user.id
-        )
+    current_user = access.user
     
     # Füge Check-Funktion zum User-Objekt hinzu
-    current_user.check_feature = _check_feature
+    current_user.check_feature = access.has_feature
     return current_user
 
 
-def get_user_features(current_user: User = Depends(get_current_user)) -> dict:
+def get_user_features(access: AccessContext = Depends(get_access_context)) -> dict:
     """
     Dependency die alle verfügbaren Features für den aktuellen Benutzer zurückgibt
     """
-    feature_service = get_feature_flags_service()
-    return feature_service.get_user_features(
-        current_user.subscription_tier, 
-        current_user.id
-    )
+    return access.features
 
 
 class FeatureGate:
@@ -154,21 +192,18 @@ class FeatureGate:
     def __init__(self, flag_key: str):
         self.flag_key = flag_key
     
-    def is_enabled_for_user(self, user: User) -> bool:
+    def is_enabled_for_user(self, user: Union[User, AccessContext]) -> bool:
         """Prüft ob Feature für Benutzer aktiviert ist"""
-        feature_service = get_feature_flags_service()
-        return feature_service.is_feature_enabled(
-            self.flag_key, 
-            user.subscription_tier, 
-            user.id
-        )
+        if isinstance(user, AccessContext):
+            return user.has_feature(self.flag_key)
+        return build_access_context(user).has_feature(self.flag_key)
     
     def get_config(self) -> dict:
         """Holt Feature-Konfiguration"""
         feature_service = get_feature_flags_service()
         return feature_service.get_feature_config(self.flag_key)
     
-    def require_access(self, user: User, error_message: str = None):
+    def require_access(self, user: Union[User, AccessContext], error_message: str = None):
         """Wirft Exception wenn Feature nicht verfügbar"""
         if not self.is_enabled_for_user(user):
             message = error_message or f"Feature '{self.flag_key}' nicht verfügbar"
@@ -176,6 +211,13 @@ class FeatureGate:
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=message
             )
+    
+    def dependency(self, error_message: str = None) -> Callable:
+        """FastAPI-Dependency, die das Feature über den Zugriffskontext prüft"""
+        async def _require(access: AccessContext = Depends(get_access_context)) -> AccessContext:
+            self.require_access(access, error_message)
+            return access
+        return _require
 
 
 # Vordefinierte Feature Gates für häufig verwendete Features
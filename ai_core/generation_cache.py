@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Creative Muse AI - Generation Cache
+Cache für generierte Ideen mit exaktem Schlüssel und optionaler
+Near-Duplicate-Stufe auf Basis eines normalisierten Prompts.
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _TTLCache:
+    """LRU-Cache mit Ablaufzeit und Größenlimit"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class GenerationCache:
+    """Cache für Ideen-Generierung
+
+    Ergebnisse werden immer gespeichert, aber nur für Anfragen mit
+    ``creativity_level <= max_reuse_creativity`` wieder ausgeliefert –
+    bei höherer Kreativität soll jede Anfrage eine neue Idee liefern.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 semantic: Optional[bool] = None, max_reuse_creativity: Optional[int] = None):
+        max_entries = max_entries or int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "1000"))
+        ttl_seconds = ttl_seconds or float(os.getenv("GENERATION_CACHE_TTL_SECONDS", "3600"))
+        if semantic is None:
+            semantic = os.getenv("GENERATION_CACHE_SEMANTIC", "true").lower() == "true"
+        if max_reuse_creativity is None:
+            max_reuse_creativity = int(os.getenv("GENERATION_CACHE_MAX_CREATIVITY", "3"))
+
+        self.semantic = semantic
+        self.max_reuse_creativity = max_reuse_creativity
+        self._exact = _TTLCache(max_entries, ttl_seconds)
+        self._near = _TTLCache(max_entries, ttl_seconds)
+        self._lock = threading.Lock()
+        self.stats = {
+            "exact_hits": 0,
+            "near_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stores": 0
+        }
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Normalisiere einen Prompt für die Near-Duplicate-Stufe"""
+        words = re.findall(r"\w+", prompt.lower())
+        return " ".join(sorted(set(words)))
+
+    @staticmethod
+    def _hash(*parts: Any) -> str:
+        return hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+
+    def _keys(self, prompt: str, category: str, language: str, creativity_level: int,
+              model: str, params: Dict[str, Any]) -> Tuple[str, str]:
+        extra = sorted((k, v) for k, v in params.items() if v is not None)
+        exact_key = self._hash(prompt, category, language, creativity_level, model, extra)
+        # Kreativität steuert Prompt und Sampling: gehört auch in den Near-Key
+        near_key = self._hash(self.normalize_prompt(prompt), category, language,
+                              creativity_level, model, extra)
+        return exact_key, near_key
+
+    def get(self, prompt: str, category: str, language: str, creativity_level: int,
+            model: str, **params) -> Optional[Dict[str, Any]]:
+        """Hole ein gecachtes Ergebnis (None bei Miss oder hoher Kreativität)"""
+        if creativity_level is None or creativity_level > self.max_reuse_creativity:
+            self.stats["bypassed"] += 1
+            return None
+
+        exact_key, near_key = self._keys(prompt, category, language, creativity_level, model, params)
+
+        with self._lock:
+            result = self._exact.get(exact_key)
+            if result is not None:
+                self.stats["exact_hits"] += 1
+                return {**result, "cached": True}
+
+            if self.semantic:
+                result = self._near.get(near_key)
+                if result is not None:
+                    self.stats["near_hits"] += 1
+                    return {**result, "cached": True}
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, prompt: str, category: str, language: str, creativity_level: int,
+            model: str, result: Dict[str, Any], **params):
+        """Speichere ein Generierungs-Ergebnis"""
+        exact_key, near_key = self._keys(prompt, category, language, creativity_level, model, params)
+
+        with self._lock:
+            self._exact.put(exact_key, result)
+            if self.semantic:
+                self._near.put(near_key, result)
+            self.stats["stores"] += 1
+
+    def clear(self):
+        """Leere beide Stufen"""
+        with self._lock:
+            self._exact.clear()
+            self._near.clear()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Hole Hit/Miss-Zähler"""
+        hits = self.stats["exact_hits"] + self.stats["near_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._exact),
+            "near_entries": len(self._near),
+            "evictions": self._exact.evictions + self._near.evictions,
+            "semantic_enabled": self.semantic,
+            "max_reuse_creativity": self.max_reuse_creativity
+        }
+
+
+# Globale Cache-Instanz
+generation_cache = GenerationCache()
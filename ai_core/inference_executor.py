@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Creative Muse AI - Inference Executor
+Führt blockierende Inferenz in dedizierten Thread-Pools pro Modell aus,
+damit der asyncio Event-Loop (Health-Checks, WebSockets) frei bleibt.
+"""
+
+import os
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """Zu viele wartende Anfragen für ein Modell"""
+
+
+class InferenceTimeout(Exception):
+    """Anfrage hat das Zeitlimit überschritten"""
+
+
+class InferenceCancelled(Exception):
+    """Client hat die Verbindung getrennt"""
+
+
+class InferenceExecutor:
+    """Thread-Pools pro Modell mit Queue-Limit, Timeout und Abbruch"""
+
+    def __init__(self, max_queue_depth: Optional[int] = None,
+                 default_timeout: Optional[float] = None,
+                 disconnect_poll_interval: float = 0.5):
+        self.max_queue_depth = max_queue_depth or int(os.getenv("INFERENCE_MAX_QUEUE_DEPTH", "32"))
+        self.default_timeout = default_timeout or float(os.getenv("INFERENCE_TIMEOUT_SECONDS", "120"))
+        self.disconnect_poll_interval = disconnect_poll_interval
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._pool_sizes: Dict[str, int] = {}
+        self._pending: Dict[str, int] = {}
+        self.stats = {
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "cancelled": 0
+        }
+
+    def configure_model(self, model_key: str, workers: int = 1):
+        """Lege die Pool-Größe für ein Modell fest"""
+        workers = max(1, workers)
+        if self._pool_sizes.get(model_key) == workers and model_key in self._pools:
+            return
+
+        old_pool = self._pools.pop(model_key, None)
+        if old_pool:
+            old_pool.shutdown(wait=False)
+
+        self._pool_sizes[model_key] = workers
+        self._pools[model_key] = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix=f"inference-{model_key}"
+        )
+        logger.info(f"🧵 Inference-Pool für {model_key}: {workers} Worker")
+
+    def pool_size(self, model_key: str) -> int:
+        """Anzahl Worker-Threads für ein Modell"""
+        return self._pool_sizes.get(model_key, 1)
+
+    def _get_pool(self, model_key: str) -> ThreadPoolExecutor:
+        if model_key not in self._pools:
+            self.configure_model(model_key, self._pool_sizes.get(model_key, 1))
+        return self._pools[model_key]
+
+    async def run(self, model_key: str, func: Callable, *args, **kwargs) -> Any:
+        """Führe eine blockierende Funktion im Pool des Modells aus"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_pool(model_key), functools.partial(func, *args, **kwargs)
+        )
+
+    async def execute(self, model_key: str, awaitable: Awaitable,
+                      timeout: Optional[float] = None,
+                      is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Any:
+        """Warte auf eine Inferenz-Anfrage mit Admission-Control
+
+        Lehnt die Anfrage ab, wenn bereits ``max_queue_depth`` Anfragen für
+        das Modell warten, bricht nach ``timeout`` Sekunden ab und storniert
+        die Anfrage, sobald ``is_disconnected()`` True liefert.
+        """
+        if self._pending.get(model_key, 0) >= self.max_queue_depth:
+            self.stats["rejected"] += 1
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise InferenceQueueFull(
+                f"Zu viele Anfragen für Modell {model_key} "
+                f"({self.max_queue_depth} in Warteschlange)"
+            )
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.default_timeout)
+        task = asyncio.ensure_future(awaitable)
+        self._pending[model_key] = self._pending.get(model_key, 0) + 1
+
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    task.cancel()
+                    self.stats["timeouts"] += 1
+                    raise InferenceTimeout(f"Zeitlimit für Modell {model_key} überschritten")
+
+                wait_time = min(remaining, self.disconnect_poll_interval) if is_disconnected else remaining
+                done, _ = await asyncio.wait({task}, timeout=wait_time)
+                if done:
+                    self.stats["completed"] += 1
+                    return task.result()
+
+                if is_disconnected and await is_disconnected():
+                    task.cancel()
+                    self.stats["cancelled"] += 1
+                    raise InferenceCancelled(f"Client getrennt ({model_key})")
+
+        except asyncio.CancelledError:
+            # Aufrufender Task wurde abgebrochen (z.B. Streaming-Client weg)
+            task.cancel()
+            self.stats["cancelled"] += 1
+            raise
+
+        finally:
+            self._pending[model_key] -= 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Hole Executor-Statistiken"""
+        return {
+            "max_queue_depth": self.max_queue_depth,
+            "default_timeout": self.default_timeout,
+            "pool_sizes": dict(self._pool_sizes),
+            "pending": {key: count for key, count in self._pending.items() if count},
+            **self.stats
+        }
+
+    def shutdown(self):
+        """Beende alle Thread-Pools"""
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+        logger.info("🛑 Inference Executor beendet")
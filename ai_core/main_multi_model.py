@@ -18,7 +18,7 @@ import json
 from concurrent.futures import ThreadPoolExecutor
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
@@ -27,6 +27,9 @@ from sse_starlette.sse import EventSourceResponse
 
 # Lokale Imports
 from model_manager import ModelManager
+from inference_executor import InferenceQueueFull, InferenceTimeout, InferenceCancelled
+from generation_cache import generation_cache
+from db_pool import get_connection, close_all as close_db_connections
 
 # Lade Umgebungsvariablen
 load_dotenv("../.env")
@@ -137,6 +140,7 @@ class Stats(BaseModel):
     model_stats: Dict[str, Any]
     streaming_stats: Optional[Dict[str, Any]] = None
     batch_stats: Optional[Dict[str, Any]] = None
+    cache_stats: Optional[Dict[str, Any]] = None
 
 
 # Globale Variablen
@@ -183,6 +187,7 @@ async def lifespan(app: FastAPI):
     logger.info("🛑 Backend wird beendet...")
     if model_manager:
         model_manager.cleanup()
+    close_db_connections()
 
 
 # FastAPI App
@@ -207,7 +212,7 @@ def init_simple_db():
     """Initialisiere vereinfachte Datenbank"""
     try:
         db_path.parent.mkdir(parents=True, exist_ok=True)
-        conn = sqlite3.connect(str(db_path))
+        conn = get_connection(str(db_path))
         cursor = conn.cursor()
 
         # Erweiterte Ideen-Tabelle mit Modell-Info
@@ -380,30 +385,33 @@ async def generate_streaming_idea(prompt: str, category: str, language: str,
             progress=0.0
         )
         
-        # Simuliere Streaming-Generierung (in echter Implementierung würde hier das Modell streamen)
         target_model = model_key or (model_manager.get_current_model() if model_manager else "mock")
         
         if target_model and target_model != "mock" and model_manager:
-            # Echte Modell-Generierung
+            # Modell bei Bedarf in den Pool laden
+            if target_model not in model_manager.models:
+                if not await model_manager.load_model(target_model):
+                    raise Exception(f"Modell {target_model} konnte nicht geladen werden")
+            
             formatted_prompt = create_model_specific_prompt(prompt, category, language, creativity_level, target_model)
+            max_tokens = model_manager.model_configs[target_model].max_tokens
             
-            # Simuliere Streaming durch Chunk-weise Ausgabe
-            full_text = model_manager.generate_text(formatted_prompt, model_key=target_model)
+            # Echtes Token-Streaming direkt aus der Dekodierung
+            token_count = 0
+            async for token in model_manager.stream_text(
+                formatted_prompt,
+                model_key=target_model,
+                temperature=0.3 + (creativity_level / 10) * 0.7
+            ):
+                token_count += 1
+                yield StreamChunk(
+                    type="chunk",
+                    content=token,
+                    idea_id=idea_id,
+                    progress=min(0.99, token_count / max_tokens)
+                )
             
-            if full_text:
-                # Teile Text in Chunks auf
-                chunks = [full_text[i:i+50] for i in range(0, len(full_text), 50)]
-                
-                for i, chunk in enumerate(chunks):
-                    progress = (i + 1) / len(chunks)
-                    yield StreamChunk(
-                        type="chunk",
-                        content=chunk,
-                        idea_id=idea_id,
-                        progress=progress
-                    )
-                    await asyncio.sleep(0.1)  # Simuliere Streaming-Delay
-            else:
+            if not token_count:
                 raise Exception("Keine Textgenerierung erhalten")
         else:
             # Mock-Streaming
@@ -528,6 +536,7 @@ async def generate_batch_ideas(requests: List[Dict[str, Any]], parallel: bool =
 
 async def generate_with_model(prompt: str, category: str, language: str, 
                              creativity_level: int, model_key: Optional[str] = None,
+                             http_request: Optional[Request] = None,
                              **kwargs) -> dict:
     """Generiere Idee mit spezifischem oder aktuellem Modell"""
     
@@ -541,10 +550,20 @@ async def generate_with_model(prompt: str, category: str, language: str,
         available = model_manager.get_available_models()
         if available:
             target_model = available[0]
-            await model_manager.load_model(target_model)
         else:
             return generate_mock_idea(prompt, category, language, creativity_level)
     
+    # Cache vor dem Modell prüfen (nur bei niedriger Kreativität)
+    cache_params = {
+        "max_tokens": kwargs.get("max_tokens"),
+        "temperature": kwargs.get("temperature")
+    }
+    cached = generation_cache.get(
+        prompt, category, language, creativity_level, target_model, **cache_params
+    )
+    if cached:
+        return cached
+    
     # Wechsle zu Modell falls nötig
     if target_model != model_manager.get_current_model():
         success = await model_manager.load_model(target_model)
@@ -561,10 +580,11 @@ async def generate_with_model(prompt: str, category: str, language: str,
             "max_tokens": kwargs.get("max_tokens", 512)
         }
         
-        # Text generieren
-        generated_text = model_manager.generate_text(
+        # Text generieren (im Inference-Pool, Event-Loop bleibt frei)
+        generated_text = await model_manager.generate_text_async(
             formatted_prompt,
             model_key=target_model,
+            is_disconnected=http_request.is_disconnected if http_request else None,
             **generation_params
         )
         
@@ -580,13 +600,23 @@ async def generate_with_model(prompt: str, category: str, language: str,
         if title.startswith(('Titel:', 'Title:', 'Titolo:')):
             title = title.split(':', 1)[1].strip()
         
-        return {
+        result = {
             "title": title[:200],
             "content": content[:2000],
             "generation_method": f"model_{target_model}",
             "model_used": target_model
         }
+        generation_cache.put(
+            prompt, category, language, creativity_level, target_model, result, **cache_params
+        )
+        return result
         
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except InferenceTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except InferenceCancelled:
+        raise
     except Exception as e:
         logger.error(f"❌ Fehler bei Modell-Generierung: {e}")
         return generate_mock_idea(prompt, category, language, creativity_level)
@@ -806,7 +836,7 @@ async def generate_batch_ideas_endpoint(request: BatchIdeaRequest):
     # Speichere erfolgreiche Ideen in Datenbank
     if result.ideas:
         try:
-            conn = sqlite3.connect(str(db_path))
+            conn = get_connection(str(db_path))
             cursor = conn.cursor()
             
             for idea in result.ideas:
@@ -829,7 +859,7 @@ async def generate_batch_ideas_endpoint(request: BatchIdeaRequest):
 
 
 @app.post("/api/v1/generate", response_model=IdeaResponse)
-async def generate_idea(request: IdeaRequest):
+async def generate_idea(request: IdeaRequest, http_request: Request = None):
     """Generiere neue Idee"""
     try:
         idea_data = await generate_with_model(
@@ -838,6 +868,7 @@ async def generate_idea(request: IdeaRequest):
             request.language,
             request.creativity_level,
             request.model,
+            http_request=http_request,
             max_tokens=request.max_tokens,
             temperature=request.temperature
         )
@@ -846,7 +877,7 @@ async def generate_idea(request: IdeaRequest):
         idea_id = str(uuid.uuid4())
         created_at = datetime.now().isoformat()
         
-        conn = sqlite3.connect(str(db_path))
+        conn = get_connection(str(db_path))
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -871,13 +902,18 @@ async def generate_idea(request: IdeaRequest):
             model_used=idea_data["model_used"]
         )
         
+    except HTTPException:
+        raise
+    except InferenceCancelled:
+        logger.info("ℹ️  Ideengenerierung abgebrochen - Client getrennt")
+        raise HTTPException(status_code=499, detail="Client getrennt")
     except Exception as e:
         logger.error(f"❌ Fehler bei Ideengenerierung: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/v1/random", response_model=IdeaResponse)
-async def generate_random_idea(request: RandomIdeaRequest):
+async def generate_random_idea(request: RandomIdeaRequest, http_request: Request = None):
     """Generiere zufällige Idee"""
     random_prompts = [
         "Zukunft der Arbeit", "Nachhaltigkeit", "Künstliche Intelligenz",
@@ -895,14 +931,14 @@ async def generate_random_idea(request: RandomIdeaRequest):
         model=request.model
     )
     
-    return await generate_idea(idea_request)
+    return await generate_idea(idea_request, http_request)
 
 
 @app.get("/api/v1/ideas", response_model=List[IdeaResponse])
 async def get_all_ideas():
     """Hole alle gespeicherten Ideen"""
     try:
-        conn = sqlite3.connect(str(db_path))
+        conn = get_connection(str(db_path))
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -937,7 +973,7 @@ async def get_all_ideas():
 async def get_stats():
     """Hole erweiterte Statistiken"""
     try:
-        conn = sqlite3.connect(str(db_path))
+        conn = get_connection(str(db_path))
         cursor = conn.cursor()
         
         # Basis-Statistiken
@@ -990,7 +1026,8 @@ async def get_stats():
             recent_activity=recent_activity,
             model_stats=model_stats,
             streaming_stats=streaming_stats,
-            batch_stats=batch_stats
+            batch_stats=batch_stats,
+            cache_stats=generation_cache.get_statistics()
         )
         
     except Exception as e:
@@ -1006,7 +1043,7 @@ async def rate_idea(idea_id: str, rating_data: dict):
         if not rating or not isinstance(rating, int) or rating < 1 or rating > 5:
             raise HTTPException(status_code=400, detail="Rating muss zwischen 1 und 5 liegen")
         
-        conn = sqlite3.connect(str(db_path))
+        conn = get_connection(str(db_path))
         cursor = conn.cursor()
         
         # Überprüfe, ob die Idee existiert
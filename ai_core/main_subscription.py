@@ -20,6 +20,10 @@ from dotenv import load_dotenv
 
 # Import locali
 from model_manager import ModelManager
+from inference_executor import InferenceQueueFull, InferenceTimeout, InferenceCancelled
+from generation_cache import generation_cache
+from cpu_pool import password_pool
+from db_pool import get_connection, close_all as close_db_connections
 from auth_service import (
     AuthService, User, SubscriptionTier,
     get_current_user, check_user_limits, auth_service
@@ -35,6 +39,7 @@ from admin_service import AdminService, FeatureFlagUpdate, UserOverrideCreate
 from feature_flags_service import init_feature_flags_service, get_feature_flags_service
 from feature_middleware import (
     require_feature, check_feature_access, get_user_features, FeatureGates,
+    AccessContext, check_access_limits,
     require_ai_model_selection, require_advanced_analytics, require_bulk_generation,
     require_export_formats, require_api_access
 )
@@ -160,7 +165,11 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("🛑 Spegnimento backend...")
     if model_manager:
-        model_manager.unload_current_model()
+        model_manager.cleanup()
+    rate_limiter.shutdown()
+    auth_service.shutdown()
+    password_pool.shutdown()
+    close_db_connections()
 
 
 # ============================================================================
@@ -393,7 +402,7 @@ async def reset_password(request: ResetPasswordRequest):
     """Reset password con token"""
     try:
         # Verifica token e reset password
-        success = auth_service.reset_password(request.token, request.new_password)
+        success = await auth_service.reset_password(request.token, request.new_password)
         
         if success:
             return {
@@ -420,9 +429,9 @@ async def reset_password(request: ResetPasswordRequest):
 async def get_profile(current_user: User = Depends(get_current_user)):
     """Profilo utente corrente"""
     try:
-        # Ottieni statistiche usage
-        import sqlite3
-        with sqlite3.connect(auth_service.db_path) as conn:
+        # Ottieni statistiche usage (incrementi in sospeso inclusi)
+        auth_service.usage.flush()
+        with get_connection(auth_service.db_path) as conn:
             cursor = conn.cursor()
             
             # Usage oggi
@@ -476,8 +485,7 @@ async def get_subscription_info(current_user: User = Depends(get_current_user)):
     """Informazioni abbonamento corrente"""
     try:
         # Leggi sempre il tier aggiornato dal database
-        import sqlite3
-        with sqlite3.connect(auth_service.db_path) as conn:
+        with get_connection(auth_service.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT subscription_tier FROM users WHERE id = ?", (current_user.id,))
             result = cursor.fetchone()
@@ -486,28 +494,7 @@ async def get_subscription_info(current_user: User = Depends(get_current_user)):
         limits = auth_service.get_subscription_limits(current_tier)
         
         # Calcola usage corrente
-        import sqlite3
-        with sqlite3.connect(auth_service.db_path) as conn:
-            cursor = conn.cursor()
-            
-            today = datetime.now().date()
-            cursor.execute("""
-                SELECT ideas_generated FROM user_usage
-                WHERE user_id = ? AND date = ?
-            """, (current_user.id, today))
-            
-            daily_usage = cursor.fetchone()
-            daily_ideas = daily_usage[0] if daily_usage else 0
-            
-            # Usage mensile
-            month_start = today.replace(day=1)
-            cursor.execute("""
-                SELECT SUM(ideas_generated) FROM user_usage
-                WHERE user_id = ? AND date >= ?
-            """, (current_user.id, month_start))
-            
-            monthly_usage = cursor.fetchone()
-            monthly_ideas = monthly_usage[0] if monthly_usage and monthly_usage[0] else 0
+        daily_ideas, monthly_ideas = auth_service.usage.get_usage(current_user.id)
         
         return {
             "tier": current_tier,
@@ -538,7 +525,8 @@ async def get_subscription_info(current_user: User = Depends(get_current_user)):
 @app.post("/api/v1/generate")
 async def generate_custom_idea(
     request: IdeaRequest,
-    current_user: User = Depends(check_user_limits)
+    current_user: User = Depends(check_user_limits),
+    http_request: Request = None
 ):
     """Genera idea personalizzata (richiede autenticazione)"""
     try:
@@ -559,6 +547,7 @@ async def generate_custom_idea(
             language=request.language,
             creativity_level=request.creativity_level,
             model_key=request.model,
+            http_request=http_request,
             max_tokens=request.max_tokens,
             temperature=request.temperature
         )
@@ -566,8 +555,7 @@ async def generate_custom_idea(
         # Salva nel database con user_id
         idea_uuid = str(uuid.uuid4())
         
-        import sqlite3
-        with sqlite3.connect(auth_service.db_path) as conn:
+        with get_connection(auth_service.db_path) as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -600,6 +588,9 @@ async def generate_custom_idea(
         
     except HTTPException:
         raise
+    except InferenceCancelled:
+        logger.info("ℹ️ Generazione annullata - client disconnesso")
+        raise HTTPException(status_code=499, detail="Client disconnesso")
     except Exception as e:
         logger.error(f"❌ Errore generate_custom_idea: {e}")
         raise HTTPException(
@@ -613,7 +604,8 @@ async def generate_random_idea(
     category: str = "general",
     language: str = "it",
     model: Optional[str] = None,
-    current_user: User = Depends(check_user_limits)
+    current_user: User = Depends(check_user_limits),
+    http_request: Request = None
 ):
     """Genera idea casuale (richiede autenticazione)"""
     try:
@@ -651,7 +643,7 @@ async def generate_random_idea(
             creativity_level=random.randint(6, 9)
         )
         
-        return await generate_custom_idea(request, current_user)
+        return await generate_custom_idea(request, current_user, http_request)
         
     except HTTPException:
         raise
@@ -675,8 +667,7 @@ async def get_user_ideas(
 ):
     """Ottieni idee dell'utente"""
     try:
-        import sqlite3
-        with sqlite3.connect(auth_service.db_path) as conn:
+        with get_connection(auth_service.db_path) as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -718,6 +709,7 @@ async def get_user_ideas(
 
 async def generate_with_model(prompt: str, category: str, language: str, 
                              creativity_level: int, model_key: Optional[str] = None,
+                             http_request: Optional[Request] = None,
                              **kwargs) -> dict:
     """Genera idea con modello specificato"""
     
@@ -733,15 +725,32 @@ async def generate_with_model(prompt: str, category: str, language: str,
             target_model = available[0]
         else:
             return generate_mock_idea(prompt, category, language, creativity_level)
-    
+
+    # Controlla la cache prima del modello (solo bassa creatività)
+    cache_params = {
+        "max_tokens": kwargs.get("max_tokens"),
+        "temperature": kwargs.get("temperature")
+    }
+    cached = generation_cache.get(
+        prompt, category, language, creativity_level, target_model, **cache_params
+    )
+    if cached:
+        return cached
+
+    # Carica il modello nel pool se non è già residente
+    if target_model != "mock" and target_model not in model_manager.models:
+        if not await model_manager.load_model(target_model):
+            return generate_mock_idea(prompt, category, language, creativity_level)
+
     try:
         # Crea prompt ottimizzato
         formatted_prompt = create_optimized_prompt(prompt, category, language, creativity_level)
         
-        # Genera testo
-        generated_text = model_manager.generate_text(
+        # Genera testo (nel pool di inferenza, senza bloccare l'event loop)
+        generated_text = await model_manager.generate_text_async(
             formatted_prompt,
             model_key=target_model,
+            is_disconnected=http_request.is_disconnected if http_request else None,
             temperature=kwargs.get("temperature", 0.3 + (creativity_level / 10) * 0.7),
             max_tokens=kwargs.get("max_tokens", 512)
         )
@@ -758,13 +767,23 @@ async def generate_with_model(prompt: str, category: str, language: str,
         if title.startswith(('Titel:', 'Title:', 'Titolo:')):
             title = title.split(':', 1)[1].strip()
         
-        return {
+        result = {
             "title": title[:200],
             "content": content[:2000],
             "generation_method": f"model_{target_model}",
             "model_used": target_model
         }
+        generation_cache.put(
+            prompt, category, language, creativity_level, target_model, result, **cache_params
+        )
+        return result
         
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except InferenceTimeout as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+    except InferenceCancelled:
+        raise
     except Exception as e:
         logger.error(f"❌ Errore generazione modello: {e}")
         return generate_mock_idea(prompt, category, language, creativity_level)
@@ -864,8 +883,7 @@ async def upgrade_subscription(
             )
         
         # Aggiorna nel database
-        import sqlite3
-        with sqlite3.connect(auth_service.db_path) as conn:
+        with get_connection(auth_service.db_path) as conn:
             cursor = conn.cursor()
             
             # Aggiorna il tier dell'utente
@@ -890,6 +908,8 @@ async def upgrade_subscription(
             
             conn.commit()
         
+        auth_service.invalidate_user(current_user.id)
+        
         # Aggiorna l'oggetto user corrente
         current_user.subscription_tier = request.new_tier
         
@@ -1068,7 +1088,8 @@ async def health_check():
         "features": ["authentication", "subscriptions", "usage_limits"],
         "model_manager": model_manager is not None,
         "model_status": model_status,
-        "available_models": model_manager.get_available_models() if model_manager else []
+        "available_models": model_manager.get_available_models() if model_manager else [],
+        "password_pool": password_pool.get_statistics()
     }
 
 
@@ -1094,9 +1115,10 @@ async def bulk_generate_ideas(
     prompts: List[str],
     category: str = "general",
     language: str = "it",
-    current_user: User = Depends(check_user_limits)
+    access: AccessContext = Depends(check_access_limits)
 ):
     """Generiert mehrere Ideen in einem Request (Pro/Enterprise Feature)"""
+    current_user = access.user
     try:
         # Feature-Konfiguration holen
         feature_service = get_feature_flags_service()
@@ -1121,8 +1143,7 @@ async def bulk_generate_ideas(
             
             # Speichere in Datenbank
             idea_uuid = str(uuid.uuid4())
-            import sqlite3
-            with sqlite3.connect(auth_service.db_path) as conn:
+            with get_connection(auth_service.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO ideas (uuid, user_id, title, content, category,
@@ -1145,8 +1166,7 @@ async def bulk_generate_ideas(
             })
         
         # Tracke Usage für alle generierten Ideen
-        for _ in prompts:
-            await auth_service.track_usage(current_user, "generate_idea")
+        await auth_service.track_usage(current_user, "generate_idea", count=len(prompts))
         
         return {"ideas": ideas, "count": len(ideas)}
         
@@ -1165,8 +1185,7 @@ async def bulk_generate_ideas(
 async def get_advanced_analytics(current_user: User = Depends(get_current_user)):
     """Erweiterte Analytics (Enterprise Feature)"""
     try:
-        import sqlite3
-        with sqlite3.connect(auth_service.db_path) as conn:
+        with get_connection(auth_service.db_path) as conn:
             cursor = conn.cursor()
             
             # Detaillierte Statistiken
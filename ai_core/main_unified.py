@@ -30,6 +30,7 @@ from model_manager import ModelManager
 from rate_limiter import rate_limiter
 from feature_flags_service import init_feature_flags_service
 from training_service import training_service
+from db_pool import close_all as close_db_connections
 
 # Import modelli
 from models.api_models import HealthCheckResponse, WebSocketMessage
@@ -108,6 +109,7 @@ async def lifespan(app: FastAPI):
         cache_dir = os.getenv("MODEL_CACHE_DIR", "../models")
         
         model_manager = ModelManager(cache_dir=cache_dir, hf_token=hf_token)
+        app.state.model_manager = model_manager
         
         available_models = model_manager.get_available_models()
         if available_models:
@@ -120,6 +122,8 @@ async def lifespan(app: FastAPI):
         # 5. Inizializza Training Service
         logger.info("🎓 Inizializzazione Training Service...")
         # training_service è già inizializzato come singleton
+        training_service.recover_jobs()
+        training_service.recover_profiles()
         
         # 6. Log startup event
         if audit_logger:
@@ -169,18 +173,28 @@ async def lifespan(app: FastAPI):
                     pass
             active_websockets.clear()
             
-            # Shutdown model manager
+            # Shutdown model manager (scheduler, pool di inferenza, tutti i modelli)
             if model_manager:
-                model_manager.unload_current_model()
+                model_manager.cleanup()
             
             # Shutdown security components
             if session_manager:
                 session_manager.shutdown()
             if key_manager:
                 key_manager.shutdown()
+            if crypto_manager:
+                crypto_manager.flush_crypto_events()
             if audit_logger:
                 audit_logger.shutdown()
             
+            # Scrivi su SQLite rate limiting e utilizzo in sospeso
+            rate_limiter.shutdown()
+            auth_service.shutdown()
+            training_service.shutdown()
+            
+            # Chiudi connessioni SQLite del pool
+            close_db_connections()
+            
             logger.info("✅ Shutdown completato")
             
         except Exception as e:
@@ -354,6 +368,11 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         while True:
             try:
                 data = await websocket.receive_json()
+                
+                if data.get("type") == "stream_idea":
+                    await stream_idea_to_websocket(websocket, data)
+                    continue
+                
                 response = await process_websocket_message(data, session_id)
                 
                 if response:
@@ -387,6 +406,35 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             )
 
 
+async def stream_idea_to_websocket(
+    websocket: WebSocket,
+    data: Dict[str, Any]
+):
+    """Invia i token dell'idea al client man mano che vengono generati"""
+    prompt = data.get("prompt", "")
+    if not model_manager or not prompt:
+        await websocket.send_json({
+            "type": "error",
+            "data": {"error": "Prompt mancante o servizio AI non disponibile"}
+        })
+        return
+    
+    async for event in model_manager.stream_generate_idea(
+        prompt=prompt,
+        model=data.get("model"),
+        category=data.get("category", "general"),
+        creativity_level=data.get("creativity_level", 5),
+        language=data.get("language", "it")
+    ):
+        if event["type"] == "chunk":
+            await websocket.send_json({
+                "type": "idea_chunk",
+                "data": {"content": event["content"]}
+            })
+        elif event["type"] == "complete":
+            await websocket.send_json({"type": "idea_complete", "data": event})
+
+
 async def process_websocket_message(
     data: Dict[str, Any], 
     session_id: str
@@ -401,16 +449,6 @@ async def process_websocket_message(
                 "timestamp": str(asyncio.get_event_loop().time())
             }
         
-        elif message_type == "stream_idea":
-            # Streaming idea generation
-            prompt = data.get("prompt", "")
-            if model_manager and prompt:
-                # TODO: implementa streaming generation
-                return {
-                    "type": "idea_chunk",
-                    "data": {"content": f"Idea per: {prompt}"}
-                }
-        
         elif message_type == "get_status":
             # Status sistema
             return {
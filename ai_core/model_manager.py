@@ -5,16 +5,24 @@ Verwaltet mehrere AI-Modelle und ermöglicht dynamisches Wechseln zwischen ihnen
 """
 
 import os
+import asyncio
 import logging
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Callable, Awaitable, AsyncGenerator
 from dataclasses import dataclass
 from enum import Enum
 import json
+import re
+
+from batch_scheduler import BatchScheduler
+from inference_executor import InferenceExecutor
 
 try:
     import torch
     from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+    from transformers import TextStreamer, StoppingCriteria, StoppingCriteriaList
     HAS_TRANSFORMERS = True
 except ImportError:
     HAS_TRANSFORMERS = False
@@ -22,6 +30,32 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+if HAS_TRANSFORMERS:
+    class AsyncTextStreamer(TextStreamer):
+        """Leitet dekodierte Textstücke aus dem Generierungs-Thread an eine asyncio.Queue"""
+        
+        def __init__(self, tokenizer, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue,
+                     **decode_kwargs):
+            super().__init__(tokenizer, skip_prompt=True, **decode_kwargs)
+            self.loop = loop
+            self.queue = queue
+        
+        def on_finalized_text(self, text: str, stream_end: bool = False):
+            if text:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+            if stream_end:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+    
+    class StopOnEvent(StoppingCriteria):
+        """Bricht die Generierung ab, sobald das Event gesetzt ist"""
+        
+        def __init__(self, event: threading.Event):
+            self.event = event
+        
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            return self.event.is_set()
+
+
 class ModelStatus(Enum):
     """Status eines Modells"""
     NOT_LOADED = "not_loaded"
@@ -44,21 +78,35 @@ class ModelConfig:
     temperature: float = 0.7
     top_p: float = 0.9
     device_preference: str = "auto"  # auto, cpu, cuda
+    inference_workers: int = 1  # Threads im Inference-Pool
 
 
 class ModelManager:
     """Manager für mehrere AI-Modelle"""
     
-    def __init__(self, cache_dir: Optional[str] = None, hf_token: Optional[str] = None):
+    def __init__(self, cache_dir: Optional[str] = None, hf_token: Optional[str] = None,
+                 memory_budget_gb: Optional[float] = None):
         self.cache_dir = Path(cache_dir or "./models")
         self.hf_token = hf_token
-        self.models: Dict[str, Any] = {}
+        # Residenz-Pool: Reihenfolge = LRU (ältestes zuerst)
+        self.models: "OrderedDict[str, Any]" = OrderedDict()
         self.tokenizers: Dict[str, Any] = {}
         self.pipelines: Dict[str, Any] = {}
         self.model_configs: Dict[str, ModelConfig] = {}
         self.model_status: Dict[str, ModelStatus] = {}
         self.current_model: Optional[str] = None
         
+        # Speicherbudget für gleichzeitig geladene Modelle (Schätzung via size_gb)
+        if memory_budget_gb is None:
+            memory_budget_gb = float(os.getenv("MAX_MEMORY_GB", "8"))
+        self.memory_budget_gb = memory_budget_gb
+        self._pool_lock = threading.RLock()
+        self._load_lock = asyncio.Lock()
+        
+        # Inference-Pools pro Modell und Batch-Scheduler
+        self.executor = InferenceExecutor()
+        self.scheduler = BatchScheduler(self)
+        
         # Lade verfügbare Modell-Konfigurationen
         self._load_model_configs()
         
@@ -103,7 +151,8 @@ class ModelManager:
                 max_tokens=256,
                 temperature=0.8,
                 top_p=0.9,
-                device_preference="cpu"
+                device_preference="cpu",
+                inference_workers=2
             ),
             ModelConfig(
                 key="microsoft-dialoGPT-large",
@@ -188,49 +237,121 @@ class ModelManager:
         return [self.get_model_info(key) for key in self.model_configs.keys()]
     
     async def load_model(self, model_key: str, force_reload: bool = False) -> bool:
-        """Simuliere Modell-Laden (Speichermangel-Schutz)"""
+        """Lade ein Modell in den Residenz-Pool (LRU, speicherbudgetiert)"""
         if model_key not in self.model_configs:
             logger.error(f"❌ Unbekanntes Modell: {model_key}")
             return False
         
-        # Prüfe ob bereits "geladen"
-        if model_key in self.models and not force_reload:
-            logger.info(f"✅ Modell bereits aktiv: {model_key}")
-            self.current_model = model_key
-            return True
-        
-        config = self.model_configs[model_key]
-        model_path = self.cache_dir / config.model_path
-        
-        if not model_path.exists():
-            logger.error(f"❌ Modell nicht gefunden: {model_path}")
-            logger.info(f"💡 Verwenden Sie: python scripts/download_models.py --download {model_key}")
-            return False
-        
-        try:
-            self.model_status[model_key] = ModelStatus.LOADING
-            logger.info(f"🤖 Simuliere Modell-Laden: {config.name}")
-            logger.info(f"💡 Tatsächliches Laden übersprungen (Speichermangel-Schutz)")
+        async with self._load_lock:
+            # Prüfe ob bereits geladen
+            if model_key in self.models and not force_reload:
+                logger.info(f"✅ Modell bereits aktiv: {model_key}")
+                self._touch(model_key)
+                self.current_model = model_key
+                return True
             
-            # Simuliere erfolgreiches Laden ohne echtes Modell
-            self.models[model_key] = {
-                'model': None,  # Kein echtes Modell
-                'tokenizer': None,  # Kein echter Tokenizer
-                'pipeline': None,  # Keine echte Pipeline
-                'config': config,
-                'simulated': True  # Markiere als simuliert
-            }
+            config = self.model_configs[model_key]
+            model_path = self.cache_dir / config.model_path
             
-            self.model_status[model_key] = ModelStatus.LOADED
-            self.current_model = model_key
+            if not model_path.exists():
+                logger.error(f"❌ Modell nicht gefunden: {model_path}")
+                logger.info(f"💡 Verwenden Sie: python scripts/download_models.py --download {model_key}")
+                return False
             
-            logger.info(f"✅ Modell-Status erfolgreich gesetzt: {model_key}")
-            return True
+            if not HAS_TRANSFORMERS:
+                logger.error("❌ Transformers nicht installiert - Modell kann nicht geladen werden")
+                return False
             
-        except Exception as e:
-            logger.error(f"❌ Fehler beim Setzen des Modell-Status {model_key}: {e}")
-            self.model_status[model_key] = ModelStatus.ERROR
-            return False
+            if config.size_gb > self.memory_budget_gb:
+                logger.error(
+                    f"❌ Modell {model_key} ({config.size_gb}GB) überschreitet "
+                    f"das Speicherbudget ({self.memory_budget_gb}GB)"
+                )
+                return False
+            
+            if force_reload:
+                self.unload_model(model_key)
+            
+            try:
+                self.model_status[model_key] = ModelStatus.LOADING
+                self._evict_for(config.size_gb)
+                
+                logger.info(f"🤖 Lade Modell: {config.name} aus {model_path}")
+                entry = await asyncio.to_thread(self._load_model_sync, config, model_path)
+                
+                with self._pool_lock:
+                    self.models[model_key] = entry
+                    self.tokenizers[model_key] = entry['tokenizer']
+                    self.pipelines[model_key] = entry['pipeline']
+                self.executor.configure_model(model_key, config.inference_workers)
+                
+                self.model_status[model_key] = ModelStatus.LOADED
+                self.current_model = model_key
+                
+                logger.info(
+                    f"✅ Modell geladen: {model_key} "
+                    f"({self._resident_gb():.1f}GB / {self.memory_budget_gb}GB belegt)"
+                )
+                return True
+                
+            except Exception as e:
+                logger.error(f"❌ Fehler beim Laden des Modells {model_key}: {e}")
+                self.model_status[model_key] = ModelStatus.ERROR
+                return False
+    
+    def _load_model_sync(self, config: ModelConfig, model_path: Path) -> Dict[str, Any]:
+        """Lade Tokenizer, Modell und Pipeline (blockierend)"""
+        device = self._determine_device(config.device_preference)
+        dtype = torch.float16 if device == "cuda" else torch.float32
+        
+        tokenizer = AutoTokenizer.from_pretrained(str(model_path), token=self.hf_token)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # Decoder-only Modelle müssen für Batches links gepaddet werden
+        tokenizer.padding_side = "left"
+        
+        model = AutoModelForCausalLM.from_pretrained(
+            str(model_path),
+            token=self.hf_token,
+            torch_dtype=dtype,
+            low_cpu_mem_usage=True
+        )
+        model.to(device)
+        model.eval()
+        
+        text_pipeline = pipeline(
+            "text-generation",
+            model=model,
+            tokenizer=tokenizer,
+            device=0 if device == "cuda" else -1
+        )
+        
+        return {
+            'model': model,
+            'tokenizer': tokenizer,
+            'pipeline': text_pipeline,
+            'config': config,
+            'device': device
+        }
+    
+    def _resident_gb(self) -> float:
+        """Geschätzter Speicherbedarf aller geladenen Modelle"""
+        with self._pool_lock:
+            return sum(self.model_configs[key].size_gb for key in self.models)
+    
+    def _touch(self, model_key: str):
+        """Markiere ein Modell als zuletzt verwendet"""
+        with self._pool_lock:
+            if model_key in self.models:
+                self.models.move_to_end(model_key)
+    
+    def _evict_for(self, required_gb: float):
+        """Entlade LRU-Modelle bis das neue Modell ins Budget passt"""
+        while self.models and self._resident_gb() + required_gb > self.memory_budget_gb:
+            with self._pool_lock:
+                lru_key = next(iter(self.models))
+            logger.info(f"♻️  Verdränge LRU-Modell: {lru_key}")
+            self.unload_model(lru_key)
     
     def unload_current_model(self) -> bool:
         """Deaktiviere das aktuelle Modell"""
@@ -238,24 +359,9 @@ class ModelManager:
             logger.info("ℹ️  Kein Modell aktiv - nichts zu deaktivieren")
             return True
         
-        try:
-            model_key = self.current_model
-            logger.info(f"🔄 Deaktiviere Modell: {model_key}")
-            
-            # Entferne das Modell aus dem Speicher
-            if model_key in self.models:
-                del self.models[model_key]
-            
-            # Setze Status zurück
-            self.model_status[model_key] = ModelStatus.NOT_LOADED
-            self.current_model = None
-            
-            logger.info(f"✅ Modell erfolgreich deaktiviert: {model_key}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Fehler beim Deaktivieren des Modells: {e}")
-            return False
+        model_key = self.current_model
+        logger.info(f"🔄 Deaktiviere Modell: {model_key}")
+        return self.unload_model(model_key)
     
     def _determine_device(self, preference: str) -> str:
         """Bestimme das beste verfügbare Device"""
@@ -275,12 +381,10 @@ class ModelManager:
         
         try:
             # Cleanup
-            if model_key in self.pipelines:
-                del self.pipelines[model_key]
-            if model_key in self.models:
-                del self.models[model_key]
-            if model_key in self.tokenizers:
-                del self.tokenizers[model_key]
+            with self._pool_lock:
+                self.pipelines.pop(model_key, None)
+                self.models.pop(model_key, None)
+                self.tokenizers.pop(model_key, None)
             
             self.model_status[model_key] = ModelStatus.NOT_LOADED
             
@@ -288,7 +392,7 @@ class ModelManager:
                 self.current_model = None
             
             # GPU Memory cleanup
-            if torch.cuda.is_available():
+            if HAS_TRANSFORMERS and torch.cuda.is_available():
                 torch.cuda.empty_cache()
             
             logger.info(f"✅ Modell entladen: {model_key}")
@@ -316,40 +420,170 @@ class ModelManager:
         """Hole aktuelles Modell"""
         return self.current_model
     
+    def _generation_params(self, model_key: str, **kwargs) -> Dict[str, Any]:
+        """Parameter aus Konfiguration mit Overrides (None = Standardwert)"""
+        config = self.model_configs[model_key]
+        tokenizer = self.tokenizers[model_key]
+        overrides = {key: value for key, value in kwargs.items() if value is not None}
+        
+        return {
+            "max_new_tokens": overrides.get("max_tokens", config.max_tokens),
+            "temperature": overrides.get("temperature", config.temperature),
+            "top_p": overrides.get("top_p", config.top_p),
+            "do_sample": True,
+            "pad_token_id": tokenizer.eos_token_id,
+            "eos_token_id": tokenizer.eos_token_id,
+            "return_full_text": False
+        }
+    
     def generate_text(self, prompt: str, model_key: Optional[str] = None, **kwargs) -> Optional[str]:
         """Generiere Text mit dem aktuellen oder spezifizierten Modell"""
+        return self.generate_text_batch([prompt], model_key, **kwargs)[0]
+    
+    def generate_text_batch(self, prompts: List[str], model_key: Optional[str] = None,
+                            **kwargs) -> List[Optional[str]]:
+        """Generiere Texte für mehrere Prompts in einem gepaddeten Batch"""
         target_model = model_key or self.current_model
         
         # Spezielle Behandlung für Mock-Modell
         if target_model == "mock":
-            return self._generate_mock_text(prompt, **kwargs)
+            return [self._generate_mock_text(prompt, **kwargs) for prompt in prompts]
         
         if not target_model or target_model not in self.pipelines:
             logger.error(f"❌ Modell nicht verfügbar: {target_model}")
-            return None
+            return [None] * len(prompts)
         
         try:
-            config = self.model_configs[target_model]
             pipeline_obj = self.pipelines[target_model]
+            self._touch(target_model)
             
-            # Parameter aus Konfiguration mit Overrides
-            generation_params = {
-                "max_new_tokens": kwargs.get("max_tokens", config.max_tokens),
-                "temperature": kwargs.get("temperature", config.temperature),
-                "top_p": kwargs.get("top_p", config.top_p),
-                "do_sample": True,
-                "pad_token_id": self.tokenizers[target_model].eos_token_id,
-                "eos_token_id": self.tokenizers[target_model].eos_token_id,
-                "return_full_text": False
-            }
+            generation_params = self._generation_params(target_model, **kwargs)
             
             # Text generieren
-            result = pipeline_obj(prompt, **generation_params)
-            return result[0]['generated_text'].strip()
+            results = pipeline_obj(prompts, batch_size=len(prompts), **generation_params)
+            return [result[0]['generated_text'].strip() for result in results]
             
         except Exception as e:
             logger.error(f"❌ Fehler bei Textgenerierung: {e}")
+            return [None] * len(prompts)
+    
+    async def generate_text_async(self, prompt: str, model_key: Optional[str] = None,
+                                  timeout: Optional[float] = None,
+                                  is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+                                  **kwargs) -> Optional[str]:
+        """Generiere Text über Batch-Scheduler und Inference-Pool (nicht blockierend)
+        
+        Wirft InferenceQueueFull, InferenceTimeout oder InferenceCancelled.
+        """
+        target_model = model_key or self.current_model
+        
+        if target_model == "mock":
+            return self._generate_mock_text(prompt, **kwargs)
+        
+        if not target_model or target_model not in self.pipelines:
+            logger.error(f"❌ Modell nicht verfügbar: {target_model}")
             return None
+        
+        return await self.executor.execute(
+            target_model,
+            self.scheduler.submit(prompt, target_model, **kwargs),
+            timeout=timeout,
+            is_disconnected=is_disconnected
+        )
+    
+    async def stream_text(self, prompt: str, model_key: Optional[str] = None,
+                          timeout: Optional[float] = None,
+                          **kwargs) -> AsyncGenerator[str, None]:
+        """Streame Text tokenweise, während das Modell dekodiert
+        
+        Läuft wie generate_text_async durch die Admission-Control des
+        Executors; wirft InferenceQueueFull oder InferenceTimeout.
+        """
+        target_model = model_key or self.current_model
+        
+        if target_model == "mock":
+            for piece in re.findall(r"\S+\s*", self._generate_mock_text(prompt, **kwargs)):
+                yield piece
+            return
+        
+        if not target_model or target_model not in self.models:
+            logger.error(f"❌ Modell nicht verfügbar: {target_model}")
+            return
+        
+        entry = self.models[target_model]
+        tokenizer = entry['tokenizer']
+        self._touch(target_model)
+        
+        generation_params = self._generation_params(target_model, **kwargs)
+        generation_params.pop("return_full_text")
+        
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop_event = threading.Event()
+        streamer = AsyncTextStreamer(tokenizer, loop, queue, skip_special_tokens=True)
+        inputs = tokenizer(prompt, return_tensors="pt").to(entry['device'])
+        
+        generation = asyncio.ensure_future(self.executor.execute(
+            target_model,
+            self.executor.run(
+                target_model,
+                entry['model'].generate,
+                **inputs,
+                streamer=streamer,
+                stopping_criteria=StoppingCriteriaList([StopOnEvent(stop_event)]),
+                **generation_params
+            ),
+            timeout=timeout
+        ))
+        # Bei Fehlern im Thread ruft der Streamer end() nie auf
+        generation.add_done_callback(lambda _: queue.put_nowait(None))
+        
+        try:
+            while True:
+                text = await queue.get()
+                if text is None:
+                    break
+                yield text
+            
+            await generation
+            
+        finally:
+            # Client weg, Timeout oder fertig: Generierung beim nächsten Schritt stoppen
+            stop_event.set()
+    
+    async def stream_generate_idea(self, prompt: str, model: Optional[str] = None,
+                                   category: str = "general", creativity_level: int = 5,
+                                   language: str = "it", user_id: Optional[str] = None
+                                   ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Streame eine Idee als Folge von start/chunk/complete Events"""
+        target_model = model or self.current_model
+        
+        if not target_model:
+            available = self.get_available_models()
+            target_model = available[0] if available else "mock"
+        
+        if target_model != "mock" and target_model not in self.models:
+            if not await self.load_model(target_model):
+                target_model = "mock"
+        
+        formatted_prompt = (
+            f"Generate a creative idea for '{category}' based on: '{prompt}'. "
+            f"Creativity level: {creativity_level}/10. Language: {language}. "
+            f"Respond with title and detailed description."
+        )
+        
+        yield {"type": "start", "model": target_model}
+        
+        token_count = 0
+        async for text in self.stream_text(
+            formatted_prompt,
+            model_key=target_model,
+            temperature=0.3 + (creativity_level / 10) * 0.7
+        ):
+            token_count += 1
+            yield {"type": "chunk", "content": text}
+        
+        yield {"type": "complete", "model": target_model, "chunks": token_count}
     
     def _generate_mock_text(self, prompt: str, **kwargs) -> str:
         """Generiere Mock-Text für Tests"""
@@ -370,7 +604,12 @@ class ModelManager:
             "total_models": len(self.model_configs),
             "available_models": len(self.get_available_models()),
             "loaded_models": len(self.models),
+            "resident_models": list(self.models.keys()),
+            "memory_budget_gb": self.memory_budget_gb,
+            "resident_gb": self._resident_gb(),
             "current_model": self.current_model,
+            "batching": self.scheduler.get_statistics(),
+            "inference": self.executor.get_statistics(),
             "model_status": {key: status.value for key, status in self.model_status.items()},
             "memory_usage": self._get_memory_usage()
         }
@@ -386,7 +625,7 @@ class ModelManager:
             pass
         
         try:
-            if torch.cuda.is_available():
+            if HAS_TRANSFORMERS and torch.cuda.is_available():
                 gpu_memory = torch.cuda.memory_allocated() / 1024**3  # GB
                 gpu_total = torch.cuda.get_device_properties(0).total_memory / 1024**3
                 memory_info["gpu"] = f"{gpu_memory:.1f}GB / {gpu_total:.1f}GB"
@@ -397,10 +636,13 @@ class ModelManager:
     
     def cleanup(self):
         """Cleanup aller Modelle"""
+        self.scheduler.shutdown()
+        self.executor.shutdown()
+        
         for model_key in list(self.models.keys()):
             self.unload_model(model_key)
         
-        if torch.cuda.is_available():
+        if HAS_TRANSFORMERS and torch.cuda.is_available():
             torch.cuda.empty_cache()
         
         logger.info("🧹 Model Manager Cleanup abgeschlossen")
\ No newline at end of file
@@ -11,6 +11,7 @@ from fastapi import HTTPException, Depends
 from pydantic import BaseModel
 
 from rate_limiter import rate_limiter, LimitType
+from db_pool import get_connection
 from auth_service import get_current_user, User
 
 logger = logging.getLogger(__name__)
@@ -137,9 +138,10 @@ async def get_rate_limit_overview(
 ) -> RateLimitOverview:
     """Ottieni overview generale del rate limiting"""
     try:
-        import sqlite3
+        # I tentativi del backend in memoria vengono scritti in batch
+        rate_limiter.flush()
         
-        with sqlite3.connect(rate_limiter.db_path) as conn:
+        with get_connection(rate_limiter.db_path) as conn:
             cursor = conn.cursor()
             
             # Tentativi nelle ultime 24 ore
@@ -242,9 +244,9 @@ async def get_blocked_identifiers(
 ) -> List[Dict[str, Any]]:
     """Ottieni lista identificatori attualmente bloccati"""
     try:
-        import sqlite3
+        rate_limiter.flush()
         
-        with sqlite3.connect(rate_limiter.db_path) as conn:
+        with get_connection(rate_limiter.db_path) as conn:
             cursor = conn.cursor()
             
             if limit_type:
@@ -4,16 +4,24 @@ Creative Muse AI - Rate Limiting System
 Sistema di rate limiting per prevenire brute force attacks
 """
 
+import os
+import json
 import time
-import sqlite3
+import fcntl
+import socket
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Optional, Tuple
+import threading
+import socketserver
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple, List, Any, Deque
 from dataclasses import dataclass
 from enum import Enum
 import hashlib
 from fastapi import HTTPException, Request
 
+from db_pool import get_connection
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,10 +41,453 @@ class RateLimit:
     block_duration_minutes: int
 
 
+class RateLimitBackend:
+    """Interfaccia per lo storage di contatori e blocchi"""
+    
+    def get_block(self, identifier_hash: str, limit_type: str) -> Optional[Tuple[datetime, str]]:
+        """Ritorna (blocked_until, motivo) se esiste un blocco attivo"""
+        raise NotImplementedError
+    
+    def count_failures(self, identifier_hash: str, limit_type: str, window_start: datetime) -> int:
+        """Conta i tentativi falliti dopo window_start"""
+        raise NotImplementedError
+    
+    def set_block(self, identifier_hash: str, limit_type: str,
+                  blocked_until: datetime, reason: str):
+        """Crea o aggiorna un blocco"""
+        raise NotImplementedError
+    
+    def record_attempt(self, identifier_hash: str, limit_type: str,
+                       ip_address: str, user_agent: str, success: bool):
+        """Registra un tentativo (un successo rimuove il blocco)"""
+        raise NotImplementedError
+    
+    def clear_block(self, identifier_hash: str, limit_type: str) -> bool:
+        """Rimuove un blocco, True se esisteva"""
+        raise NotImplementedError
+    
+    def flush(self):
+        """Scrive su SQLite eventuali dati in sospeso"""
+    
+    def close(self):
+        """Rilascia le risorse del backend"""
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """Backend che interroga SQLite ad ogni richiesta"""
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+    
+    def get_block(self, identifier_hash, limit_type):
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT blocked_until, block_reason 
+                FROM rate_limit_blocks 
+                WHERE identifier_hash = ? AND limit_type = ? AND blocked_until > ?
+            """, (identifier_hash, limit_type, datetime.now()))
+            
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return datetime.fromisoformat(row[0]), row[1]
+    
+    def count_failures(self, identifier_hash, limit_type, window_start):
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COUNT(*) 
+                FROM rate_limit_attempts 
+                WHERE identifier_hash = ? AND limit_type = ? 
+                AND attempt_time > ? AND success = FALSE
+            """, (identifier_hash, limit_type, window_start))
+            return cursor.fetchone()[0]
+    
+    def set_block(self, identifier_hash, limit_type, blocked_until, reason):
+        with get_connection(self.db_path) as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO rate_limit_blocks 
+                (identifier_hash, limit_type, blocked_until, block_reason)
+                VALUES (?, ?, ?, ?)
+            """, (identifier_hash, limit_type, blocked_until, reason))
+    
+    def record_attempt(self, identifier_hash, limit_type, ip_address, user_agent, success):
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO rate_limit_attempts 
+                (identifier_hash, limit_type, ip_address, user_agent, success)
+                VALUES (?, ?, ?, ?, ?)
+            """, (identifier_hash, limit_type, ip_address, user_agent, success))
+            
+            # Se successo, rimuovi eventuali blocchi
+            if success:
+                cursor.execute("""
+                    DELETE FROM rate_limit_blocks 
+                    WHERE identifier_hash = ? AND limit_type = ?
+                """, (identifier_hash, limit_type))
+    
+    def clear_block(self, identifier_hash, limit_type):
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM rate_limit_blocks 
+                WHERE identifier_hash = ? AND limit_type = ?
+            """, (identifier_hash, limit_type))
+            return cursor.rowcount > 0
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Backend con contatori sliding-window in memoria
+    
+    Le decisioni si basano solo sui dati in memoria; tentativi e blocchi
+    vengono scritti su SQLite in batch da un thread in background, così
+    le viste admin e l'audit restano disponibili.
+    """
+    
+    MAX_PENDING = 10000
+    
+    def __init__(self, db_path: str, max_window_minutes: int,
+                 flush_interval: Optional[float] = None):
+        self.db_path = db_path
+        self.flush_interval = flush_interval or float(
+            os.getenv("RATE_LIMIT_FLUSH_INTERVAL_SECONDS", "2")
+        )
+        self._failures: Dict[Tuple[str, str], Deque[float]] = {}
+        self._blocks: Dict[Tuple[str, str], Tuple[datetime, str]] = {}
+        self._pending: List[Tuple[str, tuple]] = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._max_window = max_window_minutes * 60
+        
+        self._load_state(max_window_minutes)
+        
+        self._flush_thread = threading.Thread(
+            target=self._flush_worker, daemon=True, name="RateLimitFlush"
+        )
+        self._flush_thread.start()
+    
+    def _load_state(self, max_window_minutes: int):
+        """Ricarica blocchi attivi e fallimenti recenti da SQLite"""
+        try:
+            with get_connection(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT identifier_hash, limit_type, blocked_until, block_reason
+                    FROM rate_limit_blocks WHERE blocked_until > ?
+                """, (datetime.now(),))
+                for identifier_hash, limit_type, blocked_until, reason in cursor.fetchall():
+                    self._blocks[(identifier_hash, limit_type)] = (
+                        datetime.fromisoformat(blocked_until), reason
+                    )
+                
+                # attempt_time è CURRENT_TIMESTAMP (UTC, "YYYY-MM-DD HH:MM:SS")
+                since = datetime.now(timezone.utc) - timedelta(minutes=max_window_minutes)
+                cursor.execute("""
+                    SELECT identifier_hash, limit_type, attempt_time
+                    FROM rate_limit_attempts
+                    WHERE success = FALSE AND attempt_time > ?
+                    ORDER BY attempt_time
+                """, (since.strftime("%Y-%m-%d %H:%M:%S"),))
+                for identifier_hash, limit_type, attempt_time in cursor.fetchall():
+                    timestamp = datetime.strptime(
+                        attempt_time[:19], "%Y-%m-%d %H:%M:%S"
+                    ).replace(tzinfo=timezone.utc).timestamp()
+                    self._failures.setdefault((identifier_hash, limit_type), deque()).append(timestamp)
+            
+            logger.info(
+                f"✅ Rate limiter in memoria: {len(self._blocks)} blocchi, "
+                f"{len(self._failures)} identificatori caricati"
+            )
+        except Exception as e:
+            logger.error(f"❌ Errore caricamento stato rate limiting: {e}")
+    
+    def get_block(self, identifier_hash, limit_type):
+        key = (identifier_hash, limit_type)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block and block[0] <= datetime.now():
+                del self._blocks[key]
+                return None
+            return block
+    
+    def count_failures(self, identifier_hash, limit_type, window_start):
+        cutoff = window_start.timestamp()
+        with self._lock:
+            failures = self._failures.get((identifier_hash, limit_type))
+            if not failures:
+                return 0
+            while failures and failures[0] <= cutoff:
+                failures.popleft()
+            return len(failures)
+    
+    def set_block(self, identifier_hash, limit_type, blocked_until, reason):
+        with self._lock:
+            self._blocks[(identifier_hash, limit_type)] = (blocked_until, reason)
+            self._pending.append(("""
+                INSERT OR REPLACE INTO rate_limit_blocks 
+                (identifier_hash, limit_type, blocked_until, block_reason)
+                VALUES (?, ?, ?, ?)
+            """, (identifier_hash, limit_type, blocked_until, reason)))
+    
+    def record_attempt(self, identifier_hash, limit_type, ip_address, user_agent, success):
+        now = time.time()
+        attempt_time = datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        key = (identifier_hash, limit_type)
+        
+        with self._lock:
+            if success:
+                self._blocks.pop(key, None)
+            else:
+                self._failures.setdefault(key, deque()).append(now)
+            
+            self._pending.append(("""
+                INSERT INTO rate_limit_attempts 
+                (identifier_hash, limit_type, attempt_time, ip_address, user_agent, success)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (identifier_hash, limit_type, attempt_time, ip_address, user_agent, success)))
+            if success:
+                self._pending.append(("""
+                    DELETE FROM rate_limit_blocks 
+                    WHERE identifier_hash = ? AND limit_type = ?
+                """, key))
+    
+    def clear_block(self, identifier_hash, limit_type):
+        key = (identifier_hash, limit_type)
+        with self._lock:
+            existed = self._blocks.pop(key, None) is not None
+            self._pending.append(("""
+                DELETE FROM rate_limit_blocks 
+                WHERE identifier_hash = ? AND limit_type = ?
+            """, key))
+        return existed
+    
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        
+        if not pending:
+            return
+        
+        try:
+            with get_connection(self.db_path) as conn:
+                for sql, params in pending:
+                    conn.execute(sql, params)
+        except Exception as e:
+            logger.error(f"❌ Errore flush rate limiting ({len(pending)} operazioni): {e}")
+            # Rimetti in coda per il prossimo ciclo (con limite, se il DB resta irraggiungibile)
+            with self._lock:
+                self._pending = (pending + self._pending)[-self.MAX_PENDING:]
+    
+    def _prune(self):
+        """Scarta fallimenti fuori dalla finestra più lunga e blocchi scaduti
+        
+        count_failures pulisce solo le chiavi interrogate: senza questo passo
+        gli identificatori visti una volta resterebbero in memoria per sempre.
+        """
+        cutoff = time.time() - self._max_window
+        now = datetime.now()
+        with self._lock:
+            for key in list(self._failures):
+                failures = self._failures[key]
+                while failures and failures[0] <= cutoff:
+                    failures.popleft()
+                if not failures:
+                    del self._failures[key]
+            for key in [key for key, block in self._blocks.items() if block[0] <= now]:
+                del self._blocks[key]
+    
+    def _flush_worker(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+            self._prune()
+    
+    def close(self):
+        self._stop_event.set()
+        self.flush()
+
+
+class _RateLimitRequestHandler(socketserver.StreamRequestHandler):
+    """Esegue le operazioni dei worker sul backend in memoria condiviso"""
+    
+    def handle(self):
+        backend = self.server.backend
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op, args = request["op"], request.get("args", [])
+                
+                if op == "get_block":
+                    block = backend.get_block(*args)
+                    result = [block[0].isoformat(), block[1]] if block else None
+                elif op == "count_failures":
+                    result = backend.count_failures(args[0], args[1], datetime.fromisoformat(args[2]))
+                elif op == "set_block":
+                    backend.set_block(args[0], args[1], datetime.fromisoformat(args[2]), args[3])
+                    result = None
+                elif op == "record_attempt":
+                    backend.record_attempt(*args)
+                    result = None
+                elif op == "clear_block":
+                    result = backend.clear_block(*args)
+                elif op == "flush":
+                    backend.flush()
+                    result = None
+                else:
+                    raise ValueError(f"operazione sconosciuta: {op}")
+                
+                response = {"ok": True, "result": result}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _RateLimitServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SocketRateLimitBackend(RateLimitBackend):
+    """Backend condiviso tra i worker uvicorn dello stesso host
+    
+    Il primo worker che ottiene il lock avvia un piccolo server su Unix socket
+    con un MemoryRateLimitBackend; gli altri worker (e lui stesso) inviano le
+    operazioni come righe JSON. Così i contatori sono unici per host, senza
+    moltiplicare i limiti per il numero di worker né serializzarsi sui lock
+    di SQLite. Se il worker che ospita il server termina, il prossimo client
+    che non riesce a connettersi ne avvia uno nuovo (stato ricaricato da SQLite).
+    """
+    
+    def __init__(self, db_path: str, max_window_minutes: int,
+                 socket_path: Optional[str] = None, timeout: float = 2.0):
+        self.db_path = db_path
+        self.max_window_minutes = max_window_minutes
+        self.socket_path = socket_path or os.getenv(
+            "RATE_LIMIT_SOCKET_PATH",
+            os.path.join(os.path.dirname(db_path) or ".", "rate_limiter.sock")
+        )
+        self.timeout = timeout
+        self._local = threading.local()
+        self._server: Optional[_RateLimitServer] = None
+        self._server_backend: Optional[MemoryRateLimitBackend] = None
+        
+        self._ensure_server()
+    
+    def _can_connect(self) -> bool:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.settimeout(self.timeout)
+                probe.connect(self.socket_path)
+            return True
+        except OSError:
+            return False
+    
+    def _ensure_server(self):
+        """Avvia il server se nessun worker lo sta già servendo"""
+        with open(self.socket_path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._can_connect():
+                    return
+                
+                # Socket orfano di un worker terminato
+                if os.path.exists(self.socket_path):
+                    os.unlink(self.socket_path)
+                
+                self._server_backend = MemoryRateLimitBackend(self.db_path, self.max_window_minutes)
+                self._server = _RateLimitServer(self.socket_path, _RateLimitRequestHandler)
+                self._server.backend = self._server_backend
+                
+                threading.Thread(
+                    target=self._server.serve_forever, daemon=True, name="RateLimitServer"
+                ).start()
+                logger.info(f"✅ Server rate limiting condiviso avviato (PID {os.getpid()}): {self.socket_path}")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+        return conn
+    
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+        self._local.conn = None
+    
+    def _call(self, op: str, *args) -> Any:
+        payload = json.dumps({"op": op, "args": list(args)}).encode() + b"\n"
+        
+        for attempt in range(2):
+            try:
+                sock, reader = self._connection()
+                sock.sendall(payload)
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("server rate limiting non disponibile")
+                break
+            except OSError:
+                self._drop_connection()
+                if attempt:
+                    raise
+                self._ensure_server()
+        
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+    
+    def get_block(self, identifier_hash, limit_type):
+        result = self._call("get_block", identifier_hash, limit_type)
+        if not result:
+            return None
+        return datetime.fromisoformat(result[0]), result[1]
+    
+    def count_failures(self, identifier_hash, limit_type, window_start):
+        return self._call("count_failures", identifier_hash, limit_type, window_start.isoformat())
+    
+    def set_block(self, identifier_hash, limit_type, blocked_until, reason):
+        self._call("set_block", identifier_hash, limit_type, blocked_until.isoformat(), reason)
+    
+    def record_attempt(self, identifier_hash, limit_type, ip_address, user_agent, success):
+        self._call("record_attempt", identifier_hash, limit_type, ip_address, user_agent, success)
+    
+    def clear_block(self, identifier_hash, limit_type):
+        return self._call("clear_block", identifier_hash, limit_type)
+    
+    def flush(self):
+        self._call("flush")
+    
+    def close(self):
+        self._drop_connection()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server_backend.close()
+            self._server = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+
 class RateLimiter:
     """Sistema di rate limiting per prevenire brute force attacks"""
     
-    def __init__(self, db_path: str = "database/creative_muse.db"):
+    def __init__(self, db_path: str = "database/creative_muse.db",
+                 backend: Optional[str] = None):
         self.db_path = db_path
         self._init_database()
         
@@ -63,11 +514,39 @@ class RateLimiter:
                 block_duration_minutes=5
             )
         }
+        
+        # Backend per contatori e blocchi (auto | memory | socket | sqlite)
+        self.backend_name = backend or os.getenv("RATE_LIMIT_BACKEND", "auto")
+        if self.backend_name == "auto":
+            # Con più worker i contatori devono essere condivisi
+            self.backend_name = "socket" if int(os.getenv("WORKERS", "1")) > 1 else "memory"
+        self.backend = self._create_backend(self.backend_name)
+    
+    def _create_backend(self, name: str) -> RateLimitBackend:
+        """Crea il backend configurato"""
+        if name == "sqlite":
+            return SQLiteRateLimitBackend(self.db_path)
+        
+        max_window = max(limit.window_minutes for limit in self.limits.values())
+        if name == "socket":
+            return SocketRateLimitBackend(self.db_path, max_window)
+        if name != "memory":
+            logger.warning(f"⚠️ Backend rate limiting sconosciuto '{name}', uso memory")
+        
+        return MemoryRateLimitBackend(self.db_path, max_window)
+    
+    def flush(self):
+        """Scrive su SQLite i tentativi in sospeso (per viste admin)"""
+        self.backend.flush()
+    
+    def shutdown(self):
+        """Flush finale e arresto del backend"""
+        self.backend.close()
     
     def _init_database(self):
         """Inizializza tabelle rate limiting"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Tabella per tracking tentativi
@@ -152,60 +631,38 @@ class RateLimiter:
             limit_config = self.limits[limit_type]
             now = datetime.now()
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # 1. Controlla se c'è un blocco attivo
-                cursor.execute("""
-                    SELECT blocked_until, block_reason 
-                    FROM rate_limit_blocks 
-                    WHERE identifier_hash = ? AND limit_type = ? AND blocked_until > ?
-                """, (identifier_hash, limit_type.value, now))
-                
-                block_result = cursor.fetchone()
-                if block_result:
-                    blocked_until, reason = block_result
-                    blocked_until_dt = datetime.fromisoformat(blocked_until)
-                    remaining_minutes = int((blocked_until_dt - now).total_seconds() / 60)
-                    
-                    return False, f"Account temporaneamente bloccato. Riprova tra {remaining_minutes} minuti. Motivo: {reason}"
+            # 1. Controlla se c'è un blocco attivo
+            block = self.backend.get_block(identifier_hash, limit_type.value)
+            if block:
+                blocked_until_dt, reason = block
+                remaining_minutes = int((blocked_until_dt - now).total_seconds() / 60)
                 
-                # 2. Conta tentativi nella finestra temporale
-                window_start = now - timedelta(minutes=limit_config.window_minutes)
-                
-                cursor.execute("""
-                    SELECT COUNT(*) 
-                    FROM rate_limit_attempts 
-                    WHERE identifier_hash = ? AND limit_type = ? 
-                    AND attempt_time > ? AND success = FALSE
-                """, (identifier_hash, limit_type.value, window_start))
+                return False, f"Account temporaneamente bloccato. Riprova tra {remaining_minutes} minuti. Motivo: {reason}"
+            
+            # 2. Conta tentativi nella finestra temporale
+            window_start = now - timedelta(minutes=limit_config.window_minutes)
+            failed_attempts = self.backend.count_failures(
+                identifier_hash, limit_type.value, window_start
+            )
+            
+            # 3. Se superato il limite, crea blocco
+            if failed_attempts >= limit_config.max_attempts:
+                blocked_until = now + timedelta(minutes=limit_config.block_duration_minutes)
+                
+                # Inserisci o aggiorna blocco
+                self.backend.set_block(
+                    identifier_hash,
+                    limit_type.value,
+                    blocked_until,
+                    f"Troppi tentativi falliti ({failed_attempts}/{limit_config.max_attempts})"
+                )
                 
-                failed_attempts = cursor.fetchone()[0]
-                
-                # 3. Se superato il limite, crea blocco
-                if failed_attempts >= limit_config.max_attempts:
-                    blocked_until = now + timedelta(minutes=limit_config.block_duration_minutes)
-                    
-                    # Inserisci o aggiorna blocco
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO rate_limit_blocks 
-                        (identifier_hash, limit_type, blocked_until, block_reason)
-                        VALUES (?, ?, ?, ?)
-                    """, (
-                        identifier_hash, 
-                        limit_type.value, 
-                        blocked_until,
-                        f"Troppi tentativi falliti ({failed_attempts}/{limit_config.max_attempts})"
-                    ))
-                    
-                    conn.commit()
-                    
-                    logger.warning(f"🚫 Rate limit superato per {limit_type.value}: {identifier} (IP: {self._get_client_ip(request)})")
-                    
-                    return False, f"Troppi tentativi falliti. Account bloccato per {limit_config.block_duration_minutes} minuti."
-                
-                return True, None
+                logger.warning(f"🚫 Rate limit superato per {limit_type.value}: {identifier} (IP: {self._get_client_ip(request)})")
                 
+                return False, f"Troppi tentativi falliti. Account bloccato per {limit_config.block_duration_minutes} minuti."
+            
+            return True, None
+            
         except Exception as e:
             logger.error(f"❌ Errore controllo rate limit: {e}")
             # In caso di errore, permetti l'accesso (fail-open)
@@ -222,29 +679,15 @@ class RateLimiter:
             ip_address = self._get_client_ip(request)
             user_agent = request.headers.get("User-Agent", "")[:500]  # Limita lunghezza
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    INSERT INTO rate_limit_attempts 
-                    (identifier_hash, limit_type, ip_address, user_agent, success)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (identifier_hash, limit_type.value, ip_address, user_agent, success))
-                
-                # Se successo, rimuovi eventuali blocchi
-                if success:
-                    cursor.execute("""
-                        DELETE FROM rate_limit_blocks 
-                        WHERE identifier_hash = ? AND limit_type = ?
-                    """, (identifier_hash, limit_type.value))
-                
-                conn.commit()
+            self.backend.record_attempt(
+                identifier_hash, limit_type.value, ip_address, user_agent, success
+            )
+            
+            if success:
+                logger.info(f"✅ Tentativo riuscito per {limit_type.value}: {identifier}")
+            else:
+                logger.warning(f"❌ Tentativo fallito per {limit_type.value}: {identifier} (IP: {ip_address})")
                 
-                if success:
-                    logger.info(f"✅ Tentativo riuscito per {limit_type.value}: {identifier}")
-                else:
-                    logger.warning(f"❌ Tentativo fallito per {limit_type.value}: {identifier} (IP: {ip_address})")
-                    
         except Exception as e:
             logger.error(f"❌ Errore registrazione tentativo: {e}")
     
@@ -252,8 +695,9 @@ class RateLimiter:
         """Pulisce record vecchi per mantenere performance"""
         try:
             cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+            self.flush()
             
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Rimuovi tentativi vecchi
@@ -286,7 +730,10 @@ class RateLimiter:
             limit_config = self.limits[limit_type]
             window_start = datetime.now() - timedelta(minutes=limit_config.window_minutes)
             
-            with sqlite3.connect(self.db_path) as conn:
+            # Le statistiche leggono lo storico da SQLite
+            self.flush()
+            
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Conta tentativi nella finestra
@@ -331,21 +778,11 @@ class RateLimiter:
         try:
             identifier_hash = self._hash_identifier(identifier)
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    DELETE FROM rate_limit_blocks 
-                    WHERE identifier_hash = ? AND limit_type = ?
-                """, (identifier_hash, limit_type.value))
-                
-                conn.commit()
-                
-                if cursor.rowcount > 0:
-                    logger.info(f"🔓 Sbloccato manualmente: {identifier} per {limit_type.value}")
-                    return True
-                
-                return False
+            if self.backend.clear_block(identifier_hash, limit_type.value):
+                logger.info(f"🔓 Sbloccato manualmente: {identifier} per {limit_type.value}")
+                return True
+            
+            return False
                 
         except Exception as e:
             logger.error(f"❌ Errore sblocco manuale: {e}")
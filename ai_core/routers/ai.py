@@ -3,6 +3,7 @@ Creative Muse AI - AI Router
 Router per generazione idee e gestione modelli AI
 """
 
+import json
 import logging
 from typing import List
 from fastapi import APIRouter, HTTPException, Depends, Request, status
@@ -12,11 +13,9 @@ from models.api_models import (
     IdeaRequest, IdeaResponse, BatchIdeaRequest, ModelInfo,
     SuccessResponse
 )
-from auth_service import get_current_user, check_user_limits
+from auth_service import get_current_user
 from rate_limiter import rate_limiter, LimitType
-from feature_middleware import (
-    require_ai_model_selection, require_bulk_generation
-)
+from feature_middleware import AccessContext, FeatureGates, check_access_limits
 
 logger = logging.getLogger(__name__)
 
@@ -28,12 +27,10 @@ router = APIRouter(prefix="/api/v1/ai", tags=["artificial-intelligence"])
 async def generate_idea(
     idea_request: IdeaRequest,
     request: Request,
-    current_user=Depends(get_current_user)
+    access: AccessContext = Depends(check_access_limits)
 ):
     """Genera una singola idea"""
-    
-    # Controlla limiti utente
-    await check_user_limits(current_user, "idea_generation")
+    current_user = access.user
     
     # Rate limiting per generazione idee
     user_allowed, user_error = rate_limiter.check_rate_limit(
@@ -94,13 +91,12 @@ async def generate_idea(
 async def generate_batch_ideas(
     batch_request: BatchIdeaRequest,
     request: Request,
-    current_user=Depends(get_current_user),
-    _=Depends(require_bulk_generation)
+    access: AccessContext = Depends(check_access_limits),
+    _=Depends(FeatureGates.BULK_IDEA_GENERATION.dependency())
 ):
     """Genera multiple idee in batch (richiede feature bulk_generation)"""
-    
-    # Controlla limiti utente
-    await check_user_limits(current_user, "batch_generation")
+    # Utente, limiti e feature risolti una sola volta per richiesta
+    current_user = access.user
     
     # Limita numero di prompt per batch
     if len(batch_request.prompts) > 10:
@@ -164,7 +160,7 @@ async def generate_batch_ideas(
 @router.get("/models", response_model=List[ModelInfo])
 async def get_available_models(
     current_user=Depends(get_current_user),
-    _=Depends(require_ai_model_selection)
+    _=Depends(FeatureGates.AI_MODEL_SELECTION.dependency())
 ):
     """Ottieni lista modelli AI disponibili"""
     try:
@@ -188,7 +184,7 @@ async def get_available_models(
 async def load_model(
     model_key: str,
     current_user=Depends(get_current_user),
-    _=Depends(require_ai_model_selection)
+    _=Depends(FeatureGates.AI_MODEL_SELECTION.dependency())
 ):
     """Carica un modello specifico"""
     try:
@@ -295,6 +291,7 @@ async def rate_idea(
 @router.get("/stream/generate")
 async def stream_generate_idea(
     prompt: str,
+    request: Request,
     current_user=Depends(get_current_user),
     model: str = None,
     category: str = "general",
@@ -304,12 +301,14 @@ async def stream_generate_idea(
     
     async def generate_stream():
         try:
-            from .. import model_manager
+            # Istanza condivisa registrata dal lifespan dell'app
+            model_manager = getattr(request.app.state, "model_manager", None)
             
             if not model_manager:
                 yield "data: {\"error\": \"Servizio AI non disponibile\"}\n\n"
                 return
             
+            # Un evento per ogni token decodificato
             async for chunk in model_manager.stream_generate_idea(
                 prompt=prompt,
                 model=model,
@@ -317,7 +316,7 @@ async def stream_generate_idea(
                 creativity_level=creativity_level,
                 user_id=current_user.id
             ):
-                yield f"data: {chunk}\n\n"
+                yield f"data: {json.dumps(chunk)}\n\n"
                 
         except Exception as e:
             logger.error(f"❌ Errore stream generation: {e}")
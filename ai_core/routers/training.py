@@ -14,7 +14,7 @@ from models.api_models import (
     TrainingRequest, TrainingStatus, SuccessResponse
 )
 from auth_service import get_current_user
-from feature_middleware import require_api_access
+from feature_middleware import FeatureGates
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +28,7 @@ async def upload_training_data(
     dataset_name: str = Form(...),
     description: str = Form(None),
     current_user=Depends(get_current_user),
-    _=Depends(require_api_access)
+    _=Depends(FeatureGates.API_ACCESS.dependency())
 ):
     """Upload dataset per training"""
     
@@ -82,7 +82,7 @@ async def upload_training_data(
 async def start_training(
     training_request: TrainingRequest,
     current_user=Depends(get_current_user),
-    _=Depends(require_api_access)
+    _=Depends(FeatureGates.API_ACCESS.dependency())
 ):
     """Avvia training di un modello"""
     try:
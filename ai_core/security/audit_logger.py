@@ -3,8 +3,8 @@ Creative Muse AI - Audit-Logger
 Umfassende Sicherheits- und Compliance-Protokollierung
 """
 
+import os
 import json
-import logging
 import threading
 from datetime import datetime, timezone
 from pathlib import Path
@@ -16,6 +16,8 @@ from dataclasses import dataclass, asdict
 import queue
 import time
 
+from .audit_store import AuditSegmentStore
+
 
 class AuditLevel(Enum):
     """Audit-Level für verschiedene Ereignistypen"""
@@ -52,6 +54,32 @@ class SeverityLevel(Enum):
     EMERGENCY = 5
 
 
+class _BatchFileWriter:
+    """Gepufferte Log-Datei, die einen ganzen Batch mit einem write() schreibt"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "ab", buffering=1024 * 1024)
+        self._dirty = False
+
+    def write_lines(self, lines: List[str]):
+        self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self._file.flush()
+        self._dirty = True
+
+    def sync(self):
+        if self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def close(self):
+        try:
+            self._file.flush()
+            self.sync()
+        finally:
+            self._file.close()
+
+
 @dataclass
 class AuditEvent:
     """Struktur für Audit-Ereignisse"""
@@ -89,10 +117,25 @@ class AuditLogger:
         self.audit_dir = self.logs_dir / "audit"
         self.security_dir = self.logs_dir / "security"
 
-        # Thread-sichere Queue für asynchrone Protokollierung
-        self.event_queue = queue.Queue()
+        # Batch-Writer: bis batch_size Events oder batch_wait_ms pro Zyklus
+        writer_config = self.audit_config.get("writer", {})
+        self.batch_size = writer_config.get("batch_size", 256)
+        self.batch_wait = writer_config.get("batch_wait_ms", 50) / 1000.0
+        self.fsync_interval = writer_config.get("fsync_interval_seconds", 1.0)
+        self._last_fsync = time.monotonic()
+        self._writers: Dict[str, _BatchFileWriter] = {}
+
+        # Segmentspeicher mit Hash-Kette und Offset-Index (Abfragen/Verifikation)
+        self.segments_config = self.audit_config.get("segments", {})
+        self.segment_store: Optional[AuditSegmentStore] = None
+
+        # Thread-sichere Queue für asynchrone Protokollierung (begrenzt)
+        self.event_queue = queue.Queue(maxsize=writer_config.get("queue_max_size", 10000))
         self.processing_thread = None
         self.shutdown_event = threading.Event()
+        # Serialisiert Processor-Durchläufe mit dem Schließen der Dateien
+        self._write_lock = threading.Lock()
+        self._closed = False
 
         # Statistiken
         self.stats = {
@@ -100,6 +143,9 @@ class AuditLogger:
             "events_by_category": {},
             "events_by_severity": {},
             "last_event_time": None,
+            "dropped_events": 0,
+            "batches_written": 0,
+            "fsyncs": 0,
         }
 
         self._setup_logging()
@@ -113,19 +159,20 @@ class AuditLogger:
             self.security_dir.mkdir(parents=True, exist_ok=True)
 
             # Berechtigungen setzen
-            import os
-
             os.chmod(self.logs_dir, 0o700)
             os.chmod(self.audit_dir, 0o700)
             os.chmod(self.security_dir, 0o700)
 
-            # Logger konfigurieren
-            self.audit_logger = logging.getLogger("audit")
-            self.security_logger = logging.getLogger("security")
-
-            # Handler für verschiedene Log-Typen
+            # Batch-Writer für verschiedene Log-Typen
             self._setup_file_handlers()
 
+            if self.segments_config.get("enabled", True):
+                self.segment_store = AuditSegmentStore(
+                    self.audit_dir / "segments",
+                    [category.value for category in EventCategory],
+                    max_segment_bytes=self.segments_config.get("max_segment_mb", 64) * 1024 * 1024
+                )
+
             print("Audit-Logging erfolgreich eingerichtet")
 
         except Exception as e:
@@ -133,46 +180,24 @@ class AuditLogger:
             raise
 
     def _setup_file_handlers(self):
-        """Richte Datei-Handler für verschiedene Log-Kategorien ein"""
+        """Richte Batch-Writer für verschiedene Log-Kategorien ein"""
         try:
-            # Audit-Handler
-            audit_handler = logging.FileHandler(
-                self.audit_dir / f"audit_{datetime.now().strftime('%Y%m%d')}.log"
-            )
-            audit_handler.setFormatter(
-                logging.Formatter("%(asctime)s - AUDIT - %(message)s")
-            )
-            self.audit_logger.addHandler(audit_handler)
-            self.audit_logger.setLevel(logging.INFO)
+            date_suffix = datetime.now().strftime("%Y%m%d")
 
-            # Security-Handler
-            security_handler = logging.FileHandler(
-                self.security_dir / f"security_{datetime.now().strftime('%Y%m%d')}.log"
+            # Audit- und Security-Log
+            self._writers["audit"] = _BatchFileWriter(
+                self.audit_dir / f"audit_{date_suffix}.log"
             )
-            security_handler.setFormatter(
-                logging.Formatter(
-                    "%(asctime)s - SECURITY - %(levelname)s - %(message)s"
-                )
+            self._writers["security"] = _BatchFileWriter(
+                self.security_dir / f"security_{date_suffix}.log"
             )
-            self.security_logger.addHandler(security_handler)
-            self.security_logger.setLevel(logging.INFO)
 
-            # Kategorie-spezifische Handler
+            # Kategorie-spezifische Logs
             for category in EventCategory:
-                category_handler = logging.FileHandler(
-                    self.audit_dir
-                    / f"{category.value}_{datetime.now().strftime('%Y%m%d')}.log"
-                )
-                category_handler.setFormatter(
-                    logging.Formatter(
-                        f"%(asctime)s - {category.value.upper()} - %(message)s"
-                    )
+                self._writers[category.value] = _BatchFileWriter(
+                    self.audit_dir / f"{category.value}_{date_suffix}.log"
                 )
 
-                category_logger = logging.getLogger(f"audit.{category.value}")
-                category_logger.addHandler(category_handler)
-                category_logger.setLevel(logging.INFO)
-
         except Exception as e:
             print(f"Fehler beim Einrichten der Datei-Handler: {e}")
             raise
@@ -190,24 +215,85 @@ class AuditLogger:
             raise
 
     def _process_events(self):
-        """Verarbeite Events aus der Queue"""
-        while not self.shutdown_event.is_set():
-            try:
-                # Event aus Queue holen (mit Timeout)
-                event = self.event_queue.get(timeout=1.0)
-
-                # Event verarbeiten
-                self._write_event(event)
+        """Verarbeite Events aus der Queue in Batches"""
+        while True:
+            with self._write_lock:
+                # shutdown() hat die Queue selbst geleert und die Dateien geschlossen
+                if self._closed:
+                    break
+
+                self._process_batch(self._collect_batch())
+                self._maybe_fsync()
+
+            # Nach Shutdown-Signal erst die Queue leeren
+            if self.shutdown_event.is_set() and self.event_queue.empty():
+                break
+
+    def _process_batch(self, batch: List[AuditEvent]):
+        """Schreibe einen gesammelten Batch und aktualisiere die Statistiken"""
+        if not batch:
+            return
+        try:
+            self._write_batch(batch)
+            for event in batch:
                 self._update_statistics(event)
-
-                # Queue-Task als erledigt markieren
+        except Exception as e:
+            print(f"Fehler bei der Event-Verarbeitung: {e}")
+        finally:
+            for _ in batch:
                 self.event_queue.task_done()
 
+    def _drain_queue(self):
+        """Schreibe alle noch wartenden Events synchron (Aufrufer hält _write_lock)"""
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.event_queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                return
+            self._process_batch(batch)
+
+    def _collect_batch(self) -> List[AuditEvent]:
+        """Sammle bis batch_size Events oder bis batch_wait abgelaufen ist"""
+        try:
+            batch = [self.event_queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self.event_queue.get_nowait())
+                else:
+                    batch.append(self.event_queue.get(timeout=remaining))
             except queue.Empty:
-                # Timeout - normal, weiter warten
-                continue
+                break
+
+        return batch
+
+    def _maybe_fsync(self, force: bool = False):
+        """fsync aller Dateien im konfigurierten Takt"""
+        now = time.monotonic()
+        if not force and now - self._last_fsync < self.fsync_interval:
+            return
+
+        for writer in self._writers.values():
+            try:
+                writer.sync()
             except Exception as e:
-                print(f"Fehler bei der Event-Verarbeitung: {e}")
+                print(f"Fehler beim fsync von {writer.path}: {e}")
+        if self.segment_store:
+            try:
+                self.segment_store.sync()
+            except Exception as e:
+                print(f"Fehler beim fsync des Segmentspeichers: {e}")
+        self._last_fsync = now
+        self.stats["fsyncs"] += 1
 
     def log_event(
         self,
@@ -286,8 +372,12 @@ class AuditLogger:
             # Checksum berechnen
             event.checksum = self._calculate_checksum(event)
 
-            # Event zur Queue hinzufügen
-            self.event_queue.put(event)
+            # Event zur Queue hinzufügen (nie blockieren)
+            try:
+                self.event_queue.put_nowait(event)
+            except queue.Full:
+                self.stats["dropped_events"] += 1
+                return ""
 
             return event_id
 
@@ -339,32 +429,53 @@ class AuditLogger:
             print(f"Fehler bei Checksum-Berechnung: {e}")
             return ""
 
-    def _write_event(self, event: AuditEvent):
-        """Schreibe Event in entsprechende Log-Dateien"""
-        try:
+    @staticmethod
+    def _security_level_name(severity: int) -> str:
+        if severity >= SeverityLevel.CRITICAL.value:
+            return "CRITICAL"
+        if severity >= SeverityLevel.ERROR.value:
+            return "ERROR"
+        if severity >= SeverityLevel.WARNING.value:
+            return "WARNING"
+        return "INFO"
+
+    def _write_batch(self, batch: List[AuditEvent]):
+        """Schreibe einen Batch mit einem write() pro Datei"""
+        now = datetime.now()
+        asctime = now.strftime("%Y-%m-%d %H:%M:%S") + f",{now.microsecond // 1000:03d}"
+
+        lines: Dict[str, List[str]] = {}
+        records: List[Dict[str, Any]] = []
+        payloads: List[bytes] = []
+        for event in batch:
             # Event zu JSON konvertieren
-            event_json = json.dumps(asdict(event), separators=(",", ":"))
-
-            # In Haupt-Audit-Log schreiben
-            self.audit_logger.info(event_json)
-
-            # In kategorie-spezifisches Log schreiben
-            category_logger = logging.getLogger(f"audit.{event.category}")
-            category_logger.info(event_json)
+            event_dict = asdict(event)
+            event_json = json.dumps(event_dict, separators=(",", ":"))
+            records.append(event_dict)
+            payloads.append(event_json.encode("utf-8"))
+
+            # Haupt-Audit-Log und kategorie-spezifisches Log
+            lines.setdefault("audit", []).append(f"{asctime} - AUDIT - {event_json}")
+            lines.setdefault(event.category, []).append(
+                f"{asctime} - {event.category.upper()} - {event_json}"
+            )
 
             # Sicherheitsereignisse zusätzlich in Security-Log
             if event.category == EventCategory.SECURITY_EVENTS.value:
-                if event.severity >= SeverityLevel.WARNING.value:
-                    self.security_logger.warning(event_json)
-                elif event.severity >= SeverityLevel.ERROR.value:
-                    self.security_logger.error(event_json)
-                elif event.severity >= SeverityLevel.CRITICAL.value:
-                    self.security_logger.critical(event_json)
-                else:
-                    self.security_logger.info(event_json)
+                level = self._security_level_name(event.severity)
+                lines.setdefault("security", []).append(
+                    f"{asctime} - SECURITY - {level} - {event_json}"
+                )
 
-        except Exception as e:
-            print(f"Fehler beim Schreiben des Events: {e}")
+        for target, target_lines in lines.items():
+            writer = self._writers.get(target)
+            if writer:
+                writer.write_lines(target_lines)
+
+        if self.segment_store:
+            self.segment_store.append_batch(records, payloads)
+
+        self.stats["batches_written"] += 1
 
     def _update_statistics(self, event: AuditEvent):
         """Aktualisiere Audit-Statistiken"""
@@ -514,7 +625,12 @@ class AuditLogger:
 
     def get_statistics(self) -> Dict[str, Any]:
         """Hole aktuelle Audit-Statistiken"""
-        return self.stats.copy()
+        stats = self.stats.copy()
+        stats["queue_depth"] = self.event_queue.qsize()
+        stats["average_batch_size"] = round(
+            stats["total_events"] / max(1, stats["batches_written"]), 2
+        )
+        return stats
 
     def verify_event_integrity(self, event_json: str) -> bool:
         """Überprüfe Integrität eines Events anhand der Checksum"""
@@ -536,19 +652,60 @@ class AuditLogger:
             print(f"Fehler bei der Integritätsprüfung: {e}")
             return False
 
+    def query_events(
+        self,
+        category: Optional[EventCategory] = None,
+        user_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Bereichsabfrage über den Segment-Index
+
+        Beispiel: alle SECURITY_EVENTS eines Benutzers der letzten 24h::
+
+            audit_logger.query_events(EventCategory.SECURITY_EVENTS, user_id,
+                                      since=datetime.now(timezone.utc) - timedelta(hours=24))
+        """
+        if not self.segment_store:
+            return []
+        try:
+            return self.segment_store.query(
+                category.value if category else None, user_id, since, until, limit
+            )
+        except Exception as e:
+            print(f"Fehler bei der Audit-Abfrage: {e}")
+            return []
+
+    def verify_segments(self) -> Dict[str, Any]:
+        """Überprüfe die Hash-Kette aller Audit-Segmente"""
+        if not self.segment_store:
+            return {"valid": False, "records": 0, "segments": [], "error": "Segmentspeicher deaktiviert"}
+        return self.segment_store.verify_all()
+
     def shutdown(self):
         """Beende Audit-Logger ordnungsgemäß"""
         try:
-            # Shutdown-Signal setzen
+            # Shutdown-Signal setzen; der Processor leert vorher die Queue
             self.shutdown_event.set()
 
-            # Warte auf Verarbeitung aller Events
-            self.event_queue.join()
-
             # Warte auf Thread-Ende
             if self.processing_thread and self.processing_thread.is_alive():
                 self.processing_thread.join(timeout=5.0)
 
+            # Läuft der Processor noch, wartet der Lock seinen aktuellen Batch ab;
+            # den Rest der Queue schreiben wir selbst, bevor die Dateien schließen
+            with self._write_lock:
+                self._drain_queue()
+                self._closed = True
+
+                # Dateien mit abschließendem fsync schließen
+                for writer in self._writers.values():
+                    writer.close()
+                self._writers.clear()
+                if self.segment_store:
+                    self.segment_store.close()
+
             print("Audit-Logger erfolgreich beendet")
 
         except Exception as e:
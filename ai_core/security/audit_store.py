@@ -0,0 +1,391 @@
+"""
+Creative Muse AI - Audit-Segmentspeicher
+Append-only Segmentdateien mit Hash-Kette und binärem Offset-Index
+für schnelle Integritätsprüfung und Bereichsabfragen
+"""
+
+import os
+import json
+import mmap
+import fcntl
+import struct
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+
+# Segment-Header: Magic + Ketten-Hash des vorherigen Segments
+SEGMENT_MAGIC = b"CMA1"
+SEGMENT_HEADER = struct.Struct(">4s32s")
+
+# Record: Länge des Payloads + Ketten-Hash, danach JSON-Payload
+RECORD_HEADER = struct.Struct(">I32s")
+
+# Index-Eintrag: Zeitstempel, Offset, User-Schlüssel, Länge, Kategorie-Code
+INDEX_ENTRY = struct.Struct(">dQQIB")
+
+# Zustand des Segmentendes in der Lock-Datei: Segment, Größe, letzter Hash
+TAIL_STATE = struct.Struct(">QQ32s")
+
+GENESIS_HASH = b"\x00" * 32
+
+
+def _user_key(user_id: Optional[str]) -> int:
+    """64-Bit-Schlüssel für eine User-ID (0 = kein Benutzer)"""
+    if not user_id:
+        return 0
+    return int.from_bytes(hashlib.sha256(str(user_id).encode("utf-8")).digest()[:8], "big") or 1
+
+
+def _chain(prev_hash: bytes, payload: bytes) -> bytes:
+    return hashlib.sha256(prev_hash + payload).digest()
+
+
+def _mapped(path: Path) -> Optional[mmap.mmap]:
+    """Datei read-only mappen (None bei leerer Datei)"""
+    if not path.exists() or path.stat().st_size == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class AuditSegmentStore:
+    """Segmentbasierter Audit-Speicher
+
+    Jeder Record enthält ``sha256(vorheriger_hash + payload)``; die Kette
+    läuft über Segmentgrenzen hinweg (der Segment-Header speichert den
+    letzten Hash des Vorgängers). Zu jedem Segment gehört eine ``.idx``-Datei
+    mit Einträgen fester Größe, sodass Abfragen nur den Index scannen und
+    passende Records direkt per Offset lesen.
+
+    Mehrere Prozesse (uvicorn-Worker) dürfen in dasselbe Verzeichnis
+    schreiben: jedes Anhängen läuft unter einem ``flock`` auf ``tail.lock``,
+    und die Lock-Datei enthält das aktuelle Segmentende. Hat ein anderer
+    Prozess inzwischen geschrieben, wird dessen Zustand übernommen.
+    """
+
+    def __init__(self, directory: Path, categories: List[str],
+                 max_segment_bytes: int = 64 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_segment_bytes = max_segment_bytes
+        self.category_codes = {name: code for code, name in enumerate(categories, start=1)}
+
+        self._lock = threading.Lock()
+        self._segment_no = 0
+        self._segment_file = None
+        self._index_file = None
+        self._segment_size = 0
+        self._last_hash = GENESIS_HASH
+        self._lock_fd = os.open(self.directory / "tail.lock", os.O_RDWR | os.O_CREAT, 0o600)
+
+        with self._tail_lock():
+            self._open_last_segment()
+            self._write_tail_state()
+
+    # ------------------------------------------------------------------
+    # Segmente
+    # ------------------------------------------------------------------
+
+    def _segment_path(self, number: int) -> Path:
+        return self.directory / f"segment_{number:06d}.log"
+
+    def _index_path(self, number: int) -> Path:
+        return self.directory / f"segment_{number:06d}.idx"
+
+    def segment_numbers(self) -> List[int]:
+        return sorted(int(path.stem.split("_")[1]) for path in self.directory.glob("segment_*.log"))
+
+    # ------------------------------------------------------------------
+    # Prozessübergreifende Koordination
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _tail_lock(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _write_tail_state(self):
+        os.pwrite(self._lock_fd, TAIL_STATE.pack(self._segment_no, self._segment_size, self._last_hash), 0)
+
+    def _sync_tail(self):
+        """Segmentende mit anderen Prozessen abgleichen (unter dem Tail-Lock)"""
+        data = os.pread(self._lock_fd, TAIL_STATE.size, 0)
+        state = TAIL_STATE.unpack(data) if len(data) == TAIL_STATE.size else None
+        segment_no, size, last_hash = state or (0, 0, GENESIS_HASH)
+        path = self._segment_path(segment_no)
+
+        if (state and path.exists() and path.stat().st_size == size
+                and not self._segment_path(segment_no + 1).exists()):
+            # Zustand passt zur Datei (ggf. von einem anderen Prozess): übernehmen
+            if segment_no != self._segment_no:
+                self._close_files()
+                self._segment_file = open(path, "ab")
+                self._index_file = open(self._index_path(segment_no), "ab")
+            self._segment_no, self._segment_size, self._last_hash = segment_no, size, last_hash
+        else:
+            # Zustand fehlt oder passt nicht zur Datei (Absturz): neu einlesen
+            self._close_files()
+            self._open_last_segment()
+
+    def _close_files(self):
+        if self._segment_file:
+            self._segment_file.close()
+            self._index_file.close()
+            self._segment_file = self._index_file = None
+
+    def _open_last_segment(self):
+        """Letztes Segment öffnen und nach einem Absturz reparieren"""
+        numbers = self.segment_numbers()
+        if not numbers:
+            self._start_segment(1, GENESIS_HASH)
+            return
+
+        number = numbers[-1]
+        records, valid_size, last_hash = self._scan_segment(number)
+        path = self._segment_path(number)
+
+        # Leeres Segment oder abgerissener Header: Header neu schreiben
+        if valid_size < SEGMENT_HEADER.size:
+            prev_hash = self._scan_segment(numbers[-2])[2] if len(numbers) > 1 else GENESIS_HASH
+            with open(path, "r+b") as f:
+                f.truncate(0)
+            self._index_path(number).unlink(missing_ok=True)
+            self._start_segment(number, prev_hash)
+            return
+
+        # Unvollständigen letzten Record abschneiden
+        if path.stat().st_size != valid_size:
+            with open(path, "r+b") as f:
+                f.truncate(valid_size)
+
+        # Index an die tatsächlich vorhandenen Records angleichen
+        index_path = self._index_path(number)
+        entry_count = index_path.stat().st_size // INDEX_ENTRY.size if index_path.exists() else 0
+        if entry_count != len(records):
+            self._rebuild_index(number, records)
+
+        self._segment_no = number
+        self._segment_size = valid_size
+        self._last_hash = last_hash
+        self._segment_file = open(path, "ab")
+        self._index_file = open(index_path, "ab")
+
+    def _start_segment(self, number: int, prev_hash: bytes):
+        self._close_files()
+
+        self._segment_no = number
+        self._segment_file = open(self._segment_path(number), "ab")
+        self._index_file = open(self._index_path(number), "ab")
+        self._segment_file.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, prev_hash))
+        self._segment_file.flush()
+        self._segment_size = SEGMENT_HEADER.size
+        self._last_hash = prev_hash
+
+    def _scan_segment(self, number: int) -> Tuple[List[Tuple[int, int, bytes]], int, bytes]:
+        """Records eines Segments lesen: ([(offset, länge, payload)], gültige Größe, letzter Hash)"""
+        data = _mapped(self._segment_path(number))
+        if data is None:
+            return [], 0, GENESIS_HASH
+
+        try:
+            if len(data) < SEGMENT_HEADER.size:
+                return [], 0, GENESIS_HASH
+            _, prev_hash = SEGMENT_HEADER.unpack_from(data, 0)
+            records = []
+            offset = SEGMENT_HEADER.size
+            while offset + RECORD_HEADER.size <= len(data):
+                length, chain_hash = RECORD_HEADER.unpack_from(data, offset)
+                end = offset + RECORD_HEADER.size + length
+                if end > len(data):
+                    break
+                records.append((offset, length, data[offset + RECORD_HEADER.size:end]))
+                prev_hash = chain_hash
+                offset = end
+            return records, offset, prev_hash
+        finally:
+            data.close()
+
+    def _rebuild_index(self, number: int, records: List[Tuple[int, int, bytes]]):
+        with open(self._index_path(number), "wb") as index:
+            for offset, length, payload in records:
+                event = json.loads(payload)
+                index.write(self._index_entry(event, offset, length))
+
+    def _index_entry(self, event: Dict[str, Any], offset: int, length: int) -> bytes:
+        try:
+            timestamp = datetime.fromisoformat(event["timestamp"]).timestamp()
+        except (KeyError, ValueError):
+            timestamp = 0.0
+        return INDEX_ENTRY.pack(
+            timestamp,
+            offset,
+            _user_key(event.get("user_id")),
+            length,
+            self.category_codes.get(event.get("category"), 0)
+        )
+
+    # ------------------------------------------------------------------
+    # Schreiben
+    # ------------------------------------------------------------------
+
+    def append_batch(self, events: List[Dict[str, Any]], payloads: List[bytes]):
+        """Hänge einen Batch an (ein write() für Segment und Index)"""
+        with self._lock, self._tail_lock():
+            self._sync_tail()
+            if self._segment_size >= self.max_segment_bytes:
+                self._start_segment(self._segment_no + 1, self._last_hash)
+
+            records = bytearray()
+            entries = bytearray()
+            offset = self._segment_size
+            chain_hash = self._last_hash
+
+            for event, payload in zip(events, payloads):
+                chain_hash = _chain(chain_hash, payload)
+                records += RECORD_HEADER.pack(len(payload), chain_hash)
+                records += payload
+                entries += self._index_entry(event, offset, len(payload))
+                offset += RECORD_HEADER.size + len(payload)
+
+            # Erst das Segment, dann der Index: ein Index-Eintrag zeigt nie ins Leere
+            self._segment_file.write(records)
+            self._segment_file.flush()
+            self._index_file.write(entries)
+            self._index_file.flush()
+
+            self._segment_size = offset
+            self._last_hash = chain_hash
+            self._write_tail_state()
+
+    def sync(self):
+        with self._lock:
+            os.fsync(self._segment_file.fileno())
+            os.fsync(self._index_file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    # ------------------------------------------------------------------
+    # Abfragen
+    # ------------------------------------------------------------------
+
+    def _index_entries(self, number: int) -> Iterator[Tuple[float, int, int, int, int]]:
+        data = _mapped(self._index_path(number))
+        if data is None:
+            return
+        try:
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            yield from INDEX_ENTRY.iter_unpack(data[:usable])
+        finally:
+            data.close()
+
+    def query(self, category: Optional[str] = None, user_id: Optional[str] = None,
+              since: Optional[datetime] = None, until: Optional[datetime] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Events nach Kategorie, Benutzer und Zeitraum (neueste zuletzt)"""
+        category_code = self.category_codes.get(category, -1) if category else None
+        user_key = _user_key(user_id) if user_id else None
+        start = since.timestamp() if since else float("-inf")
+        end = until.timestamp() if until else float("inf")
+
+        results: List[Dict[str, Any]] = []
+        for number in self.segment_numbers():
+            matches = [
+                (offset, length)
+                for timestamp, offset, entry_user, length, code in self._index_entries(number)
+                if start <= timestamp <= end
+                and (category_code is None or code == category_code)
+                and (user_key is None or entry_user == user_key)
+            ]
+            if not matches:
+                continue
+
+            data = _mapped(self._segment_path(number))
+            if data is None:
+                continue
+            try:
+                for offset, length in matches:
+                    payload_start = offset + RECORD_HEADER.size
+                    event = json.loads(data[payload_start:payload_start + length])
+                    # Kollisionen des 64-Bit-User-Schlüssels ausschließen
+                    if user_id and str(event.get("user_id")) != str(user_id):
+                        continue
+                    results.append(event)
+            finally:
+                data.close()
+
+        if limit:
+            results = results[-limit:]
+        return results
+
+    # ------------------------------------------------------------------
+    # Integrität
+    # ------------------------------------------------------------------
+
+    def verify_segment(self, number: int, expected_prev: Optional[bytes] = None) -> Dict[str, Any]:
+        """Prüfe die Hash-Kette eines ganzen Segments"""
+        data = _mapped(self._segment_path(number))
+        result = {"segment": number, "valid": True, "records": 0, "error": None, "last_hash": None}
+        if data is None:
+            result.update(valid=False, error="Segment leer")
+            return result
+
+        try:
+            if len(data) < SEGMENT_HEADER.size:
+                result.update(valid=False, error="Ungültiger Segment-Header")
+                return result
+            magic, prev_hash = SEGMENT_HEADER.unpack_from(data, 0)
+            if magic != SEGMENT_MAGIC:
+                result.update(valid=False, error="Ungültiger Segment-Header")
+                return result
+            if expected_prev is not None and prev_hash != expected_prev:
+                result.update(valid=False, error="Kette zum vorherigen Segment unterbrochen")
+                return result
+
+            offset = SEGMENT_HEADER.size
+            while offset + RECORD_HEADER.size <= len(data):
+                length, stored_hash = RECORD_HEADER.unpack_from(data, offset)
+                payload_start = offset + RECORD_HEADER.size
+                if payload_start + length > len(data):
+                    result.update(valid=False, error=f"Unvollständiger Record bei Offset {offset}")
+                    return result
+
+                prev_hash = _chain(prev_hash, data[payload_start:payload_start + length])
+                if prev_hash != stored_hash:
+                    result.update(valid=False, error=f"Hash-Kette verletzt bei Offset {offset}")
+                    return result
+
+                result["records"] += 1
+                offset = payload_start + length
+
+            result["last_hash"] = prev_hash.hex()
+            return result
+        finally:
+            data.close()
+
+    def verify_all(self) -> Dict[str, Any]:
+        """Prüfe alle Segmente inklusive der Verkettung untereinander"""
+        segments = []
+        expected_prev = GENESIS_HASH
+        for number in self.segment_numbers():
+            result = self.verify_segment(number, expected_prev)
+            segments.append(result)
+            if not result["valid"]:
+                break
+            expected_prev = bytes.fromhex(result["last_hash"])
+
+        return {
+            "valid": all(segment["valid"] for segment in segments),
+            "records": sum(segment["records"] for segment in segments),
+            "segments": segments
+        }
@@ -4,14 +4,17 @@ Zentrale Verwaltung aller kryptographischen Operationen
 """
 
 import os
+import time
+import struct
 import hashlib
 import secrets
-from typing import Optional, Tuple, Dict, Any
+import threading
+from typing import Optional, Tuple, Dict, Any, List, Union
 from pathlib import Path
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 import base64
 import json
@@ -20,6 +23,14 @@ from datetime import datetime, timedelta
 
 logger = logging.getLogger("security.crypto")
 
+# Binäres Envelope: version (1 Byte) | iv (12) | tag (16) | ciphertext
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = struct.Struct(">B12s16s")
+GCM_TAG_LENGTH = 16
+
+# Häufige Operationen werden nur aggregiert protokolliert
+AGGREGATED_EVENTS = {"data_encrypted", "data_decrypted", "data_hashed", "integrity_check"}
+
 
 class CryptoManager:
     """Zentraler Verschlüsselungsmanager für alle kryptographischen Operationen"""
@@ -33,6 +44,16 @@ class CryptoManager:
         # Schlüssel-Cache
         self._key_cache: Dict[str, bytes] = {}
         self._fernet_cache: Dict[str, Fernet] = {}
+        # AESGCM-Objekte pro Schlüssel (vermeidet Cipher-Aufbau pro Aufruf)
+        self._aead_cache: Dict[bytes, AESGCM] = {}
+
+        # Aggregiertes Crypto-Logging statt einer Zeile pro Operation
+        self.log_interval_seconds = self.encryption_config.get(
+            "audit_log_interval_seconds", 60
+        )
+        self._event_counts: Dict[str, Dict[str, int]] = {}
+        self._event_lock = threading.Lock()
+        self._last_event_flush = time.monotonic()
 
         # Initialisierung
         self._setup_crypto_environment()
@@ -166,19 +187,8 @@ class CryptoManager:
             if key is None:
                 key = self._get_key(key_type)
 
-            # IV/Nonce generieren (96 bits für GCM)
-            iv = secrets.token_bytes(12)
-
             # AES-256-GCM Verschlüsselung
-            cipher = Cipher(
-                algorithms.AES(key), modes.GCM(iv), backend=default_backend()
-            )
-
-            encryptor = cipher.encryptor()
-            ciphertext = encryptor.update(data) + encryptor.finalize()
-
-            # Authentifizierungs-Tag
-            auth_tag = encryptor.tag
+            iv, ciphertext, auth_tag = self._seal(key, data)
 
             # Ergebnis zusammenstellen
             result = {
@@ -190,16 +200,8 @@ class CryptoManager:
                 "version": 1,
             }
 
-            # Audit-Log
-            self._log_crypto_event(
-                "data_encrypted",
-                {
-                    "data_size": len(data),
-                    "key_type": key_type,
-                    "algorithm": "AES-256-GCM",
-                    "timestamp": datetime.utcnow().isoformat(),
-                },
-            )
+            # Audit-Log (aggregiert)
+            self._log_crypto_event("data_encrypted", {"data_size": len(data)})
 
             return result
 
@@ -235,43 +237,165 @@ class CryptoManager:
             auth_tag = base64.b64decode(encrypted_data["auth_tag"])
 
             # AES-256-GCM Entschlüsselung
-            cipher = Cipher(
-                algorithms.AES(key), modes.GCM(iv, auth_tag), backend=default_backend()
-            )
+            plaintext = self._aead(key).decrypt(iv, ciphertext + auth_tag, None)
 
-            decryptor = cipher.decryptor()
-            plaintext = decryptor.update(ciphertext) + decryptor.finalize()
+            # Audit-Log (aggregiert)
+            self._log_crypto_event("data_decrypted", {"data_size": len(plaintext)})
+
+            return plaintext
+
+        except Exception as e:
+            logger.error(f"Fehler bei der Entschlüsselung: {e}")
+            raise
+
+    def _aead(self, key: bytes) -> AESGCM:
+        """AESGCM-Objekt für einen Schlüssel aus dem Cache"""
+        aead = self._aead_cache.get(key)
+        if aead is None:
+            aead = self._aead_cache[key] = AESGCM(key)
+        return aead
+
+    def _seal(self, key: bytes, data: bytes) -> Tuple[bytes, bytes, bytes]:
+        """Verschlüssele mit frischem 96-bit IV: (iv, ciphertext, tag)"""
+        iv = secrets.token_bytes(12)
+        sealed = self._aead(key).encrypt(iv, data, None)
+        return iv, sealed[:-GCM_TAG_LENGTH], sealed[-GCM_TAG_LENGTH:]
+
+    def _open_envelope(self, key: bytes, envelope: bytes) -> bytes:
+        version, iv, auth_tag = ENVELOPE_HEADER.unpack_from(envelope, 0)
+        if version != ENVELOPE_VERSION:
+            raise ValueError(f"Unbekannte Envelope-Version: {version}")
+        ciphertext = envelope[ENVELOPE_HEADER.size:]
+        return self._aead(key).decrypt(iv, ciphertext + auth_tag, None)
+
+    def encrypt_bytes(
+        self, data: bytes, key: Optional[bytes] = None, key_type: str = "default"
+    ) -> bytes:
+        """
+        Verschlüssele Daten in ein kompaktes binäres Envelope
+
+        Args:
+            data: Zu verschlüsselnde Daten
+            key: Verschlüsselungsschlüssel (optional)
+            key_type: Typ des Schlüssels wenn key nicht angegeben
+
+        Returns:
+            version | iv | tag | ciphertext als bytes
+        """
+        return self.encrypt_many([data], key=key, key_type=key_type)[0]
+
+    def decrypt_bytes(
+        self, envelope: bytes, key: Optional[bytes] = None, key_type: str = "default"
+    ) -> bytes:
+        """
+        Entschlüssele ein binäres Envelope
+
+        Args:
+            envelope: Ergebnis von encrypt_bytes
+            key: Entschlüsselungsschlüssel (optional)
+            key_type: Typ des Schlüssels wenn key nicht angegeben
+
+        Returns:
+            Entschlüsselte Daten als bytes
+        """
+        return self.decrypt_many([envelope], key=key, key_type=key_type)[0]
+
+    def encrypt_many(
+        self, items: List[bytes], key: Optional[bytes] = None, key_type: str = "default"
+    ) -> List[bytes]:
+        """
+        Verschlüssele mehrere Datensätze mit einem Schlüssel-Lookup
+
+        Args:
+            items: Liste zu verschlüsselnder Daten
+            key: Verschlüsselungsschlüssel (optional)
+            key_type: Typ des Schlüssels wenn key nicht angegeben
+
+        Returns:
+            Liste binärer Envelopes in gleicher Reihenfolge
+        """
+        try:
+            if key is None:
+                key = self._get_key(key_type)
+
+            envelopes = []
+            total_size = 0
+            for data in items:
+                iv, ciphertext, auth_tag = self._seal(key, data)
+                envelopes.append(ENVELOPE_HEADER.pack(ENVELOPE_VERSION, iv, auth_tag) + ciphertext)
+                total_size += len(data)
 
-            # Audit-Log
             self._log_crypto_event(
-                "data_decrypted",
-                {
-                    "data_size": len(plaintext),
-                    "key_type": key_type,
-                    "algorithm": encrypted_data.get("algorithm", "AES-256-GCM"),
-                    "timestamp": datetime.utcnow().isoformat(),
-                },
+                "data_encrypted", {"data_size": total_size}, count=len(items)
             )
+            return envelopes
 
-            return plaintext
+        except Exception as e:
+            logger.error(f"Fehler bei der Bulk-Verschlüsselung: {e}")
+            raise
+
+    def decrypt_many(
+        self,
+        items: List[Union[bytes, Dict[str, Any]]],
+        key: Optional[bytes] = None,
+        key_type: str = "default",
+    ) -> List[bytes]:
+        """
+        Entschlüssele mehrere Datensätze mit einem Schlüssel-Lookup
+
+        Args:
+            items: Binäre Envelopes oder Dictionaries aus encrypt_data
+            key: Entschlüsselungsschlüssel (optional)
+            key_type: Typ des Schlüssels wenn key nicht angegeben
+
+        Returns:
+            Liste entschlüsselter Daten in gleicher Reihenfolge
+        """
+        try:
+            if key is None:
+                key = self._get_key(key_type)
+
+            plaintexts = []
+            total_size = 0
+            for item in items:
+                if isinstance(item, dict):
+                    iv = base64.b64decode(item["iv"])
+                    sealed = base64.b64decode(item["ciphertext"]) + base64.b64decode(item["auth_tag"])
+                    plaintext = self._aead(key).decrypt(iv, sealed, None)
+                else:
+                    plaintext = self._open_envelope(key, item)
+                plaintexts.append(plaintext)
+                total_size += len(plaintext)
+
+            self._log_crypto_event(
+                "data_decrypted", {"data_size": total_size}, count=len(items)
+            )
+            return plaintexts
 
         except Exception as e:
-            logger.error(f"Fehler bei der Entschlüsselung: {e}")
+            logger.error(f"Fehler bei der Bulk-Entschlüsselung: {e}")
             raise
 
-    def encrypt_string(self, text: str, key_type: str = "default") -> str:
+    def encrypt_string(
+        self, text: str, key_type: str = "default", compact: bool = False
+    ) -> str:
         """
         Verschlüssele einen String (Convenience-Methode)
 
         Args:
             text: Zu verschlüsselnder Text
             key_type: Typ des Schlüssels
+            compact: Base64-kodiertes binäres Envelope statt JSON
 
         Returns:
             Base64-kodierte verschlüsselte Daten als JSON-String
+            (bzw. als Envelope bei compact=True)
         """
         try:
             data = text.encode("utf-8")
+            if compact:
+                envelope = self.encrypt_bytes(data, key_type=key_type)
+                return base64.b64encode(envelope).decode("ascii")
             encrypted = self.encrypt_data(data, key_type=key_type)
             return json.dumps(encrypted)
 
@@ -284,13 +408,18 @@ class CryptoManager:
         Entschlüssele einen String (Convenience-Methode)
 
         Args:
-            encrypted_text: Verschlüsselter Text als JSON-String
+            encrypted_text: Verschlüsselter Text als JSON-String oder Envelope
             key_type: Typ des Schlüssels
 
         Returns:
             Entschlüsselter Text
         """
         try:
+            # Kompaktes Envelope (Base64 beginnt nie mit "{")
+            if not encrypted_text.startswith("{"):
+                envelope = base64.b64decode(encrypted_text)
+                return self.decrypt_bytes(envelope, key_type=key_type).decode("utf-8")
+
             encrypted_data = json.loads(encrypted_text)
             decrypted = self.decrypt_data(encrypted_data, key_type=key_type)
             return decrypted.decode("utf-8")
@@ -355,15 +484,8 @@ class CryptoManager:
             hash_obj.update(data)
             hash_hex = hash_obj.hexdigest()
 
-            # Audit-Log
-            self._log_crypto_event(
-                "data_hashed",
-                {
-                    "data_size": len(data),
-                    "algorithm": algorithm,
-                    "timestamp": datetime.utcnow().isoformat(),
-                },
-            )
+            # Audit-Log (aggregiert)
+            self._log_crypto_event("data_hashed", {"data_size": len(data)})
 
             return hash_hex
 
@@ -389,15 +511,10 @@ class CryptoManager:
             actual_hash = self.hash_data(data, algorithm)
             is_valid = actual_hash == expected_hash
 
-            # Audit-Log
-            self._log_crypto_event(
-                "integrity_check",
-                {
-                    "is_valid": is_valid,
-                    "algorithm": algorithm,
-                    "timestamp": datetime.utcnow().isoformat(),
-                },
-            )
+            # Audit-Log (aggregiert; Fehlschläge zusätzlich einzeln)
+            self._log_crypto_event("integrity_check", {"invalid": 0 if is_valid else 1})
+            if not is_valid:
+                logger.warning(f"Integritätsprüfung fehlgeschlagen ({algorithm})")
 
             return is_valid
 
@@ -419,21 +536,59 @@ class CryptoManager:
             self.generate_key(key_type)
         return self._key_cache[key_type]
 
-    def _log_crypto_event(self, event_type: str, details: Dict[str, Any]):
+    def _log_crypto_event(
+        self, event_type: str, details: Dict[str, Any], count: int = 1
+    ):
         """
         Logge kryptographische Ereignisse für Audit-Zwecke
 
+        Häufige Operationen (Ver-/Entschlüsselung, Hashing) werden nur
+        gezählt und höchstens alle ``log_interval_seconds`` als Summe
+        protokolliert; Schlüsselereignisse sofort.
+
         Args:
             event_type: Typ des Ereignisses
-            details: Ereignis-Details
+            details: Ereignis-Details (bei aggregierten Ereignissen Zähler)
+            count: Anzahl zusammengefasster Operationen
         """
         try:
-            audit_logger = logging.getLogger("audit")
-            audit_logger.info(f"CRYPTO_EVENT: {event_type} - {json.dumps(details)}")
+            if event_type not in AGGREGATED_EVENTS:
+                audit_logger = logging.getLogger("audit")
+                audit_logger.info(f"CRYPTO_EVENT: {event_type} - {json.dumps(details)}")
+                return
+
+            with self._event_lock:
+                counters = self._event_counts.setdefault(event_type, {"count": 0})
+                counters["count"] += count
+                for name, value in details.items():
+                    counters[name] = counters.get(name, 0) + value
+
+                if time.monotonic() - self._last_event_flush < self.log_interval_seconds:
+                    return
+                summary = self._event_counts
+                self._event_counts = {}
+                self._last_event_flush = time.monotonic()
+
+            self._emit_crypto_summary(summary)
 
         except Exception as e:
             logger.error(f"Fehler beim Loggen des Crypto-Ereignisses: {e}")
 
+    def _emit_crypto_summary(self, summary: Dict[str, Dict[str, int]]):
+        audit_logger = logging.getLogger("audit")
+        audit_logger.info(
+            f"CRYPTO_EVENT: summary - {json.dumps({'interval_seconds': self.log_interval_seconds, 'operations': summary})}"
+        )
+
+    def flush_crypto_events(self):
+        """Schreibe die aggregierten Crypto-Ereignisse sofort"""
+        with self._event_lock:
+            summary = self._event_counts
+            self._event_counts = {}
+            self._last_event_flush = time.monotonic()
+        if summary:
+            self._emit_crypto_summary(summary)
+
     def rotate_key(self, key_type: str) -> bytes:
         """
         Rotiere einen Schlüssel (generiere neuen und archiviere alten)
@@ -446,6 +601,7 @@ class CryptoManager:
         """
         try:
             # Alten Schlüssel archivieren
+            old_key = None
             if key_type in self._key_cache:
                 old_key = self._key_cache[key_type]
                 timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
@@ -458,6 +614,9 @@ class CryptoManager:
             # Fernet-Cache leeren
             if key_type in self._fernet_cache:
                 del self._fernet_cache[key_type]
+            # AESGCM des alten Schlüssels wird bei Bedarf neu aufgebaut
+            if old_key is not None:
+                self._aead_cache.pop(old_key, None)
 
             # Audit-Log
             self._log_crypto_event(
@@ -498,7 +657,7 @@ class CryptoManager:
 
             # Alte Schlüssel entfernen
             for key_type in keys_to_remove:
-                del self._key_cache[key_type]
+                self._aead_cache.pop(self._key_cache.pop(key_type), None)
                 logger.info(f"Alter Schlüssel entfernt: {key_type}")
 
             # Audit-Log
@@ -116,6 +116,14 @@ class KeyManager:
         # Thread-Sicherheit
         self.lock = threading.RLock()
 
+        # Nutzungszähler nur im Speicher; periodischer atomarer Snapshot
+        self._usage_lock = threading.Lock()
+        self._metadata_dirty = False
+        self.snapshot_interval_seconds = self.key_rotation_config.get(
+            "usage_snapshot_interval_seconds", 30
+        )
+        self.snapshot_thread = None
+
         # Rotation-Thread
         self.rotation_thread = None
         self.shutdown_event = threading.Event()
@@ -147,8 +155,9 @@ class KeyManager:
             # Aktive Schlüssel laden
             self._load_active_keys()
 
-            # Rotation-Thread starten
+            # Rotation- und Snapshot-Thread starten
             self._start_rotation_thread()
+            self._start_snapshot_thread()
 
             logger.info("Key-Manager erfolgreich initialisiert")
 
@@ -240,18 +249,29 @@ class KeyManager:
             logger.error(f"Fehler beim Laden der Metadaten: {e}")
 
     def _save_metadata(self):
-        """Speichere Schlüssel-Metadaten"""
+        """Speichere Schlüssel-Metadaten atomar (Temp-Datei + rename)"""
         try:
-            metadata_dict = {}
-            for key_id, metadata in self.key_metadata.items():
-                metadata_dict[key_id] = metadata.to_dict()
-
-            with open(self.metadata_file, "w") as f:
-                json.dump(metadata_dict, f, indent=2)
-
-            os.chmod(self.metadata_file, 0o600)
+            with self.lock:
+                with self._usage_lock:
+                    metadata_dict = {}
+                    for key_id, metadata in self.key_metadata.items():
+                        metadata_dict[key_id] = metadata.to_dict()
+                    self._metadata_dirty = False
+
+                tmp_file = self.metadata_file.with_name(self.metadata_file.name + ".tmp")
+                fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    json.dump(metadata_dict, f, separators=(",", ":"))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                # Leser sehen immer entweder den alten oder den neuen Stand
+                os.replace(tmp_file, self.metadata_file)
 
         except Exception as e:
+            # Snapshot nicht geschrieben: beim nächsten Flush erneut versuchen
+            with self._usage_lock:
+                self._metadata_dirty = True
             logger.error(f"Fehler beim Speichern der Metadaten: {e}")
             raise
 
@@ -380,29 +400,30 @@ class KeyManager:
             Schlüssel-Daten oder None
         """
         try:
-            with self.lock:
-                # Prüfe ob Schlüssel aktiv ist
-                if key_id not in self.active_keys:
-                    return None
+            # Dictionary-Lookups ohne globalen Lock
+            key_data = self.active_keys.get(key_id)
+            if key_data is None:
+                return None
 
-                metadata = self.key_metadata.get(key_id)
-                if not metadata or metadata.status != KeyStatus.ACTIVE:
-                    return None
+            metadata = self.key_metadata.get(key_id)
+            if not metadata or metadata.status != KeyStatus.ACTIVE:
+                return None
 
-                # Prüfe Ablaufzeit
-                if (
-                    metadata.expires_at
-                    and datetime.now(timezone.utc) > metadata.expires_at
-                ):
-                    self._expire_key(key_id)
-                    return None
+            # Prüfe Ablaufzeit
+            now = datetime.now(timezone.utc)
+            if metadata.expires_at and now > metadata.expires_at:
+                with self.lock:
+                    if metadata.status == KeyStatus.ACTIVE:
+                        self._expire_key(key_id)
+                return None
 
-                # Nutzung protokollieren
-                metadata.last_used = datetime.now(timezone.utc)
+            # Nutzung nur im Speicher zählen (Snapshot-Thread persistiert)
+            with self._usage_lock:
+                metadata.last_used = now
                 metadata.usage_count += 1
-                self._save_metadata()
+                self._metadata_dirty = True
 
-                return self.active_keys[key_id]
+            return key_data
 
         except Exception as e:
             logger.error(f"Fehler beim Abrufen des Schlüssels: {e}")
@@ -629,6 +650,31 @@ class KeyManager:
         except Exception as e:
             logger.error(f"Fehler beim Starten der Rotation: {e}")
 
+    def _start_snapshot_thread(self):
+        """Starte Thread für periodische Metadaten-Snapshots"""
+        try:
+            self.snapshot_thread = threading.Thread(
+                target=self._snapshot_worker, daemon=True, name="KeyMetadataSnapshot"
+            )
+            self.snapshot_thread.start()
+
+        except Exception as e:
+            logger.error(f"Fehler beim Starten des Snapshot-Threads: {e}")
+
+    def _snapshot_worker(self):
+        """Schreibe geänderte Nutzungszähler im konfigurierten Takt"""
+        while not self.shutdown_event.wait(self.snapshot_interval_seconds):
+            self.flush_usage()
+
+    def flush_usage(self):
+        """Persistiere Nutzungszähler, falls seit dem letzten Snapshot geändert"""
+        if not self._metadata_dirty:
+            return
+        try:
+            self._save_metadata()
+        except Exception as e:
+            logger.error(f"Fehler beim Metadaten-Snapshot: {e}")
+
     def _auto_rotation_worker(self):
         """Worker für automatische Schlüsselrotation"""
         while not self.shutdown_event.is_set():
@@ -762,9 +808,14 @@ class KeyManager:
             # Shutdown-Signal setzen
             self.shutdown_event.set()
 
-            # Warte auf Rotation-Thread
+            # Warte auf Rotation- und Snapshot-Thread
             if self.rotation_thread and self.rotation_thread.is_alive():
                 self.rotation_thread.join(timeout=5.0)
+            if self.snapshot_thread and self.snapshot_thread.is_alive():
+                self.snapshot_thread.join(timeout=5.0)
+
+            # Letzten Stand der Nutzungszähler schreiben
+            self.flush_usage()
 
             # Aktive Schlüssel aus Speicher löschen
             with self.lock:
@@ -6,8 +6,9 @@ Sichere Verwaltung von Benutzer-Sessions mit Verschlüsselung und Audit-Logging
 import secrets
 import hashlib
 import json
+import heapq
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Optional, Set, List
+from typing import Dict, Any, Optional, Set, List, Tuple
 import threading
 import time
 from dataclasses import dataclass, asdict
@@ -29,7 +30,7 @@ class SessionStatus(Enum):
     SUSPENDED = "suspended"
 
 
-@dataclass
+@dataclass(slots=True)
 class SessionData:
     """Datenstruktur für Session-Informationen"""
 
@@ -78,6 +79,249 @@ class SecurityFlags:
     ELEVATED_PRIVILEGES = 64
 
 
+class SessionBackend:
+    """Schnittstelle für persistente Session-Speicher
+
+    Der SessionManager nutzt seine Shards als Read-Through-Cache vor dem
+    Backend; das Backend ist die gemeinsame Wahrheit aller Worker.
+    """
+
+    name = "custom"
+
+    def load(self, session_id: str) -> Optional[SessionData]:
+        """Lade eine Session (None wenn unbekannt)"""
+        raise NotImplementedError
+
+    def save(self, session: SessionData):
+        """Speichere eine Session; inaktive Sessions werden nie reaktiviert"""
+        raise NotImplementedError
+
+    def touch(self, session_id: str, expires_at: datetime):
+        """Schreibe nur die verlängerte Ablaufzeit einer aktiven Session"""
+        raise NotImplementedError
+
+    def count_active(self, user_id: str, now: datetime) -> int:
+        """Anzahl aktiver, nicht abgelaufener Sessions eines Benutzers"""
+        raise NotImplementedError
+
+    def list_active(self, user_id: Optional[str], now: datetime) -> List[SessionData]:
+        """Aktive Sessions (optional nur eines Benutzers)
+
+        ``session_id`` ist hier der gespeicherte Schlüssel, nicht zwingend
+        die Session-ID selbst.
+        """
+        raise NotImplementedError
+
+    def terminate_user(self, user_id: str, exclude_session_id: Optional[str]) -> int:
+        """Beende aktive Sessions eines Benutzers außer exclude_session_id: Anzahl"""
+        raise NotImplementedError
+
+    def expire_sessions(self, now: datetime, purge_before: datetime) -> Tuple[int, int]:
+        """Markiere abgelaufene Sessions, lösche alte inaktive: (abgelaufen, gelöscht)"""
+        raise NotImplementedError
+
+    def close(self):
+        """Gib Ressourcen des Backends frei"""
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Session-Backend auf der ``sessions``-Tabelle aus database/schema.sql
+
+    Zeitstempel werden als UTC im Format von ``CURRENT_TIMESTAMP`` (mit
+    Mikrosekunden) gespeichert, damit die View ``active_sessions`` korrekt
+    vergleicht. Status und verschlüsselte Session-Daten liegen als JSON in
+    ``security_flags``; anonyme Sessions haben ``user_id = ''``.
+
+    Die Session-ID selbst wird nie gespeichert: ``id`` und ``session_token``
+    enthalten ihren SHA-256, ein Datenbank-Leak liefert so keine gültigen
+    Session-IDs. ``list_active`` gibt deshalb den Hash als ``session_id`` zurück.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            session_token TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ip_address TEXT,
+            user_agent TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            security_flags TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+        CREATE INDEX IF NOT EXISTS idx_sessions_token ON sessions(session_token);
+        CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);
+        CREATE INDEX IF NOT EXISTS idx_sessions_active ON sessions(is_active);
+    """
+
+    COLUMNS = (
+        "id, user_id, created_at, last_activity, expires_at, "
+        "ip_address, user_agent, is_active, security_flags"
+    )
+
+    def __init__(self, db_path: str):
+        # Verzögerter Import: db_pool liegt im ai_core-Hauptverzeichnis
+        from db_pool import get_connection
+
+        self.db_path = db_path
+        self._connect = get_connection
+        self._connect(self.db_path).executescript(self.SCHEMA)
+
+    @staticmethod
+    def _token(session_id: str) -> str:
+        return hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _to_db(value: datetime) -> str:
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    @staticmethod
+    def _from_db(value: str) -> datetime:
+        return datetime.fromisoformat(str(value)).replace(tzinfo=timezone.utc)
+
+    def _row_to_session(self, row, session_id: Optional[str] = None) -> SessionData:
+        (token, user_id, created_at, last_activity, expires_at,
+         ip_address, user_agent, is_active, extra) = row
+        extra = json.loads(extra) if extra else {}
+
+        status = SessionStatus(extra.get("status", SessionStatus.ACTIVE.value))
+        if not is_active and status == SessionStatus.ACTIVE:
+            status = SessionStatus.EXPIRED
+
+        return SessionData(
+            session_id=session_id or token,
+            user_id=user_id or None,
+            created_at=self._from_db(created_at),
+            last_activity=self._from_db(last_activity),
+            expires_at=self._from_db(expires_at),
+            ip_address=ip_address,
+            user_agent=user_agent,
+            status=status,
+            security_flags=extra.get("flags", 0),
+            data=extra.get("data"),
+        )
+
+    def load(self, session_id):
+        row = self._connect(self.db_path).execute(
+            f"SELECT {self.COLUMNS} FROM sessions WHERE id = ?", (self._token(session_id),)
+        ).fetchone()
+        return self._row_to_session(row, session_id) if row else None
+
+    def save(self, session):
+        extra = json.dumps({
+            "status": session.status.value,
+            "flags": session.security_flags,
+            "data": session.data,
+        })
+        token = self._token(session.session_id)
+        with self._connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT INTO sessions (id, user_id, session_token, created_at, expires_at,
+                                      last_activity, ip_address, user_agent, is_active, security_flags)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    expires_at = excluded.expires_at,
+                    is_active = excluded.is_active,
+                    security_flags = excluded.security_flags
+                WHERE sessions.is_active = 1
+            """, (
+                token,
+                session.user_id or "",
+                token,
+                self._to_db(session.created_at),
+                self._to_db(session.expires_at),
+                self._to_db(session.last_activity),
+                session.ip_address,
+                session.user_agent,
+                1 if session.status == SessionStatus.ACTIVE else 0,
+                extra,
+            ))
+
+    def touch(self, session_id, expires_at):
+        with self._connect(self.db_path) as conn:
+            conn.execute(
+                "UPDATE sessions SET expires_at = ? WHERE id = ? AND is_active = 1",
+                (self._to_db(expires_at), self._token(session_id)),
+            )
+
+    def count_active(self, user_id, now):
+        return self._connect(self.db_path).execute(
+            "SELECT COUNT(*) FROM sessions WHERE user_id = ? AND is_active = 1 AND expires_at > ?",
+            (user_id, self._to_db(now)),
+        ).fetchone()[0]
+
+    def list_active(self, user_id, now):
+        query = f"SELECT {self.COLUMNS} FROM sessions WHERE is_active = 1 AND expires_at > ?"
+        params = [self._to_db(now)]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        rows = self._connect(self.db_path).execute(query, params).fetchall()
+        return [self._row_to_session(row) for row in rows]
+
+    def terminate_user(self, user_id, exclude_session_id):
+        exclude = self._token(exclude_session_id) if exclude_session_id else ""
+        with self._connect(self.db_path) as conn:
+            return conn.execute("""
+                UPDATE sessions
+                SET is_active = 0,
+                    security_flags = json_set(COALESCE(security_flags, '{}'), '$.status', ?)
+                WHERE user_id = ? AND is_active = 1 AND id != ?
+            """, (SessionStatus.TERMINATED.value, user_id, exclude)).rowcount
+
+    def expire_sessions(self, now, purge_before):
+        with self._connect(self.db_path) as conn:
+            expired = conn.execute(
+                "UPDATE sessions SET is_active = 0 WHERE is_active = 1 AND expires_at <= ?",
+                (self._to_db(now),),
+            ).rowcount
+            removed = conn.execute(
+                "DELETE FROM sessions WHERE is_active = 0 AND created_at < ?",
+                (self._to_db(purge_before),),
+            ).rowcount
+        return expired, removed
+
+
+class _SessionShard:
+    """Teil des Session-Speichers mit eigenem Lock und Ablauf-Heap
+
+    Jede Session hat genau einen Heap-Eintrag ``(frist, session_id)``.
+    Verlängerungen ändern den Heap nicht; erst wenn ein Eintrag fällig wird,
+    wird er mit der aktuellen Frist neu eingeplant. Die Bereinigung kostet
+    damit O(fällige Einträge) statt O(alle Sessions).
+    """
+
+    __slots__ = ("lock", "sessions", "expiry_heap", "checked_at", "persisted_at")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.sessions: Dict[str, SessionData] = {}
+        self.expiry_heap: List[tuple] = []
+        # Nur mit Backend: letzter Abgleich bzw. letzte geschriebene Verlängerung
+        self.checked_at: Dict[str, float] = {}
+        self.persisted_at: Dict[str, float] = {}
+
+    def evict(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        self.checked_at.pop(session_id, None)
+        self.persisted_at.pop(session_id, None)
+
+
+class _UserShard:
+    """Teil des Index user_id -> aktive Session-IDs"""
+
+    __slots__ = ("lock", "user_sessions")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.user_sessions: Dict[str, Set[str]] = {}
+
+
 class SessionManager:
     """Zentraler Session-Manager für sichere Session-Verwaltung"""
 
@@ -86,6 +330,7 @@ class SessionManager:
         config: Dict[str, Any],
         crypto_manager: CryptoManager,
         audit_logger: AuditLogger,
+        backend: Optional[SessionBackend] = None,
     ):
         self.config = config
         self.crypto_manager = crypto_manager
@@ -102,12 +347,24 @@ class SessionManager:
             "max_concurrent_sessions", 1
         )
 
-        # Session-Storage (in-memory mit Verschlüsselung)
-        self.sessions: Dict[str, SessionData] = {}
-        self.user_sessions: Dict[str, Set[str]] = {}  # user_id -> set of session_ids
+        self.shard_count = self.session_config.get("session_shards", 16)
+        self.cleanup_interval_seconds = self.session_config.get(
+            "session_cleanup_interval_seconds", 60
+        )
 
-        # Thread-Sicherheit
-        self.lock = threading.RLock()
+        # Session-Storage (in-memory mit Verschlüsselung), nach Session-ID
+        # bzw. User-ID auf Shards verteilt. Lock-Reihenfolge: User-Shard vor
+        # Session-Shard, niemals umgekehrt.
+        self._session_shards = [_SessionShard() for _ in range(self.shard_count)]
+        self._user_shards = [_UserShard() for _ in range(self.shard_count)]
+        self._stats_lock = threading.Lock()
+
+        # Persistentes Backend (gemeinsam für alle Worker, übersteht Neustarts)
+        self.backend = backend or self._create_backend()
+        self.cache_ttl_seconds = self.session_config.get("session_cache_ttl_seconds", 2)
+        self.touch_interval_seconds = self.session_config.get(
+            "session_touch_interval_seconds", 60
+        )
 
         # Cleanup-Thread
         self.cleanup_thread = None
@@ -124,6 +381,75 @@ class SessionManager:
 
         self._start_cleanup_thread()
 
+    def _create_backend(self) -> Optional[SessionBackend]:
+        """Backend laut Konfiguration (``memory`` = nur im Prozess)"""
+        backend_name = self.session_config.get("session_backend", "memory")
+        if backend_name == "sqlite":
+            return SQLiteSessionBackend(
+                self.session_config.get("session_db_path", "database/creative_muse.db")
+            )
+        if backend_name != "memory":
+            logger.warning(f"Unbekanntes Session-Backend '{backend_name}', nutze memory")
+        return None
+
+    def _session_shard(self, session_id: str) -> _SessionShard:
+        return self._session_shards[hash(session_id) % self.shard_count]
+
+    def _user_shard(self, user_id: str) -> _UserShard:
+        return self._user_shards[hash(user_id) % self.shard_count]
+
+    def _get_session(self, session_id: str) -> Optional[SessionData]:
+        shard = self._session_shard(session_id)
+        with shard.lock:
+            return self._lookup(shard, session_id)
+
+    def _lookup(self, shard: _SessionShard, session_id: str) -> Optional[SessionData]:
+        """Session aus dem Cache, nach cache_ttl_seconds mit dem Backend abgeglichen
+
+        Muss mit gehaltenem Shard-Lock aufgerufen werden. Beendigungen durch
+        andere Worker werden so spätestens nach cache_ttl_seconds sichtbar.
+        """
+        session = shard.sessions.get(session_id)
+        if self.backend is None:
+            return session
+
+        now = time.monotonic()
+        if session is not None and now - shard.checked_at.get(session_id, 0.0) < self.cache_ttl_seconds:
+            return session
+
+        stored = self.backend.load(session_id)
+        if stored is None:
+            shard.evict(session_id)
+            return None
+
+        if session is None:
+            shard.sessions[session_id] = session = stored
+            shard.persisted_at[session_id] = now
+            heapq.heappush(shard.expiry_heap, (stored.expires_at, session_id))
+        else:
+            # Lokale, noch nicht geschriebene Verlängerung behalten
+            session.status = stored.status
+            session.data = stored.data
+            session.security_flags |= stored.security_flags
+            session.expires_at = max(session.expires_at, stored.expires_at)
+            session.last_activity = max(session.last_activity, stored.last_activity)
+
+        shard.checked_at[session_id] = now
+        return session
+
+    def _persist(self, shard: _SessionShard, session: SessionData):
+        """Session vollständig ins Backend schreiben (Shard-Lock gehalten)"""
+        if self.backend is None:
+            return
+        self.backend.save(session)
+        shard.persisted_at[session.session_id] = shard.checked_at[session.session_id] = time.monotonic()
+
+    def _count(self, **deltas: int):
+        """Statistiken thread-sicher anpassen"""
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
     def _start_cleanup_thread(self):
         """Starte Thread für automatische Session-Bereinigung"""
         try:
@@ -158,78 +484,82 @@ class SessionManager:
             Session-ID
         """
         try:
-            with self.lock:
-                # Prüfe maximale gleichzeitige Sessions
-                if user_id and self._check_max_sessions(user_id):
-                    raise ValueError(
-                        f"Maximale Anzahl gleichzeitiger Sessions erreicht: {self.max_concurrent_sessions}"
-                    )
-
-                # Session-ID generieren
-                session_id = self._generate_session_id()
-
-                # Session-Daten erstellen
-                now = datetime.now(timezone.utc)
-                expires_at = now + timedelta(minutes=self.session_timeout_minutes)
-
-                # Session-Daten verschlüsseln falls vorhanden
-                encrypted_data = None
-                if session_data:
-                    data_json = json.dumps(session_data)
-                    encrypted_data = self.crypto_manager.encrypt_string(
-                        data_json, "session"
-                    )
-
-                session = SessionData(
-                    session_id=session_id,
-                    user_id=user_id,
-                    created_at=now,
-                    last_activity=now,
-                    expires_at=expires_at,
-                    ip_address=ip_address,
-                    user_agent=user_agent,
-                    status=SessionStatus.ACTIVE,
-                    data={"encrypted": encrypted_data} if encrypted_data else None,
+            # Session-Daten außerhalb der Locks verschlüsseln
+            encrypted_data = None
+            if session_data:
+                data_json = json.dumps(session_data)
+                encrypted_data = self.crypto_manager.encrypt_string(
+                    data_json, "session", compact=True
                 )
 
-                # Session speichern
-                self.sessions[session_id] = session
-
-                # User-Session-Mapping aktualisieren
-                if user_id:
-                    if user_id not in self.user_sessions:
-                        self.user_sessions[user_id] = set()
-                    self.user_sessions[user_id].add(session_id)
+            # Session-ID generieren
+            session_id = self._generate_session_id()
+
+            # Session-Daten erstellen
+            now = datetime.now(timezone.utc)
+            expires_at = now + timedelta(minutes=self.session_timeout_minutes)
+
+            session = SessionData(
+                session_id=session_id,
+                user_id=user_id,
+                created_at=now,
+                last_activity=now,
+                expires_at=expires_at,
+                ip_address=ip_address,
+                user_agent=user_agent,
+                status=SessionStatus.ACTIVE,
+                data={"encrypted": encrypted_data} if encrypted_data else None,
+            )
 
-                # Statistiken aktualisieren
-                self.stats["total_sessions_created"] += 1
-                self.stats["active_sessions"] += 1
-
-                # Audit-Log
-                self.audit_logger.log_event(
-                    category=EventCategory.SYSTEM_EVENTS,
-                    event_type="session_created",
-                    source_component="session_manager",
-                    description="New session created",
-                    details={
-                        "session_id": session_id,
-                        "user_id": user_id,
-                        "ip_address": ip_address,
-                        "expires_at": expires_at.isoformat(),
-                    },
-                    user_id=user_id,
-                    session_id=session_id,
-                    ip_address=ip_address,
-                    user_agent=user_agent,
-                )
+            if user_id:
+                # Limit-Prüfung und Eintragung atomar im User-Shard
+                user_shard = self._user_shard(user_id)
+                with user_shard.lock:
+                    if self._check_max_sessions(user_id):
+                        raise ValueError(
+                            f"Maximale Anzahl gleichzeitiger Sessions erreicht: {self.max_concurrent_sessions}"
+                        )
+                    self._store_session(session)
+                    user_shard.user_sessions.setdefault(user_id, set()).add(session_id)
+            else:
+                self._store_session(session)
+
+            # Statistiken aktualisieren
+            self._count(total_sessions_created=1, active_sessions=1)
+
+            # Audit-Log
+            self.audit_logger.log_event(
+                category=EventCategory.SYSTEM_EVENTS,
+                event_type="session_created",
+                source_component="session_manager",
+                description="New session created",
+                details={
+                    "session_id": session_id,
+                    "user_id": user_id,
+                    "ip_address": ip_address,
+                    "expires_at": expires_at.isoformat(),
+                },
+                user_id=user_id,
+                session_id=session_id,
+                ip_address=ip_address,
+                user_agent=user_agent,
+            )
 
-                logger.info(f"Session erstellt: {session_id} für User: {user_id}")
-                return session_id
+            logger.info(f"Session erstellt: {session_id} für User: {user_id}")
+            return session_id
 
         except Exception as e:
             logger.error(f"Fehler beim Erstellen der Session: {e}")
             raise
 
+    def _store_session(self, session: SessionData):
+        """Session speichern und Ablauf einplanen"""
+        shard = self._session_shard(session.session_id)
+        with shard.lock:
+            self._persist(shard, session)
+            shard.sessions[session.session_id] = session
+            heapq.heappush(shard.expiry_heap, (session.expires_at, session.session_id))
+
     def validate_session(
         self,
         session_id: str,
@@ -248,8 +578,9 @@ class SessionManager:
             SessionData wenn gültig, None sonst
         """
         try:
-            with self.lock:
-                session = self.sessions.get(session_id)
+            shard = self._session_shard(session_id)
+            with shard.lock:
+                session = self._lookup(shard, session_id)
 
                 if not session:
                     self._log_security_event(
@@ -274,31 +605,44 @@ class SessionManager:
                     session, ip_address, user_agent
                 )
 
-                # Session aktualisieren
+                # Session aktualisieren (der Heap-Eintrag wird erst bei
+                # Fälligkeit auf die neue Frist verschoben)
                 session.last_activity = now
                 session.expires_at = now + timedelta(
                     minutes=self.session_timeout_minutes
                 )
+                new_flags = security_flags & ~session.security_flags
                 session.security_flags |= security_flags
 
-                # Audit-Log für Session-Zugriff
-                self.audit_logger.log_event(
-                    category=EventCategory.SYSTEM_EVENTS,
-                    event_type="session_accessed",
-                    source_component="session_manager",
-                    description="Session accessed and validated",
-                    details={
-                        "session_id": session_id,
-                        "security_flags": security_flags,
-                        "new_expires_at": session.expires_at.isoformat(),
-                    },
-                    user_id=session.user_id,
-                    session_id=session_id,
-                    ip_address=ip_address,
-                    user_agent=user_agent,
-                )
+                # Verlängerung nur alle touch_interval_seconds schreiben
+                if self.backend is not None:
+                    if new_flags:
+                        self._persist(shard, session)
+                    elif (
+                        time.monotonic() - shard.persisted_at.get(session_id, 0.0)
+                        >= self.touch_interval_seconds
+                    ):
+                        self.backend.touch(session_id, session.expires_at)
+                        shard.persisted_at[session_id] = time.monotonic()
+
+            # Audit-Log für Session-Zugriff
+            self.audit_logger.log_event(
+                category=EventCategory.SYSTEM_EVENTS,
+                event_type="session_accessed",
+                source_component="session_manager",
+                description="Session accessed and validated",
+                details={
+                    "session_id": session_id,
+                    "security_flags": security_flags,
+                    "new_expires_at": session.expires_at.isoformat(),
+                },
+                user_id=session.user_id,
+                session_id=session_id,
+                ip_address=ip_address,
+                user_agent=user_agent,
+            )
 
-                return session
+            return session
 
         except Exception as e:
             logger.error(f"Fehler bei der Session-Validierung: {e}")
@@ -315,21 +659,20 @@ class SessionManager:
             Session-Daten oder None
         """
         try:
-            with self.lock:
-                session = self.sessions.get(session_id)
+            session = self._get_session(session_id)
 
-                if not session or session.status != SessionStatus.ACTIVE:
-                    return None
+            if not session or session.status != SessionStatus.ACTIVE:
+                return None
 
-                if not session.data or "encrypted" not in session.data:
-                    return {}
+            if not session.data or "encrypted" not in session.data:
+                return {}
 
-                # Daten entschlüsseln
-                encrypted_data = session.data["encrypted"]
-                decrypted_json = self.crypto_manager.decrypt_string(
-                    encrypted_data, "session"
-                )
-                return json.loads(decrypted_json)
+            # Daten entschlüsseln (ohne Lock, session.data wird nur ersetzt)
+            encrypted_data = session.data["encrypted"]
+            decrypted_json = self.crypto_manager.decrypt_string(
+                encrypted_data, "session"
+            )
+            return json.loads(decrypted_json)
 
         except Exception as e:
             logger.error(f"Fehler beim Abrufen der Session-Daten: {e}")
@@ -347,31 +690,33 @@ class SessionManager:
             True wenn erfolgreich, False sonst
         """
         try:
-            with self.lock:
-                session = self.sessions.get(session_id)
+            # Daten verschlüsseln
+            data_json = json.dumps(data)
+            encrypted_data = self.crypto_manager.encrypt_string(
+                data_json, "session", compact=True
+            )
+
+            shard = self._session_shard(session_id)
+            with shard.lock:
+                session = self._lookup(shard, session_id)
 
                 if not session or session.status != SessionStatus.ACTIVE:
                     return False
 
-                # Daten verschlüsseln
-                data_json = json.dumps(data)
-                encrypted_data = self.crypto_manager.encrypt_string(
-                    data_json, "session"
-                )
-
                 # Session aktualisieren
                 session.data = {"encrypted": encrypted_data}
                 session.last_activity = datetime.now(timezone.utc)
+                self._persist(shard, session)
+
+            # Audit-Log
+            self.audit_logger.log_data_access(
+                operation="update",
+                table_name="session_data",
+                user_id=session.user_id,
+                session_id=session_id,
+            )
 
-                # Audit-Log
-                self.audit_logger.log_data_access(
-                    operation="update",
-                    table_name="session_data",
-                    user_id=session.user_id,
-                    session_id=session_id,
-                )
-
-                return True
+            return True
 
         except Exception as e:
             logger.error(f"Fehler beim Aktualisieren der Session-Daten: {e}")
@@ -389,45 +734,46 @@ class SessionManager:
             True wenn erfolgreich, False sonst
         """
         try:
-            with self.lock:
-                session = self.sessions.get(session_id)
+            shard = self._session_shard(session_id)
+            with shard.lock:
+                session = self._lookup(shard, session_id)
 
                 if not session:
                     return False
 
                 # Session-Status ändern
+                was_active = session.status == SessionStatus.ACTIVE
                 session.status = SessionStatus.TERMINATED
+                self._persist(shard, session)
 
-                # Aus User-Session-Mapping entfernen
-                if session.user_id and session.user_id in self.user_sessions:
-                    self.user_sessions[session.user_id].discard(session_id)
-                    if not self.user_sessions[session.user_id]:
-                        del self.user_sessions[session.user_id]
+            # Aus User-Session-Mapping entfernen
+            if session.user_id:
+                self._unlink_user_session(session.user_id, session_id)
 
-                # Statistiken aktualisieren
-                self.stats["active_sessions"] -= 1
-                self.stats["terminated_sessions"] += 1
-
-                # Audit-Log
-                self.audit_logger.log_event(
-                    category=EventCategory.SYSTEM_EVENTS,
-                    event_type="session_terminated",
-                    source_component="session_manager",
-                    description=f"Session terminated: {reason}",
-                    details={
-                        "session_id": session_id,
-                        "reason": reason,
-                        "duration_minutes": (
-                            datetime.now(timezone.utc) - session.created_at
-                        ).total_seconds()
-                        / 60,
-                    },
-                    user_id=session.user_id,
-                    session_id=session_id,
-                )
+            # Statistiken aktualisieren
+            if was_active:
+                self._count(active_sessions=-1, terminated_sessions=1)
+
+            # Audit-Log
+            self.audit_logger.log_event(
+                category=EventCategory.SYSTEM_EVENTS,
+                event_type="session_terminated",
+                source_component="session_manager",
+                description=f"Session terminated: {reason}",
+                details={
+                    "session_id": session_id,
+                    "reason": reason,
+                    "duration_minutes": (
+                        datetime.now(timezone.utc) - session.created_at
+                    ).total_seconds()
+                    / 60,
+                },
+                user_id=session.user_id,
+                session_id=session_id,
+            )
 
-                logger.info(f"Session beendet: {session_id}, Grund: {reason}")
-                return True
+            logger.info(f"Session beendet: {session_id}, Grund: {reason}")
+            return True
 
         except Exception as e:
             logger.error(f"Fehler beim Beenden der Session: {e}")
@@ -447,22 +793,28 @@ class SessionManager:
             Anzahl beendeter Sessions
         """
         try:
-            with self.lock:
-                if user_id not in self.user_sessions:
-                    return 0
-
-                session_ids = self.user_sessions[user_id].copy()
-                terminated_count = 0
-
-                for session_id in session_ids:
-                    if session_id != exclude_session:
-                        if self.terminate_session(
-                            session_id, "user_sessions_terminated"
-                        ):
-                            terminated_count += 1
-
-                logger.info(f"{terminated_count} Sessions für User {user_id} beendet")
-                return terminated_count
+            user_shard = self._user_shard(user_id)
+            with user_shard.lock:
+                session_ids = set(user_shard.user_sessions.get(user_id, ()))
+
+            terminated_count = 0
+            for session_id in session_ids:
+                if session_id != exclude_session:
+                    if self.terminate_session(
+                        session_id, "user_sessions_terminated"
+                    ):
+                        terminated_count += 1
+
+            if self.backend is not None:
+                # Das Backend kennt nur Hashes der Session-IDs: Sessions anderer
+                # Worker dort beenden, deren Caches sehen es nach cache_ttl_seconds
+                remote_count = self.backend.terminate_user(user_id, exclude_session)
+                if remote_count:
+                    self._count(terminated_sessions=remote_count)
+                terminated_count += remote_count
+
+            logger.info(f"{terminated_count} Sessions für User {user_id} beendet")
+            return terminated_count
 
         except Exception as e:
             logger.error(f"Fehler beim Beenden der User-Sessions: {e}")
@@ -483,14 +835,26 @@ class SessionManager:
         return session_hash
 
     def _check_max_sessions(self, user_id: str) -> bool:
-        """Prüfe ob maximale Anzahl Sessions erreicht"""
-        if user_id not in self.user_sessions:
+        """Prüfe ob maximale Anzahl Sessions erreicht (User-Shard-Lock gehalten)"""
+        if self.backend is not None:
+            return (
+                self.backend.count_active(user_id, datetime.now(timezone.utc))
+                >= self.max_concurrent_sessions
+            )
+
+        session_ids = self._user_shard(user_id).user_sessions.get(user_id)
+        if not session_ids:
             return False
 
+        now = datetime.now(timezone.utc)
         active_sessions = 0
-        for session_id in self.user_sessions[user_id]:
-            session = self.sessions.get(session_id)
-            if session and session.status == SessionStatus.ACTIVE:
+        for session_id in session_ids:
+            session = self._get_session(session_id)
+            if (
+                session
+                and session.status == SessionStatus.ACTIVE
+                and now <= session.expires_at
+            ):
                 active_sessions += 1
 
         return active_sessions >= self.max_concurrent_sessions
@@ -523,20 +887,32 @@ class SessionManager:
 
         return security_flags
 
+    def _unlink_user_session(self, user_id: str, session_id: str):
+        """Session aus dem User-Index entfernen"""
+        user_shard = self._user_shard(user_id)
+        with user_shard.lock:
+            session_ids = user_shard.user_sessions.get(user_id)
+            if session_ids is not None:
+                session_ids.discard(session_id)
+                if not session_ids:
+                    del user_shard.user_sessions[user_id]
+
     def _expire_session(self, session_id: str):
-        """Markiere Session als abgelaufen"""
+        """Markiere Session als abgelaufen (Session-Shard-Lock gehalten)
+
+        Der User-Index wird hier bewusst nicht angefasst, um die
+        Lock-Reihenfolge einzuhalten; abgelaufene Einträge werden von
+        ``_check_max_sessions`` ignoriert und von der Bereinigung entfernt.
+        """
         try:
-            session = self.sessions.get(session_id)
-            if session:
+            shard = self._session_shard(session_id)
+            session = shard.sessions.get(session_id)
+            if session and session.status == SessionStatus.ACTIVE:
                 session.status = SessionStatus.EXPIRED
-
-                # Aus User-Session-Mapping entfernen
-                if session.user_id and session.user_id in self.user_sessions:
-                    self.user_sessions[session.user_id].discard(session_id)
+                self._persist(shard, session)
 
                 # Statistiken aktualisieren
-                self.stats["active_sessions"] -= 1
-                self.stats["expired_sessions"] += 1
+                self._count(active_sessions=-1, expired_sessions=1)
 
         except Exception as e:
             logger.error(f"Fehler beim Ablaufen der Session: {e}")
@@ -546,7 +922,7 @@ class SessionManager:
     ):
         """Protokolliere Sicherheitsereignis"""
         try:
-            self.stats["security_violations"] += 1
+            self._count(security_violations=1)
 
             self.audit_logger.log_security_event(
                 event_type=event_type,
@@ -561,49 +937,77 @@ class SessionManager:
 
     def _cleanup_expired_sessions(self):
         """Bereinige abgelaufene Sessions (läuft in separatem Thread)"""
-        while not self.shutdown_event.is_set():
+        while not self.shutdown_event.wait(self.cleanup_interval_seconds):
             try:
-                # Alle 5 Minuten aufräumen
-                if self.shutdown_event.wait(300):  # 5 Minuten
-                    break
-
-                with self.lock:
-                    now = datetime.now(timezone.utc)
-                    expired_sessions = []
-
-                    for session_id, session in self.sessions.items():
-                        if (
-                            session.status == SessionStatus.ACTIVE
-                            and now > session.expires_at
-                        ):
-                            expired_sessions.append(session_id)
-
-                    # Abgelaufene Sessions markieren
-                    for session_id in expired_sessions:
+                expired_count, removed_count = self._process_expiry(
+                    datetime.now(timezone.utc)
+                )
+                if expired_count or removed_count:
+                    logger.info(
+                        f"Session-Cleanup: {expired_count} abgelaufen, {removed_count} gelöscht"
+                    )
+
+            except Exception as e:
+                logger.error(f"Fehler beim Session-Cleanup: {e}")
+
+    def _process_expiry(self, now: datetime) -> tuple:
+        """Arbeite fällige Heap-Einträge aller Shards ab
+
+        Aktive Sessions mit verlängerter Frist werden neu eingeplant,
+        abgelaufene markiert und für die Löschung 24 Stunden nach der
+        Erstellung eingeplant, inaktive nach dieser Frist entfernt.
+        """
+        expired_count = 0
+        removed_count = 0
+        unlinked = []
+
+        for shard in self._session_shards:
+            with shard.lock:
+                heap = shard.expiry_heap
+                while heap and heap[0][0] <= now:
+                    _, session_id = heapq.heappop(heap)
+                    session = shard.sessions.get(session_id)
+                    if session is None:
+                        continue
+
+                    if session.status == SessionStatus.ACTIVE and session.expires_at > now:
+                        heapq.heappush(heap, (session.expires_at, session_id))
+                        continue
+
+                    if self.backend is not None:
+                        # Nur aus dem Cache entfernen: ein anderer Worker kann
+                        # verlängert haben; Ablauf und Löschung macht das Backend
+                        shard.evict(session_id)
+                        if session.user_id:
+                            unlinked.append((session.user_id, session_id))
+                        continue
+
+                    if session.status == SessionStatus.ACTIVE:
                         self._expire_session(session_id)
+                        expired_count += 1
+
+                    if session.user_id:
+                        unlinked.append((session.user_id, session_id))
 
                     # Alte Sessions löschen (älter als 24 Stunden)
-                    cutoff_time = now - timedelta(hours=24)
-                    old_sessions = []
-
-                    for session_id, session in self.sessions.items():
-                        if (
-                            session.created_at < cutoff_time
-                            and session.status != SessionStatus.ACTIVE
-                        ):
-                            old_sessions.append(session_id)
-
-                    # Alte Sessions entfernen
-                    for session_id in old_sessions:
-                        del self.sessions[session_id]
-
-                    if expired_sessions or old_sessions:
-                        logger.info(
-                            f"Session-Cleanup: {len(expired_sessions)} abgelaufen, {len(old_sessions)} gelöscht"
-                        )
+                    purge_at = session.created_at + timedelta(hours=24)
+                    if purge_at <= now:
+                        del shard.sessions[session_id]
+                        removed_count += 1
+                    else:
+                        heapq.heappush(heap, (purge_at, session_id))
+
+        # User-Index erst nach Freigabe der Session-Shards bereinigen
+        for user_id, session_id in unlinked:
+            self._unlink_user_session(user_id, session_id)
+
+        if self.backend is not None:
+            expired_count, removed_count = self.backend.expire_sessions(
+                now, now - timedelta(hours=24)
+            )
+            self._count(expired_sessions=expired_count)
 
-            except Exception as e:
-                logger.error(f"Fehler beim Session-Cleanup: {e}")
+        return expired_count, removed_count
 
     def get_active_sessions(
         self, user_id: Optional[str] = None
@@ -618,18 +1022,26 @@ class SessionManager:
             Liste der aktiven Sessions
         """
         try:
-            with self.lock:
-                active_sessions = []
+            if self.backend is not None:
+                sessions = self.backend.list_active(user_id, datetime.now(timezone.utc))
+                return [
+                    {k: v for k, v in session.to_dict().items() if k != "data"}
+                    for session in sessions
+                ]
 
-                for session_id, session in self.sessions.items():
-                    if session.status == SessionStatus.ACTIVE:
-                        if user_id is None or session.user_id == user_id:
-                            session_info = session.to_dict()
-                            # Sensible Daten entfernen
-                            session_info.pop("data", None)
-                            active_sessions.append(session_info)
+            active_sessions = []
+
+            for shard in self._session_shards:
+                with shard.lock:
+                    for session in shard.sessions.values():
+                        if session.status == SessionStatus.ACTIVE:
+                            if user_id is None or session.user_id == user_id:
+                                session_info = session.to_dict()
+                                # Sensible Daten entfernen
+                                session_info.pop("data", None)
+                                active_sessions.append(session_info)
 
-                return active_sessions
+            return active_sessions
 
         except Exception as e:
             logger.error(f"Fehler beim Abrufen aktiver Sessions: {e}")
@@ -637,7 +1049,14 @@ class SessionManager:
 
     def get_statistics(self) -> Dict[str, Any]:
         """Hole Session-Statistiken"""
-        return self.stats.copy()
+        with self._stats_lock:
+            stats = self.stats.copy()
+        stats["shards"] = self.shard_count
+        stats["backend"] = self.backend.name if self.backend else "memory"
+        stats["stored_sessions"] = sum(
+            len(shard.sessions) for shard in self._session_shards
+        )
+        return stats
 
     def shutdown(self):
         """Beende Session-Manager ordnungsgemäß"""
@@ -649,16 +1068,29 @@ class SessionManager:
             if self.cleanup_thread and self.cleanup_thread.is_alive():
                 self.cleanup_thread.join(timeout=5.0)
 
+            if self.backend is not None:
+                # Sessions bleiben gültig; nur ausstehende Verlängerungen schreiben
+                for shard in self._session_shards:
+                    with shard.lock:
+                        for session in shard.sessions.values():
+                            if session.status == SessionStatus.ACTIVE:
+                                self.backend.touch(session.session_id, session.expires_at)
+                self.backend.close()
+                logger.info("Session-Manager erfolgreich beendet")
+                return
+
             # Alle aktiven Sessions beenden
-            with self.lock:
-                active_session_ids = [
-                    sid
-                    for sid, session in self.sessions.items()
-                    if session.status == SessionStatus.ACTIVE
-                ]
+            active_session_ids = []
+            for shard in self._session_shards:
+                with shard.lock:
+                    active_session_ids.extend(
+                        sid
+                        for sid, session in shard.sessions.items()
+                        if session.status == SessionStatus.ACTIVE
+                    )
 
-                for session_id in active_session_ids:
-                    self.terminate_session(session_id, "system_shutdown")
+            for session_id in active_session_ids:
+                self.terminate_session(session_id, "system_shutdown")
 
             logger.info("Session-Manager erfolgreich beendet")
 
@@ -9,9 +9,28 @@ import json
 import logging
 from pathlib import Path
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Contatore di versione dei piani, incrementato da trigger su ogni modifica
+PLAN_VERSION_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS subscription_plans_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "INSERT OR IGNORE INTO subscription_plans_version (id, version) VALUES (1, 0)",
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS subscription_plans_version_{event.lower()}
+    AFTER {event} ON subscription_plans
+    BEGIN
+        UPDATE subscription_plans_version SET version = version + 1 WHERE id = 1;
+    END
+    """
+    for event in ("INSERT", "UPDATE", "DELETE")
+]
+
 def setup_database():
     """Inizializza tutte le tabelle necessarie per il sistema di abbonamenti"""
     
@@ -66,6 +85,11 @@ def setup_database():
                 )
             """)
             
+            # Versione dei piani: i trigger la incrementano ad ogni modifica,
+            # così i worker del backend ricaricano i limiti in memoria
+            for statement in PLAN_VERSION_SCHEMA:
+                cursor.execute(statement)
+            
             # 3. Tabella user_usage
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS user_usage (
@@ -251,4 +275,5 @@ def setup_database():
         raise
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     setup_database()
\ No newline at end of file
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests für den Audit-Segmentspeicher: Hash-Kette und Reparatur nach Abstürzen
+"""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from security.audit_store import SEGMENT_HEADER, AuditSegmentStore
+
+CATEGORIES = ["authentication", "security_events"]
+
+
+def _events(count, start=0, user_id="42"):
+    events = []
+    for i in range(start, start + count):
+        events.append({
+            "event_id": f"evt-{i}",
+            "timestamp": datetime(2026, 1, 1, 12, 0, i % 60, tzinfo=timezone.utc).isoformat(),
+            "category": CATEGORIES[i % 2],
+            "user_id": user_id,
+            "description": "x" * 40,
+        })
+    return events
+
+
+def _append(store, events):
+    store.append_batch(events, [json.dumps(event).encode("utf-8") for event in events])
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    return tmp_path / "segments"
+
+
+def test_chain_verifies_across_segments(store_dir):
+    store = AuditSegmentStore(store_dir, CATEGORIES, max_segment_bytes=512)
+    for batch in range(5):
+        _append(store, _events(3, start=batch * 3))
+
+    result = store.verify_all()
+    store.close()
+
+    assert result["valid"]
+    assert result["records"] == 15
+    assert len(result["segments"]) > 1
+
+
+def test_query_uses_index(store_dir):
+    store = AuditSegmentStore(store_dir, CATEGORIES)
+    _append(store, _events(4))
+    _append(store, _events(2, start=4, user_id="7"))
+
+    assert len(store.query(user_id="42")) == 4
+    assert [e["event_id"] for e in store.query("security_events", "42")] == ["evt-1", "evt-3"]
+    assert len(store.query(limit=3)) == 3
+    store.close()
+
+
+def test_tampered_record_breaks_chain(store_dir):
+    store = AuditSegmentStore(store_dir, CATEGORIES)
+    _append(store, _events(3))
+    store.close()
+
+    path = store_dir / "segment_000001.log"
+    data = bytearray(path.read_bytes())
+    data[data.index(b"evt-1")] ^= 0x01
+    path.write_bytes(bytes(data))
+
+    result = AuditSegmentStore(store_dir, CATEGORIES).verify_all()
+    assert not result["valid"]
+    assert "Hash-Kette verletzt" in result["segments"][0]["error"]
+
+
+def test_torn_record_is_truncated_on_reopen(store_dir):
+    store = AuditSegmentStore(store_dir, CATEGORIES)
+    _append(store, _events(2))
+    store.close()
+
+    path = store_dir / "segment_000001.log"
+    with open(path, "ab") as f:
+        f.write(b"\x00\x00\x01\x00partial")
+
+    store = AuditSegmentStore(store_dir, CATEGORIES)
+    _append(store, _events(1, start=2))
+    result = store.verify_all()
+
+    assert result["valid"]
+    assert result["records"] == 3
+    assert len(store.query()) == 3
+    store.close()
+
+
+def test_torn_segment_header_is_rewritten(store_dir):
+    store = AuditSegmentStore(store_dir, CATEGORIES)
+    _append(store, _events(2))
+    store.close()
+
+    # Absturz beim Segmentwechsel: nur ein Teil des neuen Headers geschrieben
+    (store_dir / "segment_000002.log").write_bytes(b"CMA1" + b"\x00" * 6)
+
+    store = AuditSegmentStore(store_dir, CATEGORIES)
+    assert (store_dir / "segment_000002.log").stat().st_size == SEGMENT_HEADER.size
+    _append(store, _events(2, start=2))
+    result = store.verify_all()
+    store.close()
+
+    # Der neue Header verweist auf den letzten Hash von Segment 1
+    assert result["valid"]
+    assert result["records"] == 4
+    assert [segment["records"] for segment in result["segments"]] == [2, 2]
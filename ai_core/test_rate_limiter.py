@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test per i backend del rate limiter (contatori in memoria e condivisi)
+"""
+
+import importlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from db_pool import get_connection
+
+REQUEST = SimpleNamespace(headers={"User-Agent": "pytest"}, client=SimpleNamespace(host="10.0.0.1"))
+
+
+@pytest.fixture
+def rl(tmp_path, monkeypatch):
+    # L'istanza globale usa database/creative_muse.db nella directory corrente
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module("rate_limiter")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "rate_limit.db")
+
+
+def _fail(rl, limiter, identifier, times):
+    for _ in range(times):
+        limiter.record_attempt(identifier, rl.LimitType.LOGIN_ATTEMPTS, REQUEST, success=False)
+
+
+def test_memory_backend_blocks_after_max_attempts(rl, db_path):
+    limiter = rl.RateLimiter(db_path, backend="memory")
+    try:
+        _fail(rl, limiter, "user@example.com", 4)
+        assert limiter.check_rate_limit("user@example.com", rl.LimitType.LOGIN_ATTEMPTS, REQUEST) == (True, None)
+
+        _fail(rl, limiter, "user@example.com", 1)
+        allowed, message = limiter.check_rate_limit("user@example.com", rl.LimitType.LOGIN_ATTEMPTS, REQUEST)
+        assert not allowed
+        assert "bloccato" in message
+
+        # Altri identificatori non sono toccati
+        assert limiter.check_rate_limit("other@example.com", rl.LimitType.LOGIN_ATTEMPTS, REQUEST)[0]
+    finally:
+        limiter.shutdown()
+
+
+def test_memory_backend_success_clears_block(rl, db_path):
+    limiter = rl.RateLimiter(db_path, backend="memory")
+    try:
+        _fail(rl, limiter, "user@example.com", 5)
+        assert not limiter.check_rate_limit("user@example.com", rl.LimitType.LOGIN_ATTEMPTS, REQUEST)[0]
+
+        limiter.record_attempt("user@example.com", rl.LimitType.LOGIN_ATTEMPTS, REQUEST, success=True)
+        identifier_hash = limiter._hash_identifier("user@example.com")
+        assert limiter.backend.get_block(identifier_hash, "login_attempts") is None
+    finally:
+        limiter.shutdown()
+
+
+def test_memory_backend_window_and_prune(rl, db_path):
+    limiter = rl.RateLimiter(db_path, backend="memory")
+    backend = limiter.backend
+    try:
+        backend.record_attempt("h", "login_attempts", "10.0.0.1", "", False)
+        backend.record_attempt("h", "login_attempts", "10.0.0.1", "", False)
+        now = datetime.now()
+        assert backend.count_failures("h", "login_attempts", now - timedelta(minutes=10)) == 2
+        assert backend.count_failures("h", "login_attempts", now + timedelta(seconds=1)) == 0
+
+        backend.record_attempt("old", "login_attempts", "10.0.0.1", "", False)
+        backend.set_block("expired", "login_attempts", now - timedelta(seconds=1), "test")
+        backend._failures[("old", "login_attempts")][0] -= backend._max_window + 1
+        backend._prune()
+        assert ("old", "login_attempts") not in backend._failures
+        assert ("expired", "login_attempts") not in backend._blocks
+    finally:
+        limiter.shutdown()
+
+
+def test_memory_backend_state_survives_restart(rl, db_path):
+    limiter = rl.RateLimiter(db_path, backend="memory")
+    _fail(rl, limiter, "user@example.com", 5)
+    assert not limiter.check_rate_limit("user@example.com", rl.LimitType.LOGIN_ATTEMPTS, REQUEST)[0]
+    limiter.shutdown()
+
+    with get_connection(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM rate_limit_attempts").fetchone()[0] == 5
+        assert conn.execute("SELECT COUNT(*) FROM rate_limit_blocks").fetchone()[0] == 1
+
+    # Blocchi e fallimenti recenti vengono ricaricati da SQLite
+    restarted = rl.RateLimiter(db_path, backend="memory")
+    try:
+        identifier_hash = restarted._hash_identifier("user@example.com")
+        assert restarted.backend.get_block(identifier_hash, "login_attempts") is not None
+        assert restarted.backend.count_failures(
+            identifier_hash, "login_attempts", datetime.now() - timedelta(minutes=10)
+        ) == 5
+    finally:
+        restarted.shutdown()
+
+
+def test_socket_backend_shares_counters_between_workers(rl, db_path):
+    host = rl.RateLimiter(db_path, backend="socket")
+    worker = rl.RateLimiter(db_path, backend="socket")
+    try:
+        # Solo il primo worker ospita il server, il secondo si connette
+        assert host.backend._server is not None
+        assert worker.backend._server is None
+
+        _fail(rl, host, "user@example.com", 3)
+        _fail(rl, worker, "user@example.com", 2)
+        allowed, _ = worker.check_rate_limit("user@example.com", rl.LimitType.LOGIN_ATTEMPTS, REQUEST)
+        assert not allowed
+
+        identifier_hash = host._hash_identifier("user@example.com")
+        blocked_until, reason = host.backend.get_block(identifier_hash, "login_attempts")
+        assert blocked_until > datetime.now()
+        assert "5/5" in reason
+
+        assert worker.backend.clear_block(identifier_hash, "login_attempts")
+        assert host.backend.get_block(identifier_hash, "login_attempts") is None
+    finally:
+        worker.shutdown()
+        host.shutdown()
+
+
+def test_socket_backend_takes_over_when_host_exits(rl, db_path):
+    host = rl.RateLimiter(db_path, backend="socket")
+    worker = rl.RateLimiter(db_path, backend="socket")
+    try:
+        _fail(rl, worker, "user@example.com", 5)
+        assert not worker.check_rate_limit("user@example.com", rl.LimitType.LOGIN_ATTEMPTS, REQUEST)[0]
+
+        # Il worker che ospita il server termina (flush finale su SQLite);
+        # con il processo si chiudono anche le connessioni dei client
+        host.shutdown()
+        worker.backend._drop_connection()
+
+        identifier_hash = worker._hash_identifier("user@example.com")
+        assert worker.backend.get_block(identifier_hash, "login_attempts") is not None
+        assert worker.backend._server is not None
+    finally:
+        worker.shutdown()
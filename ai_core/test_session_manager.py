@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests für das SQLite-Session-Backend
+"""
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from db_pool import get_connection
+from security.session_manager import SessionData, SessionStatus, SQLiteSessionBackend
+
+NOW = datetime(2026, 5, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteSessionBackend(str(tmp_path / "sessions.db"))
+
+
+def _session(session_id="sess-a", user_id="7", **changes):
+    values = dict(
+        session_id=session_id,
+        user_id=user_id,
+        created_at=NOW,
+        last_activity=NOW,
+        expires_at=NOW + timedelta(hours=1),
+        ip_address="10.0.0.1",
+        user_agent="pytest",
+        status=SessionStatus.ACTIVE,
+        security_flags=2,
+        data={"encrypted": "abc"},
+    )
+    values.update(changes)
+    return SessionData(**values)
+
+
+def test_round_trip(backend):
+    session = _session()
+    backend.save(session)
+
+    assert backend.load("sess-a") == session
+    assert backend.load("sess-b") is None
+
+
+def test_only_hash_of_session_id_is_stored(backend):
+    backend.save(_session())
+
+    token = hashlib.sha256(b"sess-a").hexdigest()
+    rows = get_connection(backend.db_path).execute("SELECT id, session_token FROM sessions").fetchall()
+    assert rows == [(token, token)]
+
+    # list_active kennt nur den Hash
+    assert [s.session_id for s in backend.list_active("7", NOW)] == [token]
+
+
+def test_anonymous_session(backend):
+    backend.save(_session(user_id=None))
+    assert backend.load("sess-a").user_id is None
+
+
+def test_touch_extends_active_session(backend):
+    backend.save(_session())
+    backend.touch("sess-a", NOW + timedelta(hours=3))
+
+    assert backend.load("sess-a").expires_at == NOW + timedelta(hours=3)
+
+
+def test_inactive_session_is_never_reactivated(backend):
+    backend.save(_session())
+    backend.save(_session(status=SessionStatus.TERMINATED))
+    backend.save(_session())
+    backend.touch("sess-a", NOW + timedelta(hours=3))
+
+    loaded = backend.load("sess-a")
+    assert loaded.status == SessionStatus.TERMINATED
+    assert loaded.expires_at == NOW + timedelta(hours=1)
+
+
+def test_terminate_user_keeps_excluded_session(backend):
+    for session_id in ("sess-a", "sess-b", "sess-c"):
+        backend.save(_session(session_id))
+    backend.save(_session("sess-other", user_id="8"))
+
+    assert backend.count_active("7", NOW) == 3
+    assert backend.terminate_user("7", "sess-b") == 2
+    assert backend.count_active("7", NOW) == 1
+    assert backend.load("sess-a").status == SessionStatus.TERMINATED
+    assert backend.load("sess-b").status == SessionStatus.ACTIVE
+    assert backend.count_active("8", NOW) == 1
+
+
+def test_expire_and_purge(backend):
+    backend.save(_session("old", created_at=NOW - timedelta(days=40), expires_at=NOW - timedelta(days=39)))
+    backend.save(_session("due", expires_at=NOW - timedelta(seconds=1)))
+    backend.save(_session("live"))
+
+    expired, removed = backend.expire_sessions(NOW, NOW - timedelta(days=30))
+
+    assert (expired, removed) == (2, 1)
+    assert backend.load("old") is None
+    assert backend.load("due").status == SessionStatus.EXPIRED
+    assert backend.count_active("7", NOW) == 1
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test per lo storage dei dataset per contenuto (blob condivisi e riferimenti)
+"""
+
+import asyncio
+import importlib
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+
+from db_pool import get_connection
+
+
+class FakeUpload:
+    """UploadFile minimale: nome, dimensione e read() asincrono a blocchi"""
+
+    def __init__(self, filename, content):
+        self.filename = filename
+        self.size = len(content)
+        self._content = content
+
+    async def read(self, size=-1):
+        size = len(self._content) if size < 0 else size
+        chunk, self._content = self._content[:size], self._content[size:]
+        return chunk
+
+
+@pytest.fixture
+def ts(tmp_path, monkeypatch):
+    # L'istanza globale usa database/ e uploads/ nella directory corrente
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "database").mkdir()
+    return importlib.import_module("training_service")
+
+
+@pytest.fixture
+def removed_caches(ts, monkeypatch):
+    removed = []
+    monkeypatch.setattr(ts.token_cache, "remove", removed.append)
+    return removed
+
+
+@pytest.fixture
+def service(ts, tmp_path, monkeypatch):
+    service = ts.TrainingService(str(tmp_path / "training.db"))
+    # Nessun profilo completo in background nei test
+    monkeypatch.setattr(service, "_start_profile", lambda *args: None)
+    return service
+
+
+def _upload(service, user_id, content=b"text\nuno\ndue\n", filename="data.csv"):
+    return asyncio.run(service.upload_dataset(FakeUpload(filename, content), user_id))
+
+
+def test_same_content_shares_one_blob(service):
+    first = _upload(service, 1)
+    second = _upload(service, 2)
+
+    assert first["content_hash"] == second["content_hash"]
+    assert first["dataset_id"] != second["dataset_id"]
+    blobs = [path for path in service.blob_dir.rglob("*") if path.is_file()]
+    assert blobs == [service._blob_path(first["content_hash"])]
+    assert not list(service.upload_dir.glob(".*.incoming"))
+
+
+def test_blob_removed_with_last_reference(service, removed_caches):
+    first = _upload(service, 1)
+    second = _upload(service, 2)
+    blob_path = service._blob_path(first["content_hash"])
+    cache_key = service.dataset_key(first["content_hash"], ".csv", first["dataset_id"])
+
+    assert service.delete_dataset(first["dataset_id"], 1)
+    assert blob_path.exists()
+    assert removed_caches == []
+
+    assert service.delete_dataset(second["dataset_id"], 2)
+    assert not blob_path.exists()
+    assert removed_caches == [cache_key]
+
+
+def test_token_cache_removed_per_format(service, removed_caches):
+    as_csv = _upload(service, 1, filename="data.csv")
+    as_txt = _upload(service, 1, filename="data.txt")
+    blob_path = service._blob_path(as_csv["content_hash"])
+
+    assert service.delete_dataset(as_txt["dataset_id"], 1)
+    # Il blob serve ancora al CSV, la cache del formato txt no
+    assert blob_path.exists()
+    assert removed_caches == [service.dataset_key(as_txt["content_hash"], ".txt", as_txt["dataset_id"])]
+
+
+def test_delete_requires_owner(service):
+    dataset = _upload(service, 1)
+
+    assert not service.delete_dataset(dataset["dataset_id"], 2)
+    assert service._blob_path(dataset["content_hash"]).exists()
+
+
+def test_delete_refused_while_job_pending(service):
+    dataset = _upload(service, 1)
+    with get_connection(service.db_path) as conn:
+        conn.execute("""
+            INSERT INTO custom_models (uuid, user_id, dataset_id, model_name, training_status)
+            SELECT 'job-1', 1, id, 'test', 'pending' FROM training_datasets WHERE uuid = ?
+        """, (dataset["dataset_id"],))
+
+    with pytest.raises(HTTPException) as exc_info:
+        service.delete_dataset(dataset["dataset_id"], 1)
+    assert exc_info.value.status_code == 409
+    assert service._blob_path(dataset["content_hash"]).exists()
+
+    with get_connection(service.db_path) as conn:
+        conn.execute("UPDATE custom_models SET training_status = 'completed' WHERE uuid = 'job-1'")
+    assert service.delete_dataset(dataset["dataset_id"], 1)
+    assert not service._blob_path(dataset["content_hash"]).exists()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test per UsageAggregator: recupero dei WAL orfani senza perdite né doppi conteggi
+"""
+
+import json
+import os
+from datetime import date
+
+import pytest
+
+import usage_counter
+from db_pool import get_connection
+from usage_counter import UsageAggregator
+
+DAY = date(2026, 3, 14)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "usage.db")
+    with get_connection(path) as conn:
+        conn.execute("""
+            CREATE TABLE user_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                ideas_generated INTEGER DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(user_id, date)
+            )
+        """)
+    return path
+
+
+def _aggregator(db_path, tmp_path):
+    return UsageAggregator(db_path, wal_dir=str(tmp_path / "wal"),
+                           flush_interval=3600, refresh_seconds=3600, fsync=False)
+
+
+def _crash(aggregator):
+    """Simula la fine del processo: niente flush, lock del WAL rilasciato"""
+    aggregator._stop_event.set()
+    aggregator._wal.close()
+    aggregator._wal = None
+
+
+def _stored(db_path, user_id="1"):
+    with get_connection(db_path) as conn:
+        row = conn.execute(
+            "SELECT ideas_generated FROM user_usage WHERE user_id = ? AND date = ?",
+            (user_id, DAY.isoformat()),
+        ).fetchone()
+    return row[0] if row else 0
+
+
+def _write_wal(path, records, tail=""):
+    with open(path, "w") as f:
+        for seq, count in records:
+            f.write(json.dumps({"s": seq, "u": "1", "d": DAY.isoformat(), "n": count}) + "\n")
+        f.write(tail)
+
+
+def test_orphaned_wal_is_replayed_and_removed(db_path, tmp_path):
+    wal_dir = tmp_path / "wal"
+    wal_dir.mkdir()
+    # Ultima riga troncata dal crash: va ignorata
+    _write_wal(wal_dir / "usage-99999.wal", [(1, 2), (2, 3)], tail='{"s": 3, "u"')
+
+    aggregator = _aggregator(db_path, tmp_path)
+    try:
+        assert _stored(db_path) == 5
+        assert aggregator.stats["replayed"] == 5
+        assert not (wal_dir / "usage-99999.wal").exists()
+        with get_connection(db_path) as conn:
+            assert conn.execute(
+                "SELECT COUNT(*) FROM usage_wal_state WHERE wal_name = 'usage-99999.wal'"
+            ).fetchone()[0] == 0
+    finally:
+        aggregator.close()
+
+
+def test_replay_skips_sequences_already_flushed(db_path, tmp_path):
+    aggregator = _aggregator(db_path, tmp_path)
+    aggregator.increment(1, 2, day=DAY)
+    aggregator.flush()
+    aggregator.increment(1, 1, day=DAY)
+    _crash(aggregator)
+    assert _stored(db_path) == 2
+
+    recovered = _aggregator(db_path, tmp_path)
+    try:
+        # Solo l'incremento non ancora scritto viene riapplicato
+        assert _stored(db_path) == 3
+        assert recovered.stats["replayed"] == 1
+        assert recovered.get_usage(1, day=DAY) == (3, 3)
+    finally:
+        recovered.close()
+
+
+def test_replay_twice_does_not_double_count(db_path, tmp_path):
+    aggregator = _aggregator(db_path, tmp_path)
+    aggregator.increment(1, 4, day=DAY)
+    _crash(aggregator)
+
+    _aggregator(db_path, tmp_path).close()
+    _aggregator(db_path, tmp_path).close()
+
+    assert _stored(db_path) == 4
+
+
+def test_wal_removed_while_waiting_for_lock_is_skipped(db_path, tmp_path, monkeypatch):
+    wal_dir = tmp_path / "wal"
+    wal_dir.mkdir()
+    orphan = wal_dir / "usage-99999.wal"
+    _write_wal(orphan, [(1, 7)])
+
+    real_flock = usage_counter.fcntl.flock
+
+    def flock_after_other_worker(fd, flags):
+        # Un altro worker ha recuperato e rimosso il WAL prima del nostro lock
+        if getattr(fd, "name", None) == str(orphan) and orphan.exists():
+            os.unlink(orphan)
+        return real_flock(fd, flags)
+
+    monkeypatch.setattr(usage_counter.fcntl, "flock", flock_after_other_worker)
+
+    aggregator = _aggregator(db_path, tmp_path)
+    try:
+        assert _stored(db_path) == 0
+        assert aggregator.stats["replayed"] == 0
+    finally:
+        aggregator.close()
+
+
+def test_close_flushes_and_removes_own_wal(db_path, tmp_path):
+    aggregator = _aggregator(db_path, tmp_path)
+    aggregator.increment(1, 2, day=DAY)
+    wal_path = aggregator._wal.name
+    aggregator.close()
+
+    assert _stored(db_path) == 2
+    assert not os.path.exists(wal_path)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Creative Muse AI - Token Cache
+Cache dei dataset pre-tokenizzati: ogni (dataset, tokenizer) viene
+tokenizzato una sola volta in shard di token id a tipo fisso, con un
+indice degli offset, letti dal training tramite mmap.
+"""
+
+import os
+import sys
+import json
+import mmap
+import random
+import shutil
+import hashlib
+import logging
+from array import array
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_DIR = os.getenv("TOKEN_CACHE_DIR", "../models/token_cache")
+SHARD_MAX_BYTES = int(os.getenv("TOKEN_CACHE_SHARD_MB", "256")) * 1024 * 1024
+TOKENIZE_BATCH = 1000  # testi per chiamata al tokenizer
+
+# Ogni documento nell'indice: shard, primo token, numero di token
+INDEX_FIELDS = 3
+FORMAT_VERSION = 1
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Impronta del tokenizer: stesso vocabolario = stessi token id"""
+    hasher = hashlib.sha256(type(tokenizer).__name__.encode())
+    hasher.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode())
+    hasher.update(str(tokenizer.eos_token_id).encode())
+    return hasher.hexdigest()[:16]
+
+
+class TokenizedDataset:
+    """Dataset tokenizzato letto via mmap (nessuna copia in RAM)"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["byteorder"] != sys.byteorder:
+            raise ValueError("Cache tokenizzata creata con un byte order diverso")
+
+        self._maps = []
+        self.shards = [self._map(path / name, self.meta["typecode"]) for name in self.meta["shards"]]
+        self.index = self._map(path / "index.bin", "Q")
+
+    def _map(self, file_path: Path, typecode: str) -> memoryview:
+        with open(file_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        raw = memoryview(mm)
+        self._maps.append((mm, raw))
+        return raw.cast(typecode)
+
+    def __len__(self) -> int:
+        return self.meta["documents"]
+
+    @property
+    def total_tokens(self) -> int:
+        return self.meta["tokens"]
+
+    def __getitem__(self, i: int) -> memoryview:
+        """Token id del documento i (vista sulla mappa, senza copia)"""
+        base = i * INDEX_FIELDS
+        shard, start, length = self.index[base:base + INDEX_FIELDS]
+        return self.shards[shard][start:start + length]
+
+    def iter_batches(self, batch_size: int, max_length: Optional[int] = None,
+                     seed: Optional[int] = None) -> Iterator[List[memoryview]]:
+        """Batch di documenti; con ``seed`` in ordine casuale riproducibile"""
+        order = list(range(len(self)))
+        if seed is not None:
+            random.Random(seed).shuffle(order)
+        for start in range(0, len(order), batch_size):
+            yield [
+                self[i][:max_length] if max_length else self[i]
+                for i in order[start:start + batch_size]
+            ]
+
+    def close(self):
+        for view in self.shards + [self.index]:
+            view.release()
+        for mm, raw in self._maps:
+            raw.release()
+            try:
+                mm.close()
+            except BufferError:
+                pass  # documenti ancora referenziati: la mappa si chiude col GC
+        self._maps.clear()
+
+
+class TokenCache:
+    """Cache su disco ``<root>/<dataset>/<tokenizer>/``
+
+    La chiave del dataset è hash del contenuto + formato, quindi upload
+    identici condividono la stessa cache.
+
+    Una cache viene creata in una cartella temporanea e rinominata solo a
+    scrittura completata, quindi una cartella presente è sempre valida.
+    Due job che tokenizzano lo stesso dataset insieme non si ostacolano:
+    vince il primo rename, l'altro usa la cache già pronta.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or TOKEN_CACHE_DIR)
+
+    def cache_path(self, dataset_key: str, tokenizer) -> Path:
+        return self.root / dataset_key / tokenizer_fingerprint(tokenizer)
+
+    def get_or_build(self, dataset_key: str, texts: Iterator[str], tokenizer) -> TokenizedDataset:
+        """Apri la cache del dataset o creala tokenizzando ``texts``"""
+        path = self.cache_path(dataset_key, tokenizer)
+        if not (path / "meta.json").exists():
+            self._build(path, texts, tokenizer)
+        return TokenizedDataset(path)
+
+    def _build(self, path: Path, texts: Iterator[str], tokenizer):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir()
+
+        typecode = "H" if len(tokenizer) <= 0xFFFF else "I"
+        eos = tokenizer.eos_token_id
+        item_size = array(typecode).itemsize
+        shards: List[str] = []
+        index = array("Q")
+        documents = tokens = 0
+        shard_file = None
+        shard_tokens = 0
+
+        def encoded_batches():
+            batch = []
+            for text in texts:
+                batch.append(text)
+                if len(batch) >= TOKENIZE_BATCH:
+                    yield tokenizer(batch)["input_ids"]
+                    batch = []
+            if batch:
+                yield tokenizer(batch)["input_ids"]
+
+        try:
+            for batch in encoded_batches():
+                for ids in batch:
+                    if eos is not None and (not ids or ids[-1] != eos):
+                        ids = ids + [eos]
+                    if not ids:
+                        continue
+
+                    if shard_file is None or (shard_tokens + len(ids)) * item_size > SHARD_MAX_BYTES:
+                        if shard_file is not None:
+                            shard_file.close()
+                        shards.append(f"tokens_{len(shards):04d}.bin")
+                        shard_file = open(tmp_path / shards[-1], "wb")
+                        shard_tokens = 0
+
+                    array(typecode, ids).tofile(shard_file)
+                    index.extend((len(shards) - 1, shard_tokens, len(ids)))
+                    shard_tokens += len(ids)
+                    documents += 1
+                    tokens += len(ids)
+
+            if shard_file is not None:
+                shard_file.close()
+            if not documents:
+                raise ValueError("Dataset senza testi utilizzabili")
+
+            with open(tmp_path / "index.bin", "wb") as f:
+                index.tofile(f)
+            # meta.json per ultimo: segna la cache come completa
+            with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": FORMAT_VERSION,
+                    "typecode": typecode,
+                    "byteorder": sys.byteorder,
+                    "documents": documents,
+                    "tokens": tokens,
+                    "shards": shards,
+                    "tokenizer": getattr(tokenizer, "name_or_path", "")
+                }, f)
+
+            try:
+                os.rename(tmp_path, path)
+                logger.info(f"🧩 Dataset tokenizzato: {documents} documenti, {tokens} token -> {path}")
+            except OSError:
+                # Creata nel frattempo da un altro processo
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+        except BaseException:
+            if shard_file is not None:
+                shard_file.close()
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    def remove(self, dataset_key: str):
+        """Elimina le cache di un dataset (tutti i tokenizer)"""
+        shutil.rmtree(self.root / dataset_key, ignore_errors=True)
+
+
+# Istanza globale della cache
+token_cache = TokenCache()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Creative Muse AI - Training Jobs
+Motore dei job di training: i fine-tuning girano in processi separati,
+scrivono progresso e metriche su SQLite e si fermano in modo cooperativo
+quando viene richiesta la cancellazione.
+"""
+
+import os
+import csv
+import json
+import math
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from db_pool import get_connection
+from token_cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+TRAINING_OUTPUT_DIR = os.getenv("TRAINING_OUTPUT_DIR", "../models/custom")
+PROGRESS_INTERVAL = float(os.getenv("TRAINING_PROGRESS_INTERVAL_SECONDS", "2"))
+WORKER_NICE = int(os.getenv("TRAINING_WORKER_NICE", "10"))
+WORKER_THREADS = int(os.getenv("TRAINING_WORKER_THREADS", "0"))  # 0 = default torch
+
+# Parametri di default del fine-tuning
+DEFAULT_TRAINING_PARAMS = {
+    "epochs": 1,
+    "batch_size": 4,
+    "learning_rate": 5e-5,
+    "max_length": 512,
+    "seed": 42
+}
+
+
+class TrainingCancelled(Exception):
+    """Cancellazione richiesta tramite /api/v1/train/stop"""
+
+
+def iter_training_texts(file_path: str, file_ext: str) -> Iterator[str]:
+    """Testi di training da un dataset, letti in streaming
+
+    CSV e JSON usano la colonna ``text`` se presente, altrimenti
+    ``prompt``/``completion``, altrimenti tutti i valori della riga.
+    """
+    def record_text(record) -> str:
+        if not isinstance(record, dict):
+            return str(record)
+        if record.get("text"):
+            return str(record["text"])
+        if record.get("prompt") or record.get("completion"):
+            return f"{record.get('prompt') or ''}{record.get('completion') or ''}"
+        return " ".join(str(value) for value in record.values() if value not in (None, ""))
+
+    with open(file_path, "r", encoding="utf-8", newline="" if file_ext == ".csv" else None) as f:
+        if file_ext == ".csv":
+            records = csv.DictReader(f)
+        elif file_ext == ".jsonl":
+            records = (json.loads(line) for line in f if line.strip())
+        elif file_ext == ".json":
+            data = json.load(f)
+            records = data if isinstance(data, list) else [data]
+        else:
+            records = (line.rstrip("\n") for line in f)
+
+        for record in records:
+            text = record_text(record).strip()
+            if text:
+                yield text
+
+
+class _JobReporter:
+    """Scrive progresso e metriche del job (nel processo worker)"""
+
+    def __init__(self, db_path: str, job_id: str, output_dir: Path):
+        self.db_path = db_path
+        self.job_id = job_id
+        self.metrics_path = output_dir / "metrics.jsonl"
+        self.total_steps = 0
+        self.started = time.time()
+        self._last_flush = 0.0
+        self._losses = []
+
+    def start(self, total_steps: int):
+        self.total_steps = total_steps
+        with get_connection(self.db_path) as conn:
+            conn.execute("""
+                UPDATE custom_models SET total_steps = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE uuid = ?
+            """, (total_steps, self.job_id))
+
+    def step(self, step: int, epoch: int, loss: float, force: bool = False):
+        """Registra uno step; scrive su disco al massimo ogni PROGRESS_INTERVAL
+
+        Solleva TrainingCancelled se nel frattempo è stato richiesto lo stop.
+        """
+        self._losses.append(loss)
+        now = time.time()
+        if not force and now - self._last_flush < PROGRESS_INTERVAL:
+            return
+        self._last_flush = now
+
+        metrics = {
+            "step": step,
+            "epoch": epoch,
+            "loss": round(loss, 6),
+            "avg_loss": round(sum(self._losses) / len(self._losses), 6),
+            "elapsed_seconds": round(now - self.started, 1)
+        }
+        self._losses.clear()
+        progress = int(step * 100 / self.total_steps) if self.total_steps else 0
+
+        with open(self.metrics_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(metrics) + "\n")
+
+        with get_connection(self.db_path) as conn:
+            conn.execute("""
+                UPDATE custom_models
+                SET training_progress = ?, current_epoch = ?, current_step = ?,
+                    performance_metrics = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE uuid = ?
+            """, (progress, epoch, step, json.dumps(metrics), self.job_id))
+            cancel = conn.execute(
+                "SELECT cancel_requested FROM custom_models WHERE uuid = ?", (self.job_id,)
+            ).fetchone()
+
+        if cancel and cancel[0]:
+            raise TrainingCancelled()
+
+
+def _fine_tune(config: Dict[str, Any], output_dir: Path, reporter: _JobReporter):
+    """Fine-tuning causal LM con transformers (solo nel processo worker)"""
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    params = {**DEFAULT_TRAINING_PARAMS, **(config.get("training_params") or {})}
+    base = config["model_path"]
+    batch_size = int(params["batch_size"])
+
+    tokenizer = AutoTokenizer.from_pretrained(base)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(base)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model.to(device)
+    model.train()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=float(params["learning_rate"]))
+
+    # Tokenizzazione una sola volta per (dataset, tokenizer), poi letta via mmap
+    dataset = token_cache.get_or_build(
+        config["dataset_key"],
+        iter_training_texts(config["dataset_path"], config["dataset_type"]),
+        tokenizer
+    )
+
+    try:
+        epochs = int(params["epochs"])
+        reporter.start(epochs * math.ceil(len(dataset) / batch_size))
+
+        step = 0
+        for epoch in range(1, epochs + 1):
+            for rows in dataset.iter_batches(batch_size, int(params["max_length"]),
+                                             seed=int(params["seed"]) + epoch):
+                width = max(len(row) for row in rows)
+                input_ids = torch.full((len(rows), width), tokenizer.pad_token_id, dtype=torch.long)
+                attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+                for i, row in enumerate(rows):
+                    input_ids[i, :len(row)] = torch.tensor(row.tolist(), dtype=torch.long)
+                    attention_mask[i, :len(row)] = 1
+                labels = input_ids.masked_fill(attention_mask == 0, -100)
+
+                loss = model(
+                    input_ids=input_ids.to(device),
+                    attention_mask=attention_mask.to(device),
+                    labels=labels.to(device)
+                ).loss
+                loss.backward()
+                optimizer.step()
+                optimizer.zero_grad()
+
+                step += 1
+                reporter.step(step, epoch, loss.item())
+
+            # Checkpoint a fine epoca
+            model.save_pretrained(output_dir)
+            tokenizer.save_pretrained(output_dir)
+
+        if step:
+            reporter.step(step, epochs, loss.item(), force=True)
+
+    finally:
+        dataset.close()
+
+
+# Nel worker: evento impostato da TrainingJobEngine.shutdown()
+_stop_event = None
+
+
+def _init_worker(stop_event=None):
+    """Priorità bassa per i worker: la generazione resta reattiva"""
+    global _stop_event
+    _stop_event = stop_event
+    if WORKER_NICE and hasattr(os, "nice"):
+        os.nice(WORKER_NICE)
+    if WORKER_THREADS:
+        os.environ["OMP_NUM_THREADS"] = str(WORKER_THREADS)
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def run_training_job(db_path: str, job_id: str) -> str:
+    """Entry point del processo worker; ritorna lo stato finale del job"""
+    # Presa in carico atomica: con più processi API lo stesso job parte una volta sola
+    with get_connection(db_path) as conn:
+        claimed = conn.execute("""
+            UPDATE custom_models
+            SET training_status = 'running', worker_pid = ?,
+                training_started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE uuid = ? AND training_status = 'pending'
+        """, (os.getpid(), job_id)).rowcount
+        # Server in chiusura: il job resta 'pending' e viene riaccodato al riavvio.
+        # Il controllo sta nella transazione della presa in carico, così
+        # shutdown() trova il job già 'running' oppure mai preso
+        if claimed and _stop_event is not None and _stop_event.is_set():
+            conn.rollback()
+            return "pending"
+        row = conn.execute(
+            "SELECT training_config, cancel_requested, training_status FROM custom_models WHERE uuid = ?",
+            (job_id,)
+        ).fetchone()
+    if not claimed:
+        return row[2] if row else "failed"
+    if row[1]:
+        status, error = "cancelled", None
+    else:
+        config = json.loads(row[0])
+        output_dir = Path(config["output_dir"])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        reporter = _JobReporter(db_path, job_id, output_dir)
+        try:
+            _fine_tune(config, output_dir, reporter)
+            status, error = "completed", None
+        except TrainingCancelled:
+            status, error = "cancelled", None
+        except Exception as e:
+            status, error = "failed", str(e)
+
+    with get_connection(db_path) as conn:
+        conn.execute("""
+            UPDATE custom_models
+            SET training_status = ?, error_message = ?,
+                training_progress = CASE WHEN ? = 'completed' THEN 100 ELSE training_progress END,
+                training_completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE uuid = ?
+        """, (status, error, status, job_id))
+    return status
+
+
+class TrainingJobEngine:
+    """Esegue i job di training in un pool di processi
+
+    Il training non gira mai nel processo dell'API. I worker usano ``spawn``
+    (come il profiler dei dataset) e comunicano solo tramite SQLite, quindi
+    progresso e stop funzionano anche con più worker uvicorn.
+    """
+
+    def __init__(self, db_path: str, workers: Optional[int] = None):
+        self.db_path = os.path.abspath(db_path)
+        self.workers = workers or int(os.getenv("TRAINING_JOB_WORKERS", "1"))
+        self.output_root = Path(TRAINING_OUTPUT_DIR)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._stop_event = None
+        self._futures = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            self._stop_event = context.Event()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._stop_event,)
+            )
+        return self._executor
+
+    def output_dir(self, job_id: str) -> Path:
+        return (self.output_root / job_id).resolve()
+
+    def submit(self, job_id: str):
+        """Accoda un job già salvato in custom_models"""
+        future = self._get_executor().submit(run_training_job, self.db_path, job_id)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        logger.info(f"🎓 Job di training accodato: {job_id}")
+
+    def _on_done(self, job_id: str, future):
+        self._futures.pop(job_id, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            # Worker terminato in modo anomalo (es. OOM): il job non ha scritto lo stato finale
+            logger.error(f"❌ Worker di training terminato: {job_id}: {error}")
+            self._finish(job_id, "failed", str(error))
+        else:
+            logger.info(f"✅ Job di training {job_id}: {future.result()}")
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None):
+        with get_connection(self.db_path) as conn:
+            conn.execute("""
+                UPDATE custom_models
+                SET training_status = ?, error_message = ?,
+                    training_completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE uuid = ? AND training_status NOT IN ('completed', 'failed', 'cancelled')
+            """, (status, error, job_id))
+
+    def cancel(self, job_id: str) -> bool:
+        """Richiede lo stop del job; ritorna False se è già terminato"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.execute("""
+                UPDATE custom_models
+                SET cancel_requested = 1, updated_at = CURRENT_TIMESTAMP
+                WHERE uuid = ? AND training_status NOT IN ('completed', 'failed', 'cancelled')
+            """, (job_id,))
+            if cursor.rowcount == 0:
+                return False
+
+        # Un job ancora in coda viene tolto subito, uno in corso si ferma al prossimo report
+        future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            self._finish(job_id, "cancelled")
+        return True
+
+    def recover(self):
+        """Job rimasti aperti da un'esecuzione precedente
+
+        I job 'running' il cui processo worker non esiste più vengono
+        marcati come falliti, quelli 'pending' vengono riaccodati.
+        """
+        with get_connection(self.db_path) as conn:
+            running = conn.execute(
+                "SELECT uuid, worker_pid FROM custom_models WHERE training_status = 'running'"
+            ).fetchall()
+            pending = [row[0] for row in conn.execute(
+                "SELECT uuid FROM custom_models WHERE training_status = 'pending' ORDER BY id"
+            )]
+
+        for job_id, pid in running:
+            if not _process_alive(pid):
+                self._finish(job_id, "failed", "Interrotto dal riavvio del server")
+        for job_id in pending:
+            self.submit(job_id)
+
+    def shutdown(self):
+        """Ferma i job in corso e chiudi il pool
+        
+        I job in coda restano 'pending' nel database e recover() li riaccoda
+        al prossimo avvio; solo quelli già 'running' ricevono la richiesta di stop.
+        """
+        if self._executor is None:
+            return
+        
+        self._stop_event.set()
+        job_ids = list(self._futures)
+        for future in list(self._futures.values()):
+            future.cancel()
+        with get_connection(self.db_path) as conn:
+            conn.executemany("""
+                UPDATE custom_models
+                SET cancel_requested = 1, updated_at = CURRENT_TIMESTAMP
+                WHERE uuid = ? AND training_status = 'running'
+            """, [(job_id,) for job_id in job_ids])
+        
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
@@ -8,16 +8,39 @@ import os
 import uuid
 import json
 import csv
+import asyncio
+import hashlib
 import logging
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any, List
-import sqlite3
 from fastapi import UploadFile, HTTPException
-import pandas as pd
+
+from db_pool import get_connection
+from dataset_profiler import dataset_profiler
+from training_jobs import TrainingJobEngine
+from token_cache import token_cache
 
 logger = logging.getLogger(__name__)
 
+# Upload in blocchi di dimensione fissa: memoria O(chunk) per upload
+MAX_DATASET_SIZE = 100 * 1024 * 1024  # 100MB
+UPLOAD_CHUNK_SIZE = int(os.getenv("TRAINING_UPLOAD_CHUNK_KB", "1024")) * 1024
+
+# Parametri di training accettati dall'API: tipo e intervallo ammesso
+TRAINING_PARAM_LIMITS = {
+    "epochs": (int, 1, 100),
+    "batch_size": (int, 1, 512),
+    "max_length": (int, 1, 8192),
+    "learning_rate": (float, 1e-8, 1.0),
+    "seed": (int, 0, 2**32 - 1),
+}
+
+# Modelli base ammessi per il training (cartelle in MODEL_CACHE_DIR); vuoto = tutti i presenti
+TRAINING_BASE_MODELS = {
+    name.strip() for name in os.getenv("TRAINING_BASE_MODELS", "").split(",") if name.strip()
+}
+
 
 class TrainingService:
     """Servizio per gestire il training di modelli personalizzati"""
@@ -26,12 +49,18 @@ class TrainingService:
         self.db_path = db_path
         self.upload_dir = Path("uploads/training_data")
         self.upload_dir.mkdir(parents=True, exist_ok=True)
+        # Blob per contenuto: stessi byte = stesso file, anche tra utenti diversi
+        self.blob_dir = self.upload_dir / "blobs"
+        self.blob_dir.mkdir(exist_ok=True)
+        # Profili in background di questo processo per (content_hash, file_type)
+        self._profile_tasks: Dict[tuple, asyncio.Task] = {}
         self._init_database()
+        self.job_engine = TrainingJobEngine(db_path)
     
     def _init_database(self):
         """Inizializza le tabelle per il training"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 # Tabella per i dataset di training
@@ -50,10 +79,20 @@ class TrainingService:
                         status TEXT DEFAULT 'uploaded',
                         created_at TEXT DEFAULT CURRENT_TIMESTAMP,
                         processed_at TEXT,
+                        content_hash TEXT,
+                        line_count INTEGER,
                         FOREIGN KEY (user_id) REFERENCES users (id)
                     )
                 """)
                 
+                # Colonne aggiunte per l'upload in streaming
+                cursor.execute("PRAGMA table_info(training_datasets)")
+                columns = [column[1] for column in cursor.fetchall()]
+                if 'content_hash' not in columns:
+                    cursor.execute("ALTER TABLE training_datasets ADD COLUMN content_hash TEXT")
+                if 'line_count' not in columns:
+                    cursor.execute("ALTER TABLE training_datasets ADD COLUMN line_count INTEGER")
+                
                 # Tabella per i modelli personalizzati
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS custom_models (
@@ -76,11 +115,30 @@ class TrainingService:
                     )
                 """)
                 
+                # Colonne dei job di training (custom_models è la tabella dei job)
+                cursor.execute("PRAGMA table_info(custom_models)")
+                columns = [column[1] for column in cursor.fetchall()]
+                for column, definition in (
+                    ('current_epoch', 'INTEGER DEFAULT 0'),
+                    ('current_step', 'INTEGER DEFAULT 0'),
+                    ('total_steps', 'INTEGER DEFAULT 0'),
+                    ('cancel_requested', 'INTEGER DEFAULT 0'),
+                    ('worker_pid', 'INTEGER'),
+                    ('error_message', 'TEXT'),
+                    ('updated_at', 'TEXT')
+                ):
+                    if column not in columns:
+                        cursor.execute(f"ALTER TABLE custom_models ADD COLUMN {column} {definition}")
+                
                 # Indici per performance
                 cursor.execute("""
                     CREATE INDEX IF NOT EXISTS idx_training_datasets_user_id 
                     ON training_datasets (user_id)
                 """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_training_datasets_content_hash 
+                    ON training_datasets (content_hash, file_type)
+                """)
                 cursor.execute("""
                     CREATE INDEX IF NOT EXISTS idx_custom_models_user_id 
                     ON custom_models (user_id)
@@ -114,53 +172,84 @@ class TrainingService:
                     detail=f"Formato file non supportato. Supportati: {', '.join(allowed_extensions)}"
                 )
             
-            # Controllo dimensione file (max 100MB)
-            max_size = 100 * 1024 * 1024  # 100MB
-            content = await file.read()
-            if len(content) > max_size:
+            # Controllo dimensione dichiarata (rifiuto prima di leggere)
+            if file.size and file.size > MAX_DATASET_SIZE:
                 raise HTTPException(
                     status_code=400, 
                     detail="File troppo grande. Dimensione massima: 100MB"
                 )
             
-            # Genera UUID e percorso sicuro
+            # Genera UUID e percorso temporaneo dell'upload
             dataset_uuid = str(uuid.uuid4())
-            safe_filename = f"{dataset_uuid}_{file.filename}"
-            file_path = self.upload_dir / safe_filename
+            safe_filename = Path(file.filename).name
+            incoming_path = self.upload_dir / f".{dataset_uuid}.incoming"
             
-            # Salva il file
-            with open(file_path, 'wb') as f:
-                f.write(content)
+            # Copia su disco a blocchi con limite, hash e conteggio righe
+            ingest = await self._stream_to_disk(file, incoming_path)
+            content_hash = ingest['content_hash']
+            blob_path = self._blob_path(content_hash)
             
-            # Analizza il contenuto del file
-            analysis = await self._analyze_dataset(file_path, file_ext)
+            # Stesso contenuto e formato già caricati: riusa il profilo
+            analysis = self._find_analysis(content_hash, file_ext)
+            profile_needed = analysis is None
+            if profile_needed:
+                # Profilo rapido sulle prime righe, quello completo in background
+                analysis = self._quick_analysis(incoming_path, file_ext, ingest['line_count'])
+                analysis['status'] = 'profiling'
             
-            # Salva nel database
-            with sqlite3.connect(self.db_path) as conn:
+            # Blob e riga nella stessa transazione di scrittura (vedi delete_dataset)
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO training_datasets 
-                    (uuid, user_id, filename, original_filename, file_path, 
-                     file_size, file_type, rows_count, columns_info, status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    dataset_uuid, user_id, safe_filename, file.filename,
-                    str(file_path), len(content), file_ext,
-                    analysis['rows_count'], json.dumps(analysis['columns_info']),
-                    'uploaded'
-                ))
-                conn.commit()
+                cursor.execute("BEGIN IMMEDIATE")
+                
+                deduplicated = blob_path.exists()
+                if deduplicated:
+                    incoming_path.unlink()
+                else:
+                    blob_path.parent.mkdir(exist_ok=True)
+                    os.replace(incoming_path, blob_path)
+                
+                try:
+                    cursor.execute("""
+                        INSERT INTO training_datasets 
+                        (uuid, user_id, filename, original_filename, file_path, 
+                         file_size, file_type, rows_count, columns_info, status,
+                         content_hash, line_count, processed_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (
+                        dataset_uuid, user_id, safe_filename, file.filename,
+                        str(blob_path), ingest['file_size'], file_ext,
+                        analysis['rows_count'], json.dumps(analysis['columns_info']),
+                        analysis['status'], content_hash, ingest['line_count'],
+                        analysis.get('processed_at')
+                    ))
+                    conn.commit()
+                except Exception:
+                    # Blob appena creato senza riga che lo usi: rimuovilo finché
+                    # il lock di scrittura impedisce ad altri upload di riusarlo
+                    if not deduplicated:
+                        blob_path.unlink(missing_ok=True)
+                    raise
+            
+            if profile_needed:
+                self._start_profile(content_hash, blob_path, file_ext)
             
-            logger.info(f"✅ Dataset caricato: {file.filename} per utente {user_id}")
+            # Deduplicazione solo nei log: nella risposta rivelerebbe upload di altri utenti
+            logger.info(
+                f"✅ Dataset caricato: {file.filename} per utente {user_id}"
+                f"{' (contenuto già presente)' if deduplicated else ''}"
+            )
             
             return {
                 "dataset_id": dataset_uuid,
                 "filename": file.filename,
-                "file_size": len(content),
+                "file_size": ingest['file_size'],
                 "file_type": file_ext,
+                "content_hash": ingest['content_hash'],
+                "line_count": ingest['line_count'],
                 "rows_count": analysis['rows_count'],
                 "columns": analysis['columns_info'],
-                "status": "uploaded",
+                "status": analysis['status'],
                 "message": "Dataset caricato con successo"
             }
             
@@ -168,74 +257,145 @@ class TrainingService:
             raise
         except Exception as e:
             logger.error(f"❌ Errore upload dataset: {e}")
-            # Cleanup in caso di errore
-            if 'file_path' in locals() and file_path.exists():
-                file_path.unlink()
+            # Cleanup in caso di errore (il blob può essere condiviso e resta)
+            if 'incoming_path' in locals() and incoming_path.exists():
+                incoming_path.unlink()
             raise HTTPException(status_code=500, detail="Errore interno del server")
     
-    async def _analyze_dataset(self, file_path: Path, file_ext: str) -> Dict[str, Any]:
-        """Analizza il contenuto del dataset"""
+    async def _stream_to_disk(self, file: UploadFile, file_path: Path) -> Dict[str, Any]:
+        """Copia l'upload su disco a blocchi di UPLOAD_CHUNK_SIZE
+        
+        Il limite di dimensione viene applicato durante la copia, quindi un
+        file troppo grande viene rifiutato appena supera MAX_DATASET_SIZE.
+        Scrittura e hash avvengono in un thread per non bloccare l'event
+        loop. Il file compare con il nome finale solo a copia completata.
+        """
+        part_path = file_path.with_name(file_path.name + ".part")
+        hasher = hashlib.sha256()
+        file_size = 0
+        line_count = 0
+        last_byte = b""
+        
         try:
-            if file_ext == '.csv':
-                df = pd.read_csv(file_path)
-                return {
-                    'rows_count': len(df),
-                    'columns_info': {
-                        'columns': list(df.columns),
-                        'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
-                        'sample_data': df.head(3).to_dict('records')
-                    }
-                }
-            
-            elif file_ext in ['.jsonl', '.json']:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    if file_ext == '.jsonl':
-                        lines = f.readlines()
-                        data = [json.loads(line.strip()) for line in lines if line.strip()]
-                    else:
-                        data = json.load(f)
-                        if not isinstance(data, list):
-                            data = [data]
-                
-                if data:
-                    sample_keys = set()
-                    for item in data[:10]:  # Analizza i primi 10 elementi
-                        if isinstance(item, dict):
-                            sample_keys.update(item.keys())
+            with open(part_path, 'wb') as out:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
                     
-                    return {
-                        'rows_count': len(data),
-                        'columns_info': {
-                            'keys': list(sample_keys),
-                            'sample_data': data[:3]
-                        }
-                    }
-                else:
-                    return {'rows_count': 0, 'columns_info': {}}
+                    file_size += len(chunk)
+                    if file_size > MAX_DATASET_SIZE:
+                        raise HTTPException(
+                            status_code=400, 
+                            detail="File troppo grande. Dimensione massima: 100MB"
+                        )
+                    
+                    line_count += await asyncio.to_thread(self._write_chunk, out, hasher, chunk)
+                    last_byte = chunk[-1:]
             
-            elif file_ext == '.txt':
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                
-                return {
-                    'rows_count': len(lines),
-                    'columns_info': {
-                        'type': 'text',
-                        'sample_lines': lines[:3]
-                    }
-                }
+            # Ultima riga senza newline finale
+            if file_size and last_byte != b"\n":
+                line_count += 1
             
-            else:
-                return {'rows_count': 0, 'columns_info': {}}
-                
+            os.replace(part_path, file_path)
+            
+        except BaseException:
+            if part_path.exists():
+                part_path.unlink()
+            raise
+        
+        return {
+            'file_size': file_size,
+            'content_hash': hasher.hexdigest(),
+            'line_count': line_count
+        }
+    
+    @staticmethod
+    def _write_chunk(out, hasher, chunk: bytes) -> int:
+        """Scrive un blocco, aggiorna l'hash e ritorna i newline contenuti"""
+        out.write(chunk)
+        hasher.update(chunk)
+        return chunk.count(b"\n")
+    
+    def _blob_path(self, content_hash: str) -> Path:
+        return self.blob_dir / content_hash[:2] / content_hash
+    
+    @staticmethod
+    def dataset_key(content_hash: Optional[str], file_type: str, dataset_uuid: str) -> str:
+        """Chiave delle cache derivate (token): contenuto + formato"""
+        if not content_hash:
+            return dataset_uuid  # dataset caricati prima dello storage per contenuto
+        return f"{content_hash}-{file_type.lstrip('.')}"
+    
+    def _find_analysis(self, content_hash: str, file_ext: str) -> Optional[Dict[str, Any]]:
+        """Profilo di un dataset con stesso contenuto e formato, se esiste
+
+        Si riusano solo profili completi, oppure uno ancora in corso in
+        questo processo: il nuovo dataset resta in 'profiling' e viene
+        aggiornato insieme all'altro. Un 'profiling' senza task attivo
+        (processo terminato) non viene ereditato.
+        """
+        statuses = ('uploaded', 'profiling') if (content_hash, file_ext) in self._profile_tasks else ('uploaded',)
+        with get_connection(self.db_path) as conn:
+            row = conn.execute(f"""
+                SELECT rows_count, columns_info, status, processed_at FROM training_datasets 
+                WHERE content_hash = ? AND file_type = ?
+                  AND status IN ({', '.join('?' * len(statuses))})
+                ORDER BY status = 'uploaded' DESC LIMIT 1
+            """, (content_hash, file_ext, *statuses)).fetchone()
+        if row is None:
+            return None
+        return {
+            'rows_count': row[0],
+            'columns_info': json.loads(row[1]) if row[1] else {},
+            'status': row[2],
+            'processed_at': row[3]
+        }
+    
+    def _quick_analysis(self, file_path: Path, file_ext: str, line_count: int) -> Dict[str, Any]:
+        """Schema dalle prime righe e numero di righe stimato dall'ingest"""
+        analysis = dataset_profiler.quick_profile(str(file_path), file_ext)
+        
+        # Stima: una riga per linea (header escluso nei CSV)
+        if file_ext == '.csv':
+            analysis['rows_count'] = max(line_count - 1, 0)
+        elif file_ext in ('.jsonl', '.txt'):
+            analysis['rows_count'] = line_count
+        
+        return analysis
+    
+    async def _analyze_dataset(self, content_hash: str, file_path: Path, file_ext: str):
+        """Profilo completo del dataset nel processo worker, salvato a fine analisi
+
+        Aggiorna tutti i dataset con lo stesso contenuto e formato ancora in
+        'profiling', compresi quelli caricati durante l'analisi.
+        """
+        try:
+            analysis = await dataset_profiler.profile(str(file_path), file_ext)
         except Exception as e:
             logger.error(f"❌ Errore analisi dataset: {e}")
-            return {'rows_count': 0, 'columns_info': {'error': str(e)}}
+            analysis = {'rows_count': 0, 'columns_info': {'error': str(e)}}
+        
+        try:
+            with get_connection(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE training_datasets 
+                    SET rows_count = ?, columns_info = ?, status = 'uploaded',
+                        processed_at = CURRENT_TIMESTAMP
+                    WHERE content_hash = ? AND file_type = ? AND status = 'profiling'
+                """, (analysis['rows_count'], json.dumps(analysis['columns_info']), content_hash, file_ext))
+                conn.commit()
+            
+            logger.info(f"📊 Profilo dataset completato: {content_hash[:12]} ({analysis['rows_count']} righe)")
+            
+        except Exception as e:
+            logger.error(f"❌ Errore salvataggio profilo dataset: {e}")
     
     def get_user_datasets(self, user_id: int) -> List[Dict[str, Any]]:
         """Ottieni tutti i dataset di un utente"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT uuid, original_filename, file_size, file_type, 
@@ -264,22 +424,39 @@ class TrainingService:
             return []
     
     def delete_dataset(self, dataset_id: str, user_id: int) -> bool:
-        """Elimina un dataset"""
+        """Elimina un dataset
+        
+        Le righe di training_datasets sono i riferimenti al blob: il file
+        e le cache derivate vengono eliminati solo con l'ultimo riferimento.
+        Un dataset usato da job in coda o in corso non viene eliminato (409).
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_connection(self.db_path) as conn:
                 cursor = conn.cursor()
+                # Lock di scrittura: nessun upload dello stesso blob nel frattempo
+                cursor.execute("BEGIN IMMEDIATE")
                 
                 # Verifica proprietà
                 cursor.execute("""
-                    SELECT file_path FROM training_datasets 
+                    SELECT id, file_path, content_hash, file_type FROM training_datasets 
                     WHERE uuid = ? AND user_id = ?
                 """, (dataset_id, user_id))
                 
                 result = cursor.fetchone()
                 if not result:
+                    conn.rollback()
                     return False
                 
-                file_path = Path(result[0])
+                row_id, file_path, content_hash, file_type = result[0], Path(result[1]), result[2], result[3]
+                
+                # Un job in coda leggerebbe un file già eliminato
+                cursor.execute("""
+                    SELECT COUNT(*) FROM custom_models
+                    WHERE dataset_id = ? AND training_status IN ('pending', 'running')
+                """, (row_id,))
+                if cursor.fetchone()[0]:
+                    conn.rollback()
+                    raise HTTPException(status_code=409, detail="Dataset in uso da un training in corso")
                 
                 # Elimina dal database
                 cursor.execute("""
@@ -287,18 +464,213 @@ class TrainingService:
                     WHERE uuid = ? AND user_id = ?
                 """, (dataset_id, user_id))
                 
-                # Elimina il file
-                if file_path.exists():
+                # Riferimenti rimasti: blob e cache tokenizzate
+                cursor.execute("""
+                    SELECT COUNT(*), COALESCE(SUM(file_type = ?), 0) FROM training_datasets 
+                    WHERE content_hash = ? AND file_path = ?
+                """, (file_type, content_hash, str(file_path)))
+                blob_refs, format_refs = cursor.fetchone()
+                
+                if not blob_refs and file_path.exists():
                     file_path.unlink()
+                if not format_refs:
+                    token_cache.remove(self.dataset_key(content_hash, file_type, dataset_id))
                 
                 conn.commit()
                 logger.info(f"✅ Dataset eliminato: {dataset_id}")
                 return True
                 
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"❌ Errore eliminazione dataset: {e}")
             return False
 
+    async def dataset_exists(self, dataset_name: str, user_id: int) -> bool:
+        """Verifica che il dataset (uuid o nome file) appartenga all'utente"""
+        return self._find_dataset(dataset_name, user_id) is not None
+    
+    def _find_dataset(self, dataset_name: str, user_id: int) -> Optional[tuple]:
+        with get_connection(self.db_path) as conn:
+            return conn.execute("""
+                SELECT id, file_path, file_type, uuid, content_hash FROM training_datasets 
+                WHERE user_id = ? AND (uuid = ? OR original_filename = ?)
+                ORDER BY created_at DESC LIMIT 1
+            """, (user_id, dataset_name, dataset_name)).fetchone()
+    
+    @staticmethod
+    def _resolve_base_model(model_base: str) -> Path:
+        """Cartella del modello base in MODEL_CACHE_DIR, solo tra quelli ammessi
+        
+        Niente percorsi né id Hugging Face: il worker non deve leggere file
+        arbitrari né scaricare modelli scelti dall'utente.
+        """
+        if not model_base or model_base in (".", "..") or "/" in model_base or "\\" in model_base:
+            raise HTTPException(status_code=400, detail="Modello base non valido")
+        
+        model_path = Path(os.getenv("MODEL_CACHE_DIR", "../models")).resolve() / model_base
+        if ((TRAINING_BASE_MODELS and model_base not in TRAINING_BASE_MODELS)
+                or not (model_path / "config.json").is_file()):
+            raise HTTPException(status_code=400, detail=f"Modello base non disponibile: {model_base}")
+        return model_path
+    
+    @staticmethod
+    def _validate_training_params(training_params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Controlla i parametri prima di accodare il job (400 se non validi)"""
+        params = dict(training_params or {})
+        for name, (kind, low, high) in TRAINING_PARAM_LIMITS.items():
+            if name not in params:
+                continue
+            value = params[name]
+            valid_type = (int,) if kind is int else (int, float)
+            if isinstance(value, bool) or not isinstance(value, valid_type) or not low <= value <= high:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Parametro {name} non valido: atteso {kind.__name__} tra {low} e {high}"
+                )
+        return params
+    
+    async def start_training(
+        self,
+        dataset_name: str,
+        model_base: str,
+        training_params: Optional[Dict[str, Any]],
+        description: Optional[str],
+        user_id: int
+    ) -> str:
+        """Crea il job di training e lo accoda nel pool di processi"""
+        dataset = self._find_dataset(dataset_name, user_id)
+        if dataset is None:
+            raise HTTPException(status_code=404, detail="Dataset non trovato")
+        
+        model_path = self._resolve_base_model(model_base)
+        training_params = self._validate_training_params(training_params)
+        job_id = str(uuid.uuid4())
+        
+        config = {
+            'model_base': model_base,
+            'model_path': str(model_path),
+            'training_params': training_params,
+            'dataset_key': self.dataset_key(dataset[4], dataset[2], dataset[3]),
+            'dataset_path': str(Path(dataset[1]).resolve()),
+            'dataset_type': dataset[2],
+            'output_dir': str(self.job_engine.output_dir(job_id))
+        }
+        
+        with get_connection(self.db_path) as conn:
+            # Solo se il dataset esiste ancora: delete_dataset non può
+            # eliminarlo tra la ricerca e l'inserimento del job
+            inserted = conn.execute("""
+                INSERT INTO custom_models 
+                (uuid, user_id, dataset_id, model_name, training_status,
+                 model_path, training_config, updated_at)
+                SELECT ?, ?, id, ?, 'pending', ?, ?, CURRENT_TIMESTAMP
+                FROM training_datasets WHERE id = ?
+            """, (
+                job_id, user_id, description or f"{model_base}-custom",
+                config['output_dir'], json.dumps(config), dataset[0]
+            )).rowcount
+        if not inserted:
+            raise HTTPException(status_code=404, detail="Dataset non trovato")
+        
+        self.job_engine.submit(job_id)
+        logger.info(f"🎓 Training avviato: {job_id} per utente {user_id}")
+        return job_id
+    
+    async def get_training_status(self, job_id: str) -> Dict[str, Any]:
+        """Stato corrente del job letto da SQLite"""
+        with get_connection(self.db_path) as conn:
+            row = conn.execute("""
+                SELECT uuid, model_name, training_status, training_progress,
+                       current_epoch, current_step, total_steps, performance_metrics,
+                       error_message, created_at, training_started_at,
+                       training_completed_at, cancel_requested
+                FROM custom_models WHERE uuid = ?
+            """, (job_id,)).fetchone()
+        
+        if row is None:
+            raise HTTPException(status_code=404, detail="Job non trovato")
+        return self._job_to_dict(row)
+    
+    @staticmethod
+    def _job_to_dict(row) -> Dict[str, Any]:
+        return {
+            'job_id': row[0],
+            'model_name': row[1],
+            'status': 'stopping' if row[12] and row[2] == 'running' else row[2],
+            'progress': row[3] or 0,
+            'current_epoch': row[4] or 0,
+            'current_step': row[5] or 0,
+            'total_steps': row[6] or 0,
+            'metrics': json.loads(row[7]) if row[7] else {},
+            'error': row[8],
+            'created_at': row[9],
+            'started_at': row[10],
+            'completed_at': row[11]
+        }
+    
+    async def stop_training(self, job_id: str) -> bool:
+        """Richiede lo stop cooperativo del job"""
+        return self.job_engine.cancel(job_id)
+    
+    async def user_owns_job(self, job_id: str, user_id: int) -> bool:
+        with get_connection(self.db_path) as conn:
+            return conn.execute(
+                "SELECT 1 FROM custom_models WHERE uuid = ? AND user_id = ?",
+                (job_id, user_id)
+            ).fetchone() is not None
+    
+    async def get_user_jobs(self, user_id: int, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """Job di training dell'utente, dal più recente"""
+        with get_connection(self.db_path) as conn:
+            rows = conn.execute("""
+                SELECT uuid, model_name, training_status, training_progress,
+                       current_epoch, current_step, total_steps, performance_metrics,
+                       error_message, created_at, training_started_at,
+                       training_completed_at, cancel_requested
+                FROM custom_models WHERE user_id = ?
+                ORDER BY id DESC LIMIT ? OFFSET ?
+            """, (user_id, limit, offset)).fetchall()
+        return [self._job_to_dict(row) for row in rows]
+    
+    def _start_profile(self, content_hash: str, file_path: Path, file_ext: str):
+        """Avvia il profilo completo in background (uno per contenuto e formato)"""
+        key = (content_hash, file_ext)
+        if key in self._profile_tasks:
+            return
+        task = asyncio.create_task(self._analyze_dataset(content_hash, file_path, file_ext))
+        self._profile_tasks[key] = task
+        task.add_done_callback(lambda _: self._profile_tasks.pop(key, None))
+    
+    def recover_jobs(self):
+        """Riaccoda i job rimasti in sospeso dall'avvio precedente"""
+        self.job_engine.recover()
+    
+    def recover_profiles(self):
+        """Riavvia i profili interrotti (dataset rimasti in 'profiling')
+
+        Va chiamato con l'event loop attivo (lifespan). Un profilo per
+        contenuto e formato: aggiorna tutte le righe corrispondenti.
+        """
+        with get_connection(self.db_path) as conn:
+            pending = conn.execute("""
+                SELECT content_hash, file_type, MIN(file_path) FROM training_datasets 
+                WHERE status = 'profiling' AND content_hash IS NOT NULL
+                GROUP BY content_hash, file_type
+            """).fetchall()
+        
+        for content_hash, file_ext, file_path in pending:
+            self._start_profile(content_hash, Path(file_path), file_ext)
+        if pending:
+            logger.info(f"📊 Profili dataset riavviati: {len(pending)}")
+    
+    def shutdown(self):
+        """Ferma profili e job di training (profili e job in coda ripartono al riavvio)"""
+        for task in list(self._profile_tasks.values()):
+            task.cancel()
+        dataset_profiler.shutdown()
+        self.job_engine.shutdown()
+
 
 # Istanza globale del servizio
 training_service = TrainingService()
\ No newline at end of file
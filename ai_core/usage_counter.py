@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Creative Muse AI - Usage Counter
+Contatori di utilizzo giornalieri/mensili in memoria con scrittura
+differita su user_usage e write-ahead file per non perdere incrementi.
+"""
+
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+class UsageAggregator:
+    """Aggregatore write-behind per user_usage
+
+    Ogni incremento viene prima aggiunto al WAL del processo (una riga JSON
+    con numero di sequenza) e poi ai contatori in memoria; un thread in
+    background scrive gli incrementi accumulati su SQLite in un'unica
+    transazione, insieme all'ultima sequenza applicata. All'avvio i WAL
+    di processi terminati (file non più bloccati con flock) vengono
+    riapplicati saltando le sequenze già scritte, quindi nessun incremento
+    viene perso o contato due volte.
+
+    I totali letti da SQLite vengono ricaricati dopo ``refresh_seconds``,
+    così gli incrementi degli altri worker diventano visibili.
+    """
+
+    def __init__(self, db_path: str, wal_dir: Optional[str] = None,
+                 flush_interval: Optional[float] = None,
+                 refresh_seconds: Optional[float] = None,
+                 fsync: Optional[bool] = None):
+        self.db_path = db_path
+        self.wal_dir = wal_dir or os.getenv(
+            "USAGE_WAL_DIR", os.path.join(os.path.dirname(db_path) or ".", "usage_wal")
+        )
+        self.flush_interval = flush_interval or float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "5"))
+        self.refresh_seconds = refresh_seconds or float(os.getenv("USAGE_REFRESH_SECONDS", "30"))
+        if fsync is None:
+            fsync = os.getenv("USAGE_WAL_FSYNC", "true").lower() == "true"
+        self.fsync = fsync
+
+        # (user_id, "YYYY-MM") -> (caricato_at, {giorno: conteggio})
+        self._months: Dict[Tuple[str, str], Tuple[float, Dict[str, int]]] = {}
+        # (user_id, giorno) -> incrementi non ancora scritti
+        self._pending: Dict[Tuple[str, str], int] = {}
+        self._seq = 0
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._wal = None
+        self._wal_name = None
+        self.stats = {"increments": 0, "flushes": 0, "replayed": 0}
+
+        try:
+            os.makedirs(self.wal_dir, exist_ok=True)
+            self._init_table()
+            self._replay_orphaned_wals()
+        except Exception as e:
+            logger.error(f"❌ Errore recupero usage WAL: {e}")
+
+        # Separato dal recupero: senza WAL gli incrementi non sarebbero protetti
+        try:
+            self._open_wal()
+        except Exception as e:
+            logger.error(f"❌ Errore apertura usage WAL: {e}")
+
+        self._flush_thread = threading.Thread(
+            target=self._flush_worker, daemon=True, name="UsageFlush"
+        )
+        self._flush_thread.start()
+
+    def _init_table(self):
+        with get_connection(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage_wal_state (
+                    wal_name TEXT PRIMARY KEY,
+                    last_seq INTEGER NOT NULL
+                )
+            """)
+
+    # ------------------------------------------------------------------
+    # WAL
+    # ------------------------------------------------------------------
+
+    def _open_wal(self):
+        """Crea il WAL del processo, bloccato finché il processo è vivo"""
+        self._wal_name = f"usage-{os.getpid()}.wal"
+        self._wal = open(os.path.join(self.wal_dir, self._wal_name), "a")
+        fcntl.flock(self._wal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _replay_orphaned_wals(self):
+        """Applica i WAL lasciati da processi terminati"""
+        for name in sorted(os.listdir(self.wal_dir)):
+            if not name.endswith(".wal"):
+                continue
+
+            path = os.path.join(self.wal_dir, name)
+            try:
+                wal = open(path, "r+")
+            except FileNotFoundError:
+                continue  # Già recuperato da un altro worker
+            with wal:
+                try:
+                    fcntl.flock(wal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Processo ancora attivo
+                if os.fstat(wal.fileno()).st_nlink == 0:
+                    continue  # Recuperato e rimosso mentre aspettavamo il lock
+
+                increments: Dict[Tuple[str, str], int] = {}
+                max_seq = 0
+                with get_connection(self.db_path) as conn:
+                    row = conn.execute(
+                        "SELECT last_seq FROM usage_wal_state WHERE wal_name = ?", (name,)
+                    ).fetchone()
+                    last_seq = row[0] if row else 0
+
+                for line in wal:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # Riga troncata dal crash
+                    if record["s"] <= last_seq:
+                        continue
+                    key = (record["u"], record["d"])
+                    increments[key] = increments.get(key, 0) + record["n"]
+                    max_seq = max(max_seq, record["s"])
+
+                if increments:
+                    self._write(increments, name, max_seq)
+                    self.stats["replayed"] += sum(increments.values())
+                    logger.warning(f"⚠️ Usage WAL {name}: {sum(increments.values())} incrementi recuperati")
+
+                # Prima il file (reso durevole), poi lo stato: al contrario un crash
+                # in mezzo lascerebbe il WAL senza last_seq e lo riapplicherebbe
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                self._fsync_wal_dir()
+                with get_connection(self.db_path) as conn:
+                    conn.execute("DELETE FROM usage_wal_state WHERE wal_name = ?", (name,))
+
+        # Stato di WAL già rimossi (crash dopo l'unlink): un processo con lo
+        # stesso pid riparte da seq 1 e non deve trovare un last_seq vecchio
+        with get_connection(self.db_path) as conn:
+            stale = [
+                (name,) for (name,) in conn.execute("SELECT wal_name FROM usage_wal_state").fetchall()
+                if not os.path.exists(os.path.join(self.wal_dir, name))
+            ]
+            conn.executemany("DELETE FROM usage_wal_state WHERE wal_name = ?", stale)
+
+    def _fsync_wal_dir(self):
+        dir_fd = os.open(self.wal_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _append_wal(self, user_id: str, day: str, count: int) -> int:
+        self._seq += 1
+        if self._wal:
+            self._wal.write(json.dumps({"s": self._seq, "u": user_id, "d": day, "n": count}) + "\n")
+            self._wal.flush()
+            if self.fsync:
+                os.fsync(self._wal.fileno())
+        return self._seq
+
+    # ------------------------------------------------------------------
+    # Contatori
+    # ------------------------------------------------------------------
+
+    def _load_month(self, user_id: str, month: str) -> Dict[str, int]:
+        """Totali del mese da SQLite più gli incrementi non ancora scritti"""
+        days: Dict[str, int] = {}
+        with get_connection(self.db_path) as conn:
+            cursor = conn.execute("""
+                SELECT date, ideas_generated FROM user_usage
+                WHERE user_id = ? AND date >= ? AND date < ?
+            """, (user_id, f"{month}-01", f"{month}-32"))
+            for day, count in cursor.fetchall():
+                days[str(day)] = count or 0
+
+        for (pending_user, day), count in self._pending.items():
+            if pending_user == user_id and day.startswith(month):
+                days[day] = days.get(day, 0) + count
+
+        self._months[(user_id, month)] = (time.monotonic(), days)
+        return days
+
+    def _month(self, user_id: str, month: str) -> Dict[str, int]:
+        entry = self._months.get((user_id, month))
+        if entry is None or time.monotonic() - entry[0] > self.refresh_seconds:
+            return self._load_month(user_id, month)
+        return entry[1]
+
+    def increment(self, user_id, count: int = 1, day: Optional[date] = None):
+        """Registra ``count`` idee generate per l'utente"""
+        user_id = str(user_id)
+        day = (day or date.today()).isoformat()
+
+        with self._lock:
+            self._append_wal(user_id, day, count)
+            key = (user_id, day)
+            self._pending[key] = self._pending.get(key, 0) + count
+
+            entry = self._months.get((user_id, day[:7]))
+            if entry is not None:
+                entry[1][day] = entry[1].get(day, 0) + count
+
+            self.stats["increments"] += count
+
+    def get_usage(self, user_id, day: Optional[date] = None) -> Tuple[int, int]:
+        """Ritorna (uso giornaliero, uso mensile)"""
+        user_id = str(user_id)
+        day = (day or date.today()).isoformat()
+
+        with self._lock:
+            days = self._month(user_id, day[:7])
+            return days.get(day, 0), sum(days.values())
+
+    # ------------------------------------------------------------------
+    # Flush
+    # ------------------------------------------------------------------
+
+    def _write(self, increments: Dict[Tuple[str, str], int], wal_name: str, seq: int):
+        """Scrive incrementi e sequenza in un'unica transazione"""
+        with get_connection(self.db_path) as conn:
+            conn.executemany("""
+                INSERT INTO user_usage (user_id, date, ideas_generated)
+                VALUES (?, ?, ?)
+                ON CONFLICT(user_id, date) DO UPDATE SET
+                    ideas_generated = ideas_generated + excluded.ideas_generated,
+                    updated_at = CURRENT_TIMESTAMP
+            """, [(user_id, day, count) for (user_id, day), count in increments.items()])
+            conn.execute("""
+                INSERT OR REPLACE INTO usage_wal_state (wal_name, last_seq) VALUES (?, ?)
+            """, (wal_name, seq))
+
+    def flush(self):
+        """Scrive su user_usage gli incrementi in sospeso"""
+        with self._lock:
+            if not self._pending:
+                return
+
+            try:
+                self._write(self._pending, self._wal_name, self._seq)
+            except Exception as e:
+                logger.error(f"❌ Errore flush usage ({len(self._pending)} righe): {e}")
+                return
+
+            self._pending = {}
+            self.stats["flushes"] += 1
+
+            # Tutto applicato: il WAL può ripartire vuoto
+            if self._wal:
+                self._wal.truncate(0)
+                self._wal.seek(0)
+
+    def _flush_worker(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {**self.stats, "pending": sum(self._pending.values()), "cached_months": len(self._months)}
+
+    def close(self):
+        """Flush finale; il WAL viene rimosso solo se tutto è stato scritto"""
+        self._stop_event.set()
+        self.flush()
+
+        with self._lock:
+            if self._wal:
+                path = self._wal.name
+                self._wal.close()
+                self._wal = None
+                if not self._pending:
+                    os.unlink(path)
+                    self._fsync_wal_dir()
+                    with get_connection(self.db_path) as conn:
+                        conn.execute("DELETE FROM usage_wal_state WHERE wal_name = ?", (self._wal_name,))